@@ -11,8 +11,9 @@ from shiny import App, ui, render, reactive, types, req, module
 # App Specific Code
 import orm # database models
 from database import DatabaseSession, DatabaseModel
-from data_processing import ArtistInputTableModel, StyleInputTableModel, SongInputTableModel, ArrangementInputTableModel, SessionInputTableModel, StringSetInputTableModel, ArrangementGoalInputTableModel, GuitarInputTableModel # contains processed data payloads for each modular table in this app (use data_processing.shiny_data_payload dictionary)
+from data_processing import ArtistInputTableModel, StyleInputTableModel, SongInputTableModel, ArrangementInputTableModel, SessionInputTableModel, StringSetInputTableModel, ArrangementGoalInputTableModel, GuitarInputTableModel, RefreshGraph # contains processed data payloads for each modular table in this app (use data_processing.shiny_data_payload dictionary)
 from table_navigator import ShinyFormTemplate
+from write_journal import WriteJournal
 
 #logging.basicConfig(filename='myapp.log', level=logging.INFO)
 
@@ -39,6 +40,17 @@ string_set_model = DatabaseModel(orm.tbl_string_set, pg_session)
 arrangement_goal_model = DatabaseModel(orm.tbl_arrangement_goals, pg_session)
 guitar_model = DatabaseModel(orm.tbl_guitar, pg_session)
 
+db_models = {model.name:db_model for model, db_model in [(orm.tbl_artist, artist_model), (orm.tbl_style, style_model), (orm.tbl_song, song_model), (orm.tbl_arrangement, arrangement_model), (orm.tbl_practice_session, session_model), (orm.tbl_string_set, string_set_model), (orm.tbl_arrangement_goals, arrangement_goal_model), (orm.tbl_guitar, guitar_model)]}
+
+# Writes to the live database go through a local journal flushed in the background (see write_journal.py).  Set write_journal='off' in variables.env to write directly.
+write_journal = None
+if os.getenv("pg_host") and os.getenv("write_journal", "on")!='off':
+    write_journal = WriteJournal()
+    for model in db_models.values():
+        model.useJournal(write_journal)
+# seqs of the set aside writes whose effect on df_raw has been undone by a re-read
+reloaded_failed_writes = set(write_journal.failed()['seq']) if write_journal else set()
+
 # Establish schema specific table models (tying together their lookups)
 
 string_set_input_table_model = StringSetInputTableModel(namespace_id = 'string_set',
@@ -65,7 +77,8 @@ arrangement_input_table_model = ArrangementInputTableModel(namespace_id = 'arran
                                             db_table_model=arrangement_model,
                                             db_song_model=song_model, # required lookup
                                             db_artist_model=artist_model, #required lookup
-                                            db_style_model=style_model) #required lookup
+                                            db_style_model=style_model, #required lookup
+                                            db_session_model=session_model) # sessions whose stages follow the arrangement's milestone dates
 
 arrangement_goal_input_table_model = ArrangementGoalInputTableModel(namespace_id='arrangement_goal',
                                                       title="Arrangement Goals", 
@@ -87,6 +100,8 @@ session_input_table_model = SessionInputTableModel(namespace_id = 'session',
                                             db_artist_model=artist_model, # required lookup
                                             db_guitar_model=guitar_model) # required lookup
 
+# After a write, recompute only the summaries and lookups built from the written table, in dependency order (the graph follows the lookups passed in above)
+refresh_graph = RefreshGraph([string_set_input_table_model, artist_input_table_model, style_input_table_model, song_input_table_model, arrangement_input_table_model, arrangement_goal_input_table_model, guitar_input_table_model, session_input_table_model])
 
 # Initialize table navigator form
 string_set_form_template = ShinyFormTemplate('string_set',string_set_input_table_model)
@@ -94,7 +109,7 @@ artist_form_template = ShinyFormTemplate('artist',artist_input_table_model)
 style_form_template = ShinyFormTemplate('style',style_input_table_model)
 song_form_template = ShinyFormTemplate('song',song_input_table_model)
 arrangement_form_template = ShinyFormTemplate('arrangement',arrangement_input_table_model)
-session_form_template = ShinyFormTemplate('session',session_input_table_model)
+session_form_template = ShinyFormTemplate('session',session_input_table_model, page_size=100) # sessions run into the tens of thousands, so only a page at a time is sent
 arrangement_goal_form_template = ShinyFormTemplate('arrangement_goal', arrangement_goal_input_table_model)
 guitar_form_template = ShinyFormTemplate('guitar',guitar_input_table_model)
 
@@ -119,13 +134,74 @@ def dynamic_app_title(read_only_acct):
     else:
         return "Guitar Study Tracker"
 
+def failed_writes_ui():
+    return ui.row(
+        ui.div("Writes the database refused.  They have been set aside so the writes made after them could be saved."),
+        ui.row(ui.column(6, ui.input_action_button("btn_retry_failed", "Retry Selected", width="100%")),
+               ui.column(6, ui.input_action_button("btn_discard_failed", "Discard Selected", width="100%"))),
+        ui.output_data_frame("failed_writes_table"),
+    )
+
 def server(input, output, session):
     
     connected_to_db = reactive.value(False)
+    notified_failed_writes = set(reloaded_failed_writes) # set aside writes this session has been told about
+
+    ## Writes the write journal set aside (see write_journal.py)
+    @reactive.poll(lambda: write_journal.failedVersion() if write_journal else None, 5)
+    def df_failed_writes():
+        return write_journal.failed() if write_journal else pd.DataFrame(columns=['seq', 'table_name'])
+
+    ## Flushed inserts get their generated ids in df_raw on the flusher thread, so the summaries showing their temporary ids are recomputed here
+    @reactive.poll(lambda: write_journal.idMapVersion() if write_journal else None, 2)
+    def reconciled_models():
+        return write_journal.takeReconciled() if write_journal else []
+
+    @reactive.effect
+    def refreshReconciled():
+        for db_model in reconciled_models():
+            refresh_graph.refresh(db_model)
+
+    async def reloadTables(table_names):
+        # re-read the tables so df_raw matches what the database and the journal hold, then refresh their summaries
+        for table_name in set(table_names):
+            await db_models[table_name].readAsync()
+            refresh_graph.refresh(db_models[table_name])
+
+    @reactive.effect
+    async def handleFailedWrites():
+        req(connected_to_db())
+        df_failed = df_failed_writes()
+        df_new = df_failed[~df_failed['seq'].isin(notified_failed_writes)]
+        req(not df_new.empty)
+        notified_failed_writes.update(df_new['seq'])
+        ui.notification_show(f"{df_new.shape[0]} change(s) couldn't be saved to the database: {df_new['last_error'].iloc[-1]}  See the Failed Writes tab.", type="error", duration=None)
+        df_reload = df_new[~df_new['seq'].isin(reloaded_failed_writes)]
+        reloaded_failed_writes.update(df_reload['seq']) # other sessions don't re-read the same writes
+        await reloadTables(df_reload['table_name'])
+
+    @render.data_frame
+    def failed_writes_table():
+        return render.DataGrid(df_failed_writes(), width="100%", selection_mode="rows")
+
+    @reactive.effect
+    @reactive.event(input.btn_retry_failed)
+    async def triggerRetryFailed():
+        df_selected = failed_writes_table.data_view(selected=True)
+        req(not df_selected.empty)
+        write_journal.retryFailed(df_selected['seq'].tolist())
+        await reloadTables(df_selected['table_name']) # read() lays the pending writes over df_raw again
+
+    @reactive.effect
+    @reactive.event(input.btn_discard_failed)
+    def triggerDiscardFailed():
+        df_selected = failed_writes_table.data_view(selected=True)
+        req(not df_selected.empty)
+        write_journal.discardFailed(df_selected['seq'].tolist())
 
     @reactive.effect
     @reactive.event(input.btn_login, ignore_none=True, ignore_init=True)
-    def btnLogin():
+    async def btnLogin():
              
         with reactive.isolate():
             user_name=input.user()
@@ -137,15 +213,17 @@ def server(input, output, session):
                 pw = os.getenv('pg_pw')
                 read_only_acct=True
 
-        # connect to database
-        string_set_model.connect(user_name, pw, read_only_acct)
-        artist_model.connect(user_name, pw, read_only_acct)
-        style_model.connect(user_name, pw, read_only_acct)
-        song_model.connect(user_name, pw, read_only_acct)
-        arrangement_model.connect(user_name, pw, read_only_acct)
-        session_model.connect(user_name, pw, read_only_acct)
-        arrangement_goal_model.connect(user_name, pw, read_only_acct)
-        guitar_model.connect(user_name, pw, read_only_acct)
+        # connect to database (each table is read on a worker thread, so other sessions keep running meanwhile)
+        await string_set_model.connectAsync(user_name, pw, read_only_acct)
+        await artist_model.connectAsync(user_name, pw, read_only_acct)
+        await style_model.connectAsync(user_name, pw, read_only_acct)
+        await song_model.connectAsync(user_name, pw, read_only_acct)
+        await arrangement_model.connectAsync(user_name, pw, read_only_acct)
+        await session_model.connectAsync(user_name, pw, read_only_acct)
+        await arrangement_goal_model.connectAsync(user_name, pw, read_only_acct)
+        await guitar_model.connectAsync(user_name, pw, read_only_acct)
+        if write_journal and not read_only_acct:
+            write_journal.start(pg_session)
 
         # begin data processing in artist table navigator
         string_set_input_table_model.processData()
@@ -198,6 +276,10 @@ def server(input, output, session):
                     string_set_form_template.ui_call(),
                 ),               
 
+                *([ui.nav_panel("Failed Writes",
+                    failed_writes_ui(),
+                )] if write_journal and not read_only_acct else []),
+
                 title=dynamic_app_title(read_only_acct),
                 id="page",
             ),
@@ -4,6 +4,7 @@ import pandas as pd
 import numpy as np
 import math
 from abc import ABC, abstractmethod
+from graphlib import TopologicalSorter
 from shiny import ui, module, render, reactive, req
 
 import database
@@ -11,6 +12,129 @@ import database
 def default_func():
     pass
 
+def classifyStages(session_dates, df_milestones):
+    """
+    Classifies sessions into the stage of progress their arrangement was in on the session date.  session_dates and df_milestones (off_book_date, at_tempo_date, play_ready_date) are aligned row by row, and a missing milestone counts as not reached yet.
+    Stage boundaries:
+        session before off_book_date (or none)                          -> "Learning Notes"
+        on/after off_book_date, before at_tempo_date (or none)          -> "Achieving Tempo"
+        on/after at_tempo_date, before play_ready_date (or none)        -> "Phrasing"
+        on/after at_tempo_date and play_ready_date                      -> "Maintenance"
+    """
+    session_dates = pd.to_datetime(pd.Series(session_dates)).to_numpy()
+    off_book_date, at_tempo_date, play_ready_date = [pd.to_datetime(df_milestones[column]).to_numpy() for column in ['off_book_date','at_tempo_date','play_ready_date']]
+    at_tempo = session_dates>=at_tempo_date # comparisons with NaT are False
+    return np.select(
+        [at_tempo & (session_dates>=play_ready_date), at_tempo, session_dates>=off_book_date],
+        ['Maintenance', 'Phrasing', 'Achieving Tempo'],
+        default='Learning Notes',
+    )
+
+def stageChanges(df_raw_session, df_raw_arrangement, arrangement_ids=None):
+    """
+    Returns the sessions (only those of arrangement_ids, if given) whose stored stage differs from their arrangement's milestones, as a dataframe of id and stage
+    """
+    df_sessions = df_raw_session[['id','session_date','l_arrangement_id','stage']]
+    if arrangement_ids is not None:
+        df_sessions = df_sessions[df_sessions['l_arrangement_id'].isin(arrangement_ids)]
+    df_sessions = df_sessions.merge(df_raw_arrangement[['id','off_book_date','at_tempo_date','play_ready_date']].rename({'id':'l_arrangement_id'},axis=1), how='left', on='l_arrangement_id')
+    df_sessions = df_sessions.assign(new_stage=classifyStages(df_sessions['session_date'], df_sessions))
+    df_changed = df_sessions[df_sessions['stage'].astype(object)!=df_sessions['new_stage']]
+    return df_changed[['id','new_stage']].rename({'new_stage':'stage'},axis=1)
+
+def readSessionFile(path, file_name:str):
+    """
+    Reads a practice session import file into a dataframe of text values, as JSON if file_name ends in .json and as CSV otherwise
+    """
+    if str(file_name).lower().endswith('.json'):
+        return pd.read_json(path, orient='records', dtype=False, convert_dates=False)
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+def _lookupIds(names, lookup:dict, suffix:str=''):
+    """
+    Resolves the labels of a form's lookup dict ({id: label}) to ids, ignoring case and surrounding spaces.  Unknown names resolve to NaN.
+    """
+    name_ids = {}
+    for row_id, label in lookup.items():
+        if row_id=='':
+            continue
+        label = str(label).strip().casefold()
+        name_ids[label] = row_id
+        if suffix and label.endswith(suffix.casefold()):
+            name_ids.setdefault(label[:-len(suffix)].strip(), row_id)
+    return pd.Series(names).astype(str).str.strip().str.casefold().map(name_ids).astype('Float64')
+
+def prepareSessionImport(df_file, df_raw_session, df_raw_arrangement, arrangement_lookup:dict, guitar_lookup:dict, default_guitar_id=None):
+    """
+    Validates the rows of a practice session import file (see readSessionFile()) and resolves them to practice_session rows.  Rows already saved or repeated within the file are skipped.
+    Columns of the file (case and spaces don't matter):
+        session_date, duration          required
+        arrangement or l_arrangement_id required, arrangement as labelled in the Sessions form
+        guitar or guitar_id             the default guitar if empty
+        notes, video_url
+    Returns (df_import, df_preview): the rows ready for DatabaseModel.insertMany(), and every row of the file with a Problem column.  Raises ValueError if a required column is missing.
+    """
+    df_file = df_file.rename(lambda column: str(column).strip().casefold().replace(' ','_'), axis=1).reset_index(drop=True)
+    missing = [column for column in ['session_date','duration'] if column not in df_file.columns]
+    if 'arrangement' not in df_file.columns and 'l_arrangement_id' not in df_file.columns:
+        missing.append('arrangement')
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    empty = pd.Series('', index=df_file.index)
+
+    session_date = pd.to_datetime(df_file['session_date'], errors='coerce', format='mixed')
+    duration = pd.to_numeric(df_file['duration'], errors='coerce')
+    if 'l_arrangement_id' in df_file.columns:
+        arrangement_id = pd.to_numeric(df_file['l_arrangement_id'], errors='coerce').astype('Float64')
+        arrangement_id = arrangement_id.where(arrangement_id.isin(df_raw_arrangement['id']))
+    else:
+        arrangement_id = _lookupIds(df_file['arrangement'], arrangement_lookup)
+    if 'guitar_id' in df_file.columns:
+        guitar_given = df_file['guitar_id'].astype(str).str.strip().replace('nan','')!=''
+        guitar_id = pd.to_numeric(df_file['guitar_id'], errors='coerce').astype('Float64')
+        guitar_id = guitar_id.where(guitar_id.isin([row_id for row_id in guitar_lookup if row_id!='']))
+    elif 'guitar' in df_file.columns:
+        guitar_given = df_file['guitar'].astype(str).str.strip().replace('nan','')!=''
+        guitar_id = _lookupIds(df_file['guitar'], guitar_lookup, suffix=' (Default)')
+    else:
+        guitar_given = empty.astype(bool)
+        guitar_id = pd.Series(np.nan, index=df_file.index, dtype='Float64')
+    if default_guitar_id is not None:
+        guitar_id = guitar_id.where(guitar_given, float(default_guitar_id))
+
+    df_import = pd.DataFrame({
+        'session_date':session_date.dt.date,
+        'duration':duration,
+        'l_arrangement_id':arrangement_id,
+        'notes':df_file['notes'] if 'notes' in df_file.columns else None,
+        'video_url':df_file['video_url'] if 'video_url' in df_file.columns else '',
+        'guitar_id':guitar_id,
+    })
+    df_milestones = df_raw_arrangement.set_index('id')[['off_book_date','at_tempo_date','play_ready_date']].reindex(arrangement_id.astype(float).to_numpy())
+    df_import['stage'] = classifyStages(session_date, df_milestones)
+
+    df_existing = df_raw_session[['session_date','l_arrangement_id','duration']].assign(session_date=lambda df: pd.to_datetime(df['session_date']), l_arrangement_id=lambda df: df['l_arrangement_id'].astype(float), duration=lambda df: df['duration'].astype(float))
+    key = pd.MultiIndex.from_arrays([session_date, arrangement_id.astype(float), duration.astype(float)])
+    already_saved = key.isin(pd.MultiIndex.from_frame(df_existing))
+
+    problem = np.select(
+        [session_date.isna(), duration.isna() | (duration<=0) | (duration%1!=0), arrangement_id.isna(), guitar_id.isna(), already_saved, key.duplicated()],
+        ['Invalid session date', 'Duration must be a whole number of minutes', 'Unknown arrangement', 'Unknown guitar' if default_guitar_id is not None else 'Unknown guitar (and no default guitar set)', 'Already saved', 'Repeats an earlier row'],
+        default='',
+    )
+    valid = problem==''
+
+    df_preview = pd.DataFrame({
+        'Session Date':session_date.dt.strftime("%m/%d/%Y"),
+        'Duration':df_import['duration'],
+        'Arrangement':arrangement_id.map(arrangement_lookup, na_action='ignore'),
+        'Guitar':guitar_id.map(guitar_lookup, na_action='ignore'),
+        'Stage':df_import['stage'].where(valid, ''),
+        'Problem':problem,
+    }).fillna('')
+    df_import = df_import[valid].astype({'duration':int, 'l_arrangement_id':int, 'guitar_id':int})
+    return df_import, df_preview
+
 class ShinyInputTableModel(ABC):
     """
     This class will make use of DatabaseTableModels to establish more complete table representation for user form input (including where necessary bringing in lookup tables to resolve lookup ids in the primary table).  It also contains specific UI components required for the inpurt form modal.
@@ -21,6 +145,10 @@ class ShinyInputTableModel(ABC):
     _db_table_model=None # This object manages read/write access to the specific table itself (database model)
     _df_selected_id = None # This is the selected row passed in from the table navigator
     _input_form_modal = None # This is the input form modal's id.  We use this to close the modal in the concrete class definitions
+    _lookup_models = () # DatabaseModels of the lookup tables processData() merges in (the db_*_model constructor arguments)
+    _refresh_graph = None # RefreshGraph this model belongs to, if any
+    _summary_listeners = () # reactive values of the table navigators showing df_summary (see addSummaryListener())
+    _summary_change = (None, None, None) # (df_summary before the last refresh, df_summary after it, ids of the rows the write changed), see summaryChange()
     @abstractmethod
     def processData():
         """
@@ -58,14 +186,76 @@ class ShinyInputTableModel(ABC):
 
         return ui_modal(self._namespace_id)
 
+    def _selected_row(self):
+        """
+        Returns the record being updated as a {column: value} dict
+        """
+        return self._db_table_model.getRow(self._df_selected_id)
+
     def _init_id_text(self):
         if self._df_selected_id:
             return "id: "+str(self._df_selected_id)
         else:
             return "id: [NEW RECORD]"        
 
+    def addSummaryListener(self, summary_df):
+        """
+        Registers a reactive value that is set to df_summary whenever it is recomputed after a write
+        """
+        self._summary_listeners = self._summary_listeners+(summary_df,)
+
+    def removeSummaryListener(self, summary_df):
+        self._summary_listeners = tuple(listener for listener in self._summary_listeners if listener is not summary_df)
+
+    def _publishSummary(self):
+        for summary_df in self._summary_listeners:
+            summary_df.set(self.df_summary)
+
+    def _recomputeSummary(self, row_ids:set=None):
+        """
+        Reruns processData() after a write
+        row_ids (set): ids of the only rows of df_summary the write can have changed, None if it can have changed any
+        """
+        previous_summary = self.df_summary
+        self.processData()
+        self._summary_change = (previous_summary, self.df_summary, row_ids)
+
+    def summaryChange(self, df_summary):
+        """
+        Returns (previous df_summary, ids of the rows that differ from it) if df_summary came from a write that only changed those rows, otherwise (None, None)
+        """
+        previous_summary, summary, row_ids = self._summary_change
+        if df_summary is not summary or row_ids is None:
+            return None, None
+        return previous_summary, row_ids
+
+    def _refreshSummaries(self):
+        """
+        Recomputes df_summary after a write to this model's table, along with every model that looks the table up, and pushes them to the table navigators
+        """
+        if self._refresh_graph is not None:
+            self._refresh_graph.refresh(self._db_table_model)
+        else:
+            self._recomputeSummary(self._db_table_model.takeWrittenIds())
+            self._publishSummary()
+
+    def _navigator_tools_ui(self):
+        """
+        Extra controls the table navigator shows between its Update and New buttons.  None by default.
+        """
+        return None
+
+    def _navigator_tools_server(self, input, output, session):
+        """
+        Server code for _navigator_tools_ui(), run inside the table navigator's module
+        """
+        pass
+
     @abstractmethod
     def server_call(self, input, output, session, summary_df):
+        """
+        Form submits are async effects that await the DatabaseModel's *Async methods
+        """
         pass
 
 class ArtistInputTableModel(ShinyInputTableModel):    
@@ -76,15 +266,15 @@ class ArtistInputTableModel(ShinyInputTableModel):
         self._db_table_model=db_table_model
 
     def processData(self):
-        self._db_table_model.df_raw['last_name']=self._db_table_model.df_raw['name'].str.split(' ').str[-1]
-        self._db_table_model.df_raw = self._db_table_model.df_raw.sort_values('last_name')
-        self.df_summary = self._db_table_model.df_raw.rename({'name':'Artist'},axis=1).copy()
+        # The song, arrangement and session models merge in the artist df_raw and use its last_name column and order, so this replaces df_raw rather than writing into it
+        self._db_table_model.df_raw = self._db_table_model.df_raw.assign(last_name=self._db_table_model.df_raw['name'].str.split(' ').str[-1]).sort_values('last_name')
+        self.df_summary = self._db_table_model.df_raw.rename({'name':'Artist'},axis=1)
         self.df_summary = self.df_summary[['id','Artist']]
 
     def __init_name(self):
         if self._df_selected_id:
             # provide initial value for the name field of the input form
-            return str(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['name'].values[0])
+            return str(self._selected_row()['name'])
         else:
             return None
     
@@ -110,7 +300,7 @@ class ArtistInputTableModel(ShinyInputTableModel):
             
             @reactive.effect
             @reactive.event(input.btn_input_form_submit, ignore_init=True, ignore_none=True)
-            def triggerInputFormSubmit():
+            async def triggerInputFormSubmit():
                 # Perform Data Validation and msg if issues
                 try:
                     req(input.name())
@@ -123,13 +313,14 @@ class ArtistInputTableModel(ShinyInputTableModel):
                 # Create single row as dataframe
                 df_row_to_database = pd.DataFrame({'id':[self._df_selected_id],'name':[input.name()]})
                 if self._df_selected_id:
-                    self._db_table_model.update(df_row_to_database)
+                    if not await self._db_table_model.updateAsync(df_row_to_database):
+                        ui.modal_remove()
+                        return
                 else:
-                    self._db_table_model.insert(df_row_to_database)
+                    await self._db_table_model.insertAsync(df_row_to_database)
                 
                 ui.modal_remove()
-                self.processData()
-                summary_df.set(self.df_summary)
+                self._refreshSummaries()
            
             @reactive.effect
             @reactive.event(input.btn_input_cancel)
@@ -154,26 +345,26 @@ class StringSetInputTableModel(ShinyInputTableModel):
 
     def processData(self):
         self._db_table_model.df_raw = self._db_table_model.df_raw.sort_values('name')
-        self.df_summary = self._db_table_model.df_raw.rename({'name':'Name', 'hyperlink':'Hyperlink'},axis=1).copy()
+        self.df_summary = self._db_table_model.df_raw.rename({'name':'Name', 'hyperlink':'Hyperlink'},axis=1)
 
     def __init_name(self):
         if self._df_selected_id:
             # provide initial value for the name field of the input form
-            return str(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['name'].values[0])
+            return str(self._selected_row()['name'])
         else:
             return None
 
     def __init_hyperlink(self):
         if self._df_selected_id:
             # provide initial value for the hyperlink field of the input form
-            return str(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['hyperlink'].values[0])
+            return str(self._selected_row()['hyperlink'])
         else:
             return None
 
     def __init_image_url(self):
         if self._df_selected_id:
             # provide initial value for the image field of the input form
-            return str(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['image_url'].values[0])
+            return str(self._selected_row()['image_url'])
         else:
             return None        
 
@@ -201,7 +392,7 @@ class StringSetInputTableModel(ShinyInputTableModel):
 
             @reactive.effect
             @reactive.event(input.btn_input_form_submit, ignore_init=True, ignore_none=True)
-            def triggerInputFormSubmit():
+            async def triggerInputFormSubmit():
                 # Perform Data Validation and msg if issues
                 try:
                     req(input.name())
@@ -219,13 +410,14 @@ class StringSetInputTableModel(ShinyInputTableModel):
                                                    'hyperlink':[input.hyperlink()],
                                                    'image_url':[input.image_url()]})
                 if self._df_selected_id:
-                    self._db_table_model.update(df_row_to_database)
+                    if not await self._db_table_model.updateAsync(df_row_to_database):
+                        ui.modal_remove()
+                        return
                 else:
-                    self._db_table_model.insert(df_row_to_database)
+                    await self._db_table_model.insertAsync(df_row_to_database)
                 
                 ui.modal_remove()
-                self.processData()
-                summary_df.set(self.df_summary)
+                self._refreshSummaries()
            
             @reactive.effect
             @reactive.event(input.btn_input_cancel)
@@ -250,12 +442,12 @@ class StyleInputTableModel(ShinyInputTableModel):
 
     def processData(self):
         self._db_table_model.df_raw = self._db_table_model.df_raw.sort_values('style')
-        self.df_summary = self._db_table_model.df_raw.rename({'style':'Style'},axis=1).copy()
+        self.df_summary = self._db_table_model.df_raw.rename({'style':'Style'},axis=1)
 
     def __init_name(self):
         if self._df_selected_id:
             # provide initial value for the name field of the input form
-            return str(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['style'].values[0])
+            return str(self._selected_row()['style'])
         else:
             return None
     
@@ -281,7 +473,7 @@ class StyleInputTableModel(ShinyInputTableModel):
 
             @reactive.effect
             @reactive.event(input.btn_input_form_submit, ignore_init=True, ignore_none=True)
-            def triggerInputFormSubmit():
+            async def triggerInputFormSubmit():
                 # Perform Data Validation and msg if issues
                 try:
                     req(input.style())
@@ -296,13 +488,14 @@ class StyleInputTableModel(ShinyInputTableModel):
                 # Create single row as dataframe
                 df_row_to_database = pd.DataFrame({'id':[self._df_selected_id],'style':[input.style()]})
                 if self._df_selected_id:
-                    self._db_table_model.update(df_row_to_database)
+                    if not await self._db_table_model.updateAsync(df_row_to_database):
+                        ui.modal_remove()
+                        return
                 else:
-                    self._db_table_model.insert(df_row_to_database)
+                    await self._db_table_model.insertAsync(df_row_to_database)
                 
                 ui.modal_remove()
-                self.processData()
-                summary_df.set(self.df_summary)
+                self._refreshSummaries()
            
             @reactive.effect
             @reactive.event(input.btn_input_cancel)
@@ -330,14 +523,14 @@ class SongInputTableModel(ShinyInputTableModel):
         self._db_table_model=db_table_model
         self.__db_artist_model = db_artist_model
         self.__db_style_model = db_style_model
+        self._lookup_models = (db_artist_model, db_style_model)
 
     def processData(self):
         # There is more complex logic required to process the Song dataframe because it has the artist lookup field to worry about
         df_raw_song = self._db_table_model.df_raw
         df_raw_artist = self.__db_artist_model.df_raw
         df_raw_style = self.__db_style_model.df_raw
-        df_raw_song['style_id'] = df_raw_song['style_id'].astype("Int64") # Allows us to join on null ints since this column is nullable
-        df_raw_song['composer_id'] = df_raw_song['composer_id'].astype("Int64") # Allows us to join on null ints since this column is nullable
+        df_raw_song = df_raw_song.astype({'style_id':'Int64', 'composer_id':'Int64'}) # Allows us to join on null ints since these columns are nullable
         df_resolved_song = df_raw_song.merge(df_raw_artist, how='left', left_on='composer_id', right_on='id').drop(['composer_id','id_y'],axis=1).rename({'id_x':'id','name':'Composer'},axis=1)
         df_resolved_song = df_resolved_song.merge(df_raw_style, how='left', left_on='style_id', right_on='id').drop(['style_id','id_y'], axis=1).rename({'id_x':'id', 'style':'Style'},axis=1)
         df_resolved_song = df_resolved_song.rename({'title':'Title', 'song_type':'Song Type'},axis=1).sort_values(['last_name','Title'])
@@ -359,7 +552,7 @@ class SongInputTableModel(ShinyInputTableModel):
     def __init_title(self):
         # provide initial value for the title field of the input form
         if self._df_selected_id:
-            return str(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['title'].values[0])
+            return str(self._selected_row()['title'])
         else:
             # User selected New
             return None
@@ -367,7 +560,7 @@ class SongInputTableModel(ShinyInputTableModel):
     def __init_song_type(self):
         # provide initial value for the song_type field of the input form
         if self._df_selected_id:
-            return str(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['song_type'].values[0])
+            return str(self._selected_row()['song_type'])
         else:
             # User selected New
             return None
@@ -377,7 +570,7 @@ class SongInputTableModel(ShinyInputTableModel):
         # provide initial value for the composer lookup field of the input form
         if self._df_selected_id: 
             # User selected Update
-            artist_id = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['composer_id'].values[0]
+            artist_id = self._selected_row()['composer_id']
             if pd.isna(artist_id):
                 return '' # Update a record with a null artist id
 
@@ -394,7 +587,7 @@ class SongInputTableModel(ShinyInputTableModel):
         # provide initial value for the style lookup field of the input form
         if self._df_selected_id: 
             # User selected Update
-            style_id = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['style_id'].values[0]
+            style_id = self._selected_row()['style_id']
             if pd.isna(style_id):
                 return '' # Update a record with a null artist id
 
@@ -431,7 +624,7 @@ class SongInputTableModel(ShinyInputTableModel):
 
             @reactive.effect
             @reactive.event(input.btn_input_form_submit, ignore_init=True, ignore_none=True)
-            def triggerInputFormSubmit():
+            async def triggerInputFormSubmit():
                 # Perform Data Validation and msg if issues
                 try:
                     req(input.title())
@@ -454,13 +647,14 @@ class SongInputTableModel(ShinyInputTableModel):
                                                    'song_type':[song_type]})
 
                 if self._df_selected_id:
-                    self._db_table_model.update(df_row_to_database)
+                    if not await self._db_table_model.updateAsync(df_row_to_database):
+                        ui.modal_remove()
+                        return
                 else:
-                    self._db_table_model.insert(df_row_to_database)
+                    await self._db_table_model.insertAsync(df_row_to_database)
                 
                 ui.modal_remove()
-                self.processData()
-                summary_df.set(self.df_summary)
+                self._refreshSummaries()
             
             @reactive.effect
             @reactive.event(input.btn_input_cancel)
@@ -483,13 +677,18 @@ class ArrangementInputTableModel(ShinyInputTableModel):
     __difficulty_lookup=None
     __song_lookup=None
 
-    def __init__(self, namespace_id:str, title:str, db_table_model:database.DatabaseModel, db_song_model:database.DatabaseModel, db_artist_model:database.DatabaseModel, db_style_model:database.DatabaseModel):
+    def __init__(self, namespace_id:str, title:str, db_table_model:database.DatabaseModel, db_song_model:database.DatabaseModel, db_artist_model:database.DatabaseModel, db_style_model:database.DatabaseModel, db_session_model:database.DatabaseModel=None):
+        """
+        db_session_model (DatabaseModel): if given, the stages of an arrangement's practice sessions are recomputed when its milestone dates change
+        """
         self._namespace_id=namespace_id
         self._title=title
         self._db_table_model=db_table_model
         self.__db_artist_model = db_artist_model
         self.__db_style_model = db_style_model
         self.__db_song_model = db_song_model 
+        self.__db_session_model = db_session_model
+        self._lookup_models = (db_song_model, db_artist_model, db_style_model)
 
     def processData(self):
         # There is more complex logic required to process the Arrangement dataframe because it has the artist lookup field to worry about
@@ -500,7 +699,7 @@ class ArrangementInputTableModel(ShinyInputTableModel):
         df_resolved_song = df_raw_song.merge(df_raw_artist, how='left', left_on='composer_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id','name':'composer'},axis=1)
         df_resolved_song = df_resolved_song.merge(df_raw_style, how='left', left_on='style_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
 
-        df_raw_arrangement['arranger'] = df_raw_arrangement['arranger'].astype("Int64") # Allows us to join on null ints since this column is nullable
+        df_raw_arrangement = df_raw_arrangement.astype({'arranger':'Int64'}) # Allows us to join on null ints since this column is nullable
         df_resolved_arrangement = df_raw_arrangement.merge(df_raw_artist, how='left', left_on='arranger', right_on='id').drop(['arranger','id_y','last_name'],axis=1).rename({'id_x':'id','name':'Arranger'},axis=1)
         df_resolved_arrangement = df_resolved_arrangement.merge(df_resolved_song, how='left',left_on='song_id',right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
 
@@ -530,7 +729,7 @@ class ArrangementInputTableModel(ShinyInputTableModel):
     def __init_difficulty(self):
         # provide initial value for the name field of the input form
         if self._df_selected_id:
-            return str(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['difficulty'].values[0])
+            return str(self._selected_row()['difficulty'])
         else:
             # User selected New
             return None
@@ -538,7 +737,7 @@ class ArrangementInputTableModel(ShinyInputTableModel):
     def __init_sheet_music_link(self):
         # provide initial value for the name field of the input form
         if self._df_selected_id:
-            return str(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['sheet_music_link'].values[0])
+            return str(self._selected_row()['sheet_music_link'])
         else:
             # User selected New
             return None
@@ -546,7 +745,7 @@ class ArrangementInputTableModel(ShinyInputTableModel):
     def __init_performance_link(self):
         # provide initial value for the name field of the input form
         if self._df_selected_id:
-            return str(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['performance_link'].values[0])
+            return str(self._selected_row()['performance_link'])
         else:
             # User selected New
             return None
@@ -555,7 +754,7 @@ class ArrangementInputTableModel(ShinyInputTableModel):
         # provide initial value for the arranger lookup field of the input form
         if self._df_selected_id: 
             # User selected Update
-            artist_id = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['arranger'].values[0]
+            artist_id = self._selected_row()['arranger']
             if pd.isna(artist_id):
                 return '' # Update a record with a null artist id
 
@@ -572,7 +771,7 @@ class ArrangementInputTableModel(ShinyInputTableModel):
         # provide initial value for the arranger lookup field of the input form
         if self._df_selected_id: 
             # User selected Update
-            song_id = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['song_id'].values[0]
+            song_id = self._selected_row()['song_id']
             if pd.isna(song_id):
                 return '' # Update a record with a null artist id
 
@@ -588,7 +787,7 @@ class ArrangementInputTableModel(ShinyInputTableModel):
         # provide initial value for the start date on the input form
         if self._df_selected_id:
             # User selected Update
-            start_date = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['start_date'].values[0]
+            start_date = self._selected_row()['start_date']
             if start_date:
                 return start_date
             else:
@@ -601,7 +800,7 @@ class ArrangementInputTableModel(ShinyInputTableModel):
         # provide initial value for the off_book_date on the input form
         if self._df_selected_id:
             # User selected Update
-            off_book_date = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['off_book_date'].values[0]
+            off_book_date = self._selected_row()['off_book_date']
             if off_book_date:
                 return off_book_date
             else:
@@ -614,7 +813,7 @@ class ArrangementInputTableModel(ShinyInputTableModel):
         # provide initial value for the off_book_date on the input form
         if self._df_selected_id:
             # User selected Update
-            at_tempo_date = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['at_tempo_date'].values[0]
+            at_tempo_date = self._selected_row()['at_tempo_date']
             if at_tempo_date:
                 return at_tempo_date
             else:
@@ -627,7 +826,7 @@ class ArrangementInputTableModel(ShinyInputTableModel):
         # provide initial value for the play_ready_date on the input form
         if self._df_selected_id:
             # User selected Update
-            play_ready_date = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['play_ready_date'].values[0]
+            play_ready_date = self._selected_row()['play_ready_date']
             if play_ready_date:
                 return play_ready_date
             else:
@@ -666,7 +865,7 @@ class ArrangementInputTableModel(ShinyInputTableModel):
 
             @reactive.effect
             @reactive.event(input.btn_input_form_submit, ignore_init=True, ignore_none=True)
-            def triggerInputFormSubmit():
+            async def triggerInputFormSubmit():
                 # Perform Data Validation and msg if issues
                 try:
                     req(input.song())
@@ -698,13 +897,19 @@ class ArrangementInputTableModel(ShinyInputTableModel):
                                                    'play_ready_date':[input.play_ready_date()]})
                 #print(df_row_to_database.to_string())
                 if self._df_selected_id:
-                    self._db_table_model.update(df_row_to_database)
+                    changed = await self._db_table_model.updateAsync(df_row_to_database)
+                    if not changed:
+                        ui.modal_remove()
+                        return
+                    # Changed milestone dates restage this arrangement's past sessions in one batched update
+                    db_session_model = self._ArrangementInputTableModel__db_session_model
+                    if db_session_model is not None and changed.keys() & {'off_book_date','at_tempo_date','play_ready_date'}:
+                        await db_session_model.updateManyAsync(stageChanges(db_session_model.df_raw, self._db_table_model.df_raw, [int(self._df_selected_id)]))
                 else:
-                    self._db_table_model.insert(df_row_to_database)
+                    await self._db_table_model.insertAsync(df_row_to_database)
                 
                 ui.modal_remove()
-                self.processData()
-                summary_df.set(self.df_summary)
+                self._refreshSummaries()
             
             @reactive.effect
             @reactive.event(input.btn_input_cancel)
@@ -738,6 +943,7 @@ class ArrangementGoalInputTableModel(ShinyInputTableModel):
         self.__db_arrangement_model = db_arrangement_model
         self.__db_artist_model = db_artist_model
         self.__db_song_model = db_song_model
+        self._lookup_models = (db_arrangement_model, db_song_model, db_artist_model)
 
     def processData(self):
         # There is more complex logic required to process the Arrangement dataframe because it has the artist lookup field to worry about
@@ -755,7 +961,7 @@ class ArrangementGoalInputTableModel(ShinyInputTableModel):
         
         df_resolved_arrangement_goal = df_raw_arrangement_goal.merge(df_resolved_arrangement, how='left', left_on='arrangement_id', right_on='id').drop(['id_y'], axis=1).rename({'id_x':'id'}, axis=1)
         df_resolved_arrangement['Start Date'] = pd.to_datetime(df_resolved_arrangement['start_date']).dt.strftime("%m/%d/%Y")
-        self.__df_resolved_arrangement=df_resolved_arrangement.copy()
+        self.__df_resolved_arrangement=df_resolved_arrangement
 
 
         # Build rendered dataframe for the table navigator
@@ -776,7 +982,7 @@ class ArrangementGoalInputTableModel(ShinyInputTableModel):
     def __init_description(self):
         # provide initial value for the description field of the input form
         if self._df_selected_id:
-            return str(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['description'].values[0])
+            return str(self._selected_row()['description'])
         else:
             # User selected New
             return None     
@@ -785,7 +991,7 @@ class ArrangementGoalInputTableModel(ShinyInputTableModel):
         # provide initial value for the arrangement lookup field of the input form
         if self._df_selected_id: 
             # User selected Update
-            arrangement_id = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['arrangement_id'].values[0]
+            arrangement_id = self._selected_row()['arrangement_id']
             if pd.isna(arrangement_id):
                 return '' # Update a record with a null arrangement id
 
@@ -802,7 +1008,7 @@ class ArrangementGoalInputTableModel(ShinyInputTableModel):
         # provide initial value for the discovery_date on the input form
         if self._df_selected_id:
             # User selected Update
-            discovery_date = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['discovery_date'].values[0]
+            discovery_date = self._selected_row()['discovery_date']
             if discovery_date:
                 return discovery_date
             else:
@@ -822,10 +1028,11 @@ class ArrangementGoalInputTableModel(ShinyInputTableModel):
         self._ArrangementGoalInputTableModel__arrangement_lookup=self._ArrangementGoalInputTableModel__new_arrangement_lookup # pesudonym for self.__new_arrangement_lookup.  Lookup arrangement control contains only arrangements that aren't on the gosl arrangement table.
         if self._df_selected_id:
             # Add a record to the lookup arrangement control for the selected arrangement_id so that it shows when a form is updated
-            arrangement_id = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['arrangement_id'].values[0]
-            composer=df_resolved_arrangement[df_resolved_arrangement['id']==arrangement_id]['Composer'].values[0]
-            arranger=df_resolved_arrangement[df_resolved_arrangement['id']==arrangement_id]['Arranger'].values[0]
-            title=df_resolved_arrangement[df_resolved_arrangement['id']==arrangement_id]['title'].values[0]
+            arrangement_id = self._selected_row()['arrangement_id']
+            ser_arrangement = df_resolved_arrangement[df_resolved_arrangement['id']==arrangement_id].iloc[0]
+            composer=ser_arrangement['Composer']
+            arranger=ser_arrangement['Arranger']
+            title=ser_arrangement['title']
             self._ArrangementGoalInputTableModel__arrangement_lookup.update({int(arrangement_id):str("Composer: "+str(composer)+", Arrangement: "+str(title)+', Arranger: '+str(arranger))})
             
 
@@ -849,7 +1056,7 @@ class ArrangementGoalInputTableModel(ShinyInputTableModel):
             
             @reactive.effect
             @reactive.event(input.btn_input_form_submit, ignore_init=True, ignore_none=True)
-            def triggerInputFormSubmit():
+            async def triggerInputFormSubmit():
                 # Perform Data Validation and msg if issues
                 try:
                     req(input.discovery_date())
@@ -872,13 +1079,14 @@ class ArrangementGoalInputTableModel(ShinyInputTableModel):
                                                    'discovery_date':[input.discovery_date()]})
                 #print(df_row_to_database.to_string())
                 if self._df_selected_id:
-                    self._db_table_model.update(df_row_to_database)
+                    if not await self._db_table_model.updateAsync(df_row_to_database):
+                        ui.modal_remove()
+                        return
                 else:
-                    self._db_table_model.insert(df_row_to_database)
+                    await self._db_table_model.insertAsync(df_row_to_database)
                 
                 ui.modal_remove()
-                self.processData()
-                summary_df.set(self.df_summary)
+                self._refreshSummaries()
             
             @reactive.effect
             @reactive.event(input.btn_input_cancel)
@@ -904,6 +1112,7 @@ class GuitarInputTableModel(ShinyInputTableModel):
         self._title=title
         self._db_table_model=db_table_model
         self.__db_string_set_model = db_string_set_model
+        self._lookup_models = (db_string_set_model,)
         self.__df_current_default_guitar=pd.DataFrame()
         
     def processData(self):
@@ -927,14 +1136,14 @@ class GuitarInputTableModel(ShinyInputTableModel):
     def __init_make(self):
         # provide initial value for the make field of the input form
         if self._df_selected_id:
-            return self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['make'].values[0]
+            return self._selected_row()['make']
         else:
             # User selected New
             return None    
 
     def __init_default_guitar(self):
         if self._df_selected_id:
-            return self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['default_guitar'].values[0]
+            return self._selected_row()['default_guitar']
         else:
             # User selected New
             return None        
@@ -942,7 +1151,7 @@ class GuitarInputTableModel(ShinyInputTableModel):
     def __init_model(self):
         # provide initial value for the make field of the input form
         if self._df_selected_id:
-            return self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['model'].values[0]
+            return self._selected_row()['model']
         else:
             # User selected New
             return None    
@@ -950,14 +1159,14 @@ class GuitarInputTableModel(ShinyInputTableModel):
     def __init_about(self):
         # provide initial value for the make field of the input form
         if self._df_selected_id:
-            return self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['about'].values[0]
+            return self._selected_row()['about']
         else:
             # User selected New
             return None
 
     def __init_status(self):
         if self._df_selected_id:
-            return self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['status'].values[0]
+            return self._selected_row()['status']
         else:
             # User selected New
             return None
@@ -965,7 +1174,7 @@ class GuitarInputTableModel(ShinyInputTableModel):
     def __init_image_link(self):
         # provide initial value for the make field of the input form
         if self._df_selected_id:
-            return self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['image_link'].values[0]
+            return self._selected_row()['image_link']
         else:
             # User selected New
             return None
@@ -974,7 +1183,7 @@ class GuitarInputTableModel(ShinyInputTableModel):
         # provide initial value for the start date on the input form
         if self._df_selected_id:
             # User selected Update
-            date_started = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['date_added'].values[0]
+            date_started = self._selected_row()['date_added']
             if date_started:
                 return date_started
             else:
@@ -987,7 +1196,7 @@ class GuitarInputTableModel(ShinyInputTableModel):
         # provide initial value for the start date on the input form
         if self._df_selected_id:
             # User selected Update
-            date_strings_installed = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['strings_install_date'].values[0]
+            date_strings_installed = self._selected_row()['strings_install_date']
             if date_strings_installed:
                 return date_strings_installed
             else:
@@ -1000,7 +1209,7 @@ class GuitarInputTableModel(ShinyInputTableModel):
         # provide initial value for the start date on the input form
         if self._df_selected_id:
             # User selected Update
-            date_retired = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['date_retired'].values[0]
+            date_retired = self._selected_row()['date_retired']
             if date_retired:
                 return date_retired
             else:
@@ -1013,7 +1222,7 @@ class GuitarInputTableModel(ShinyInputTableModel):
         # provide initial value for the string_set lookup field of the input form
         if self._df_selected_id:
             # User selected Update
-            string_set_id = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['string_set_id'].values[0]
+            string_set_id = self._selected_row()['string_set_id']
             if (string_set_id):
                 if (not math.isnan(string_set_id)):
                     return int(string_set_id) # Update a record with a non-null selection
@@ -1055,7 +1264,7 @@ class GuitarInputTableModel(ShinyInputTableModel):
             
             @reactive.effect
             @reactive.event(input.btn_input_form_submit, ignore_init=True, ignore_none=True)
-            def triggerInputFormSubmit():
+            async def triggerInputFormSubmit():
                 # Data validation and message
                 try:
                     req(input.make())
@@ -1084,33 +1293,17 @@ class GuitarInputTableModel(ShinyInputTableModel):
                                                 'date_retired':[input.date_retired()],
                                                 'string_set_id':[string_set_id]})
                 
-                # Any other guitars that are identified as default that aren't this one must be changed to default_guitar=False
-                if input.default_guitar()==True:
-                    for i in self._GuitarInputTableModel__df_current_default_guitar.index:
-                        ser_previous_default_guitar = pd.Series(self._GuitarInputTableModel__df_current_default_guitar.loc[i])
-                        if (not self._df_selected_id):
-                            # Remove "default"guitar flag for previous guitars because this is a NEW record and is default
-                            ser_previous_default_guitar['default_guitar']=False
-                            df_previous_default_guitar = pd.DataFrame([ser_previous_default_guitar.copy()])
-                            df_previous_default_guitar['string_set_id'] = df_previous_default_guitar['string_set_id'].astype(object)
-                            self._db_table_model.update(df_previous_default_guitar)   
-                        
-                        elif (int(self._df_selected_id)!=int(ser_previous_default_guitar['id'])): # don't do anything if the default guitar hasn't changed and this is an update record
-                            
-                            ser_previous_default_guitar['default_guitar']=False
-                            df_previous_default_guitar = pd.DataFrame([ser_previous_default_guitar.copy()])
-                            df_previous_default_guitar['string_set_id'] = df_previous_default_guitar['string_set_id'].astype(object)
-                            self._db_table_model.update(df_previous_default_guitar)       
-
+                # A default guitar takes the flag from every other guitar in the same transaction as the write
+                exclusive_flag = 'default_guitar' if input.default_guitar()==True else None
                 if self._df_selected_id:
-                    self._db_table_model.update(df_row_to_database)
-                    pass
+                    if not await self._db_table_model.updateAsync(df_row_to_database, exclusive_flag):
+                        ui.modal_remove()
+                        return
                 else:
-                    self._db_table_model.insert(df_row_to_database)
+                    await self._db_table_model.insertAsync(df_row_to_database, exclusive_flag)
                 
                 ui.modal_remove()
-                self.processData()
-                summary_df.set(self.df_summary)
+                self._refreshSummaries()
            
             @reactive.effect
             @reactive.event(input.btn_input_cancel)
@@ -1136,6 +1329,9 @@ class SessionInputTableModel(ShinyInputTableModel):
     __db_song_model=None
     __arrangement_lookup=None
     __guitar_lookup=None
+    __arrangement_stats=None # last_played and total_minutes of every arrangement that has sessions, indexed by arrangement id
+    __arrangement_stats_source=None # session df_raw that __arrangement_stats is up to date with
+    __default_guitar_id=None
 
     def __init__(self, namespace_id:str, title:str, db_table_model:database.DatabaseModel, db_arrangement_model:database.DatabaseModel, db_song_model:database.DatabaseModel, db_artist_model:database.DatabaseModel, db_guitar_model:database.DatabaseModel):
         self._namespace_id=namespace_id
@@ -1145,6 +1341,7 @@ class SessionInputTableModel(ShinyInputTableModel):
         self.__db_arrangement_model = db_arrangement_model
         self.__db_guitar_model = db_guitar_model
         self.__db_song_model = db_song_model
+        self._lookup_models = (db_arrangement_model, db_song_model, db_artist_model, db_guitar_model)
         
         
     def processData(self):
@@ -1156,7 +1353,7 @@ class SessionInputTableModel(ShinyInputTableModel):
         df_raw_guitar = self.__db_guitar_model.df_raw
         df_raw_song = self.__db_song_model.df_raw
         df_resolved_song = df_raw_song.merge(df_raw_artist, how='left', left_on='composer_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id','name':'Composer'},axis=1)
-        df_raw_arrangement['arranger'] = df_raw_arrangement['arranger'].astype("Int64") # Allows us to join on null ints since this column is nullable
+        df_raw_arrangement = df_raw_arrangement.astype({'arranger':'Int64'}) # Allows us to join on null ints since this column is nullable
         
         df_resolved_arrangement = df_raw_arrangement.merge(df_resolved_song, how='left', left_on='song_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
         
@@ -1172,34 +1369,25 @@ class SessionInputTableModel(ShinyInputTableModel):
         df_resolved_sessions = df_resolved_sessions.sort_values('session_date', ascending=False)
         self.df_summary = df_resolved_sessions[['id', 'Session Date', 'Duration', 'Song','Composer','Arranger','Notes', 'Video URL', 'Guitar Make', 'Guitar Model']]
         
-        # Establish arrangement lookup
-        df_sessions_copy = df_resolved_sessions.copy()
-        df_resolved_sessions = df_resolved_sessions.drop('l_arrangement_id',axis=1)
-        df_sessions_copy['session_date'] = pd.to_datetime(df_sessions_copy['session_date'])
-        df_sessions_copy['Lookup Name'] = df_sessions_copy.apply(lambda row: str(row['Song'])+' ('+str(row['last_name_x'])+'/'+str(row['last_name_y'])+")", axis=1)
-        df_resolved_arrangement['Lookup Name'] = df_resolved_arrangement.apply(lambda row: str(row['Title'])+' ('+str(row['last_name_x'])+'/'+str(row['last_name_y'])+")", axis=1)
-        
-        # Isolate songs played in last 10 days and order by session_date descending / then alphabetical ascending
-        df_arrangements_last_ten_days =df_sessions_copy[df_sessions_copy['session_date']>=datetime.datetime.now() - pd.DateOffset(days=10)].sort_values('session_date',ascending=False).drop_duplicates('Lookup Name', keep='first')
-        df_arrangements_last_ten_days = df_arrangements_last_ten_days.sort_values(['session_date','last_name_x'], ascending = [False,True])
-        df_arrangements_last_ten_days = df_arrangements_last_ten_days[['l_arrangement_id','Lookup Name']]
-
-        # order remaining arrangements by total time played descending
-        df_arrangements_ordered_by_playtime = df_sessions_copy.groupby('Lookup Name')['Duration'].sum().sort_values(ascending=False).reset_index(drop=False)
-        df_arrangements_ordered_by_playtime = df_arrangements_ordered_by_playtime[~df_arrangements_ordered_by_playtime['Lookup Name'].isin(list(df_arrangements_last_ten_days['Lookup Name']))] # Remove records played in last ten days
-        df_arrangements_ordered_by_playtime = df_arrangements_ordered_by_playtime.merge(df_resolved_arrangement[['id','Lookup Name']], how='inner', on='Lookup Name').rename({'id':'l_arrangement_id'},axis=1)
-
-        df_arrangement_lookup = pd.concat([df_arrangements_last_ten_days, df_arrangements_ordered_by_playtime]).reset_index(drop=True)
-        df_resolved_arrangement = df_resolved_arrangement.sort_values('last_name_x').rename({'id':'l_arrangement_id'},axis=1)[['l_arrangement_id','Lookup Name']]
-        
-        df_unplayed_arrangements = df_resolved_arrangement[~df_resolved_arrangement['Lookup Name'].isin(list(df_arrangement_lookup['Lookup Name']))]
-        df_arrangement_lookup = pd.concat([df_arrangement_lookup, df_unplayed_arrangements]).reset_index(drop=True)
-        
+        # Establish arrangement lookup: arrangements played in the last 10 days (most recent first, then by composer), then the other played ones by total time played, then the unplayed ones by composer
+        if self.__arrangement_stats_source is not df_raw_session:
+            self.__buildArrangementStats(df_raw_session)
+        df_arrangement_lookup = df_resolved_arrangement[['id','last_name_x']].assign(**{'Lookup Name':df_resolved_arrangement['Title'].astype(str)+' ('+df_resolved_arrangement['last_name_x'].astype(str)+'/'+df_resolved_arrangement['last_name_y'].astype(str)+')'})
+        df_arrangement_lookup = df_arrangement_lookup.join(self.__arrangement_stats, on='id')
+        df_arrangement_lookup = df_arrangement_lookup.assign(last_played=pd.to_datetime(df_arrangement_lookup['last_played'])) # before slicing: assigning a series to an empty slice would take the series' index
+        last_played = df_arrangement_lookup['last_played']
+        played_recently = last_played>=datetime.datetime.now() - pd.DateOffset(days=10)
+        played = last_played.notna()
+        df_arrangement_lookup = pd.concat([
+            df_arrangement_lookup[played_recently].sort_values(['last_played','last_name_x'], ascending=[False,True]),
+            df_arrangement_lookup[played & ~played_recently].sort_values('total_minutes', ascending=False),
+            df_arrangement_lookup[~played].sort_values('last_name_x'),
+        ])
+
         self.__arrangement_lookup = {'':''}
-        self.__arrangement_lookup.update({value:f"{lookup_name}" for value,lookup_name in zip(df_arrangement_lookup['l_arrangement_id'],df_arrangement_lookup['Lookup Name'])})
+        self.__arrangement_lookup.update({value:f"{lookup_name}" for value,lookup_name in zip(df_arrangement_lookup['id'],df_arrangement_lookup['Lookup Name'])})
 
-        df_temp_raw_guitar = df_raw_guitar.copy()
-        df_temp_raw_guitar['default_msg'] = np.where(df_raw_guitar['default_guitar']," (Default)","")
+        df_temp_raw_guitar = df_raw_guitar.assign(default_msg=np.where(df_raw_guitar['default_guitar']," (Default)",""))
         self.__guitar_lookup = {'':''}
         self.__guitar_lookup.update({value:f"{make} - {model}{def_msg}" for value,make,model,def_msg in zip(df_temp_raw_guitar['id'],df_temp_raw_guitar['make'],df_temp_raw_guitar['model'], df_temp_raw_guitar['default_msg'])})
 
@@ -1208,11 +1396,31 @@ class SessionInputTableModel(ShinyInputTableModel):
             self.__default_guitar_id=def_guitar_ids[0]
 
 
+    def __buildArrangementStats(self, df_raw_session):
+        """
+        Aggregates the session history into the last date and total minutes each arrangement was played
+        """
+        self.__arrangement_stats = df_raw_session.groupby('l_arrangement_id').agg(last_played=('session_date','max'), total_minutes=('duration','sum'))
+        self.__arrangement_stats_source = df_raw_session
+
+    def _recordNewSession(self, df_raw_session_before, arrangement_id:int, session_date, duration:int):
+        """
+        Adds a newly inserted session to the arrangement stats.  If the session table changed in any other way since df_raw_session_before, the stats are rebuilt instead.
+        """
+        if self.__arrangement_stats_source is not df_raw_session_before:
+            return
+        if arrangement_id in self.__arrangement_stats.index:
+            last_played, total_minutes = self.__arrangement_stats.loc[arrangement_id, ['last_played','total_minutes']]
+            self.__arrangement_stats.loc[arrangement_id, ['last_played','total_minutes']] = [max(last_played, session_date), total_minutes+duration]
+        else:
+            self.__arrangement_stats.loc[arrangement_id] = [session_date, duration]
+        self.__arrangement_stats_source = self._db_table_model.df_raw
+
     def __init_session_date(self):
         # provide initial value for the startsession date on the input form
         if self._df_selected_id:
             # User selected Update
-            session_date = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['session_date'].values[0]
+            session_date = self._selected_row()['session_date']
             if session_date:
                 return session_date
             else:
@@ -1225,7 +1433,7 @@ class SessionInputTableModel(ShinyInputTableModel):
         # provide initial value for the lookup field of the input form
         if self._df_selected_id:
             # User selected Update
-            arrangement_id = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['l_arrangement_id'].values[0]
+            arrangement_id = self._selected_row()['l_arrangement_id']
             if (arrangement_id):
                 if (not math.isnan(arrangement_id)):
                     return int(arrangement_id) # Update a record with a non-null selection
@@ -1240,7 +1448,7 @@ class SessionInputTableModel(ShinyInputTableModel):
         # provide initial value for the lookup field of the input form
         if self._df_selected_id:
             # User selected Update
-            guitar_id = self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['guitar_id'].values[0]
+            guitar_id = self._selected_row()['guitar_id']
             if (guitar_id):
                 if (not math.isnan(guitar_id)):
                     return int(guitar_id) # Update a record with a non-null selection
@@ -1259,7 +1467,7 @@ class SessionInputTableModel(ShinyInputTableModel):
     def __init_duration(self):
         # provide initial value for the duration field of the input form
         if self._df_selected_id:
-            return int(self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['duration'].values[0])
+            return int(self._selected_row()['duration'])
         else:
             # User selected New
             return None
@@ -1267,7 +1475,7 @@ class SessionInputTableModel(ShinyInputTableModel):
     def __init_notes(self):
         # provide initial value for the notes field of the input form
         if self._df_selected_id:
-            return self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['notes'].values[0]
+            return self._selected_row()['notes']
         else:
             # User selected New
             return None        
@@ -1275,7 +1483,7 @@ class SessionInputTableModel(ShinyInputTableModel):
     def __init_video_url(self):
         # provide initial value for the video url field of the input form
         if self._df_selected_id:
-            return self._db_table_model.df_raw[self._db_table_model.df_raw['id']==self._df_selected_id]['video_url'].values[0]
+            return self._selected_row()['video_url']
         else:
             # User selected New
             return None 
@@ -1294,6 +1502,69 @@ class SessionInputTableModel(ShinyInputTableModel):
             ui.input_select(id="guitar_id",label="Guitar Used *",choices=self.__guitar_lookup, selected=self.__init_guitar()).add_style('color:red;'), #REQUIRED FIELD
         ),
 
+    def _navigator_tools_ui(self):
+        return ui.input_file("import_file", None, accept=[".csv",".json"], button_label="Import...", placeholder="Sessions CSV/JSON", width="100%")
+
+    def _navigator_tools_server(self, input, output, session):
+        """
+        Import of practice sessions from a CSV/JSON file, previewed in a modal and inserted together when confirmed
+        """
+        df_import = reactive.value(pd.DataFrame())
+        df_preview = reactive.value(pd.DataFrame())
+        import_msg = reactive.value('')
+
+        @reactive.effect
+        @reactive.event(input.import_file)
+        def triggerImportFile():
+            file_info = input.import_file()[0]
+            try:
+                df_file = readSessionFile(file_info['datapath'], file_info['name'])
+                df_rows, df_rows_preview = prepareSessionImport(df_file, self._db_table_model.df_raw, self.__db_arrangement_model.df_raw, self.__arrangement_lookup, self.__guitar_lookup, self.__default_guitar_id)
+            except ValueError as error:
+                df_rows, df_rows_preview = pd.DataFrame(), pd.DataFrame()
+                import_msg.set(f"{file_info['name']} can't be imported: {error}")
+            else:
+                skipped = df_rows_preview.shape[0]-df_rows.shape[0]
+                import_msg.set(f"{df_rows.shape[0]} session(s) will be imported" + (f", {skipped} row(s) skipped (see Problem)" if skipped else ""))
+            df_import.set(df_rows)
+            df_preview.set(df_rows_preview)
+            ui.modal_show(ui.modal(
+                ui.output_text("import_summary"),
+                ui.output_data_frame("import_preview"),
+                ui.row(
+                    ui.column(4, ui.input_action_button("btn_import_cancel","Cancel",width="100%")),
+                    ui.column(4),
+                    ui.column(4, ui.input_action_button("btn_import_confirm", "Import", width="100%", disabled=self._db_table_model.isReadOnly() or df_rows.empty)),
+                ),
+                title=f"Import {self._title}s - Preview",
+                size="xl",
+                easy_close=True,
+                footer=None,
+            ))
+
+        @reactive.effect
+        @reactive.event(input.btn_import_confirm)
+        async def triggerImportConfirm():
+            req(not df_import().empty)
+            await self._db_table_model.insertManyAsync(df_import())
+            df_import.set(pd.DataFrame())
+            ui.modal_remove()
+            self._refreshSummaries()
+
+        @reactive.effect
+        @reactive.event(input.btn_import_cancel)
+        def triggerImportCancel():
+            df_import.set(pd.DataFrame())
+            ui.modal_remove()
+
+        @render.text
+        def import_summary():
+            return import_msg()
+
+        @render.data_frame
+        def import_preview():
+            return render.DataGrid(df_preview(), width="100%", height="400px")
+
     def server_call(self, input, output, session, summary_df):
         """
         Arrangement Modal Form Server code goes here
@@ -1307,7 +1578,7 @@ class SessionInputTableModel(ShinyInputTableModel):
 
             @reactive.effect
             @reactive.event(input.btn_input_form_submit, ignore_init=True, ignore_none=True)
-            def triggerInputFormSubmit():
+            async def triggerInputFormSubmit():
                 # Perform Data Validation and msg if issues
                 try:
                     req(input.session_date())
@@ -1324,55 +1595,12 @@ class SessionInputTableModel(ShinyInputTableModel):
 
                 # Data Validation Passed - Write database row
 
-                # Determine the Stage of progress:
-                # Binary Tree to speed up stage classification
-                #
-                #                        at_tempo_date
-                #                       /            \
-                #           off_book_date             play_ready_date
-                #          /            \             /              \
-                #     "Learning     "Achieving     "Phrasing"       "Maintenance"
-                #        Notes"        Tempo"
-
+                # Determine the Stage of progress (see classifyStages())
                 df_arrangements = self._SessionInputTableModel__db_arrangement_model.df_raw
                 arrangement_id = None if input.arrangement_id() == '' else input.arrangement_id()
-                ser_this_arrangement = df_arrangements[df_arrangements['id']==int(arrangement_id)].iloc[0]
                 session_date = input.session_date()
-                stage=''
-                if ser_this_arrangement['at_tempo_date']:
-                    if session_date>=ser_this_arrangement['at_tempo_date']:
-                        # Test against play_ready_date
-                        if ser_this_arrangement['play_ready_date']:
-                            if session_date>=ser_this_arrangement['play_ready_date']:
-                                stage='Maintenance'
-                            else:
-                                stage='Phrasing'
-                        else:
-                            stage='Phrasing'
-                    else:
-                        # session_date is < at_tempo_date.  test off_book_date
-                        if ser_this_arrangement['off_book_date']:
-                            if session_date>=ser_this_arrangement['off_book_date']:
-                                stage="Achieving Tempo"
-                            else:
-                                stage="Learning Notes"
-                        else:
-                            stage="Learning Notes"
-                else:
-                    #   test off_book_date
-                    if ser_this_arrangement['off_book_date']:
-                        if session_date>=ser_this_arrangement['off_book_date']:
-                            stage="Achieving Tempo"
-                        else:
-                            stage="Learning Notes"
-                    else:
-                        stage="Learning Notes"
-                    # at_tempo_date doesn't exist. Test off_book_date
+                stage = classifyStages([session_date], df_arrangements[df_arrangements['id']==int(arrangement_id)].iloc[:1])[0]
 
-
-                
-                                
-                
                 # Create single row as dataframe
                 df_row_to_database = pd.DataFrame({'id':[self._df_selected_id],
                                                 'session_date':[input.session_date()],
@@ -1383,13 +1611,16 @@ class SessionInputTableModel(ShinyInputTableModel):
                                                 'guitar_id':[input.guitar_id()],
                                                 'stage':[stage]})
                 if self._df_selected_id:
-                    self._db_table_model.update(df_row_to_database)
+                    if not await self._db_table_model.updateAsync(df_row_to_database):
+                        ui.modal_remove()
+                        return
                 else:
-                    self._db_table_model.insert(df_row_to_database)
+                    df_raw_session_before = self._db_table_model.df_raw
+                    await self._db_table_model.insertAsync(df_row_to_database)
+                    self._recordNewSession(df_raw_session_before, int(arrangement_id), session_date, int(input.duration()))
                 
                 ui.modal_remove()
-                self.processData()
-                summary_df.set(self.df_summary)
+                self._refreshSummaries()
            
             @reactive.effect
             @reactive.event(input.btn_input_cancel)
@@ -1404,3 +1635,29 @@ class SessionInputTableModel(ShinyInputTableModel):
 
         return input_form_func(self._namespace_id, summary_df)
 
+
+class RefreshGraph:
+    """
+    Dependency graph between the ShinyInputTableModels of the app, each depending on the models that own its lookup tables
+    """
+    def __init__(self, input_models:list):
+        owners = {id(input_model._db_table_model):input_model for input_model in input_models}
+        dependencies = {input_model:[owners[id(lookup_model)] for lookup_model in input_model._lookup_models if id(lookup_model) in owners] for input_model in input_models}
+        self.__order = list(TopologicalSorter(dependencies).static_order())
+        for input_model in input_models:
+            input_model._refresh_graph = self
+
+    def affected(self, db_model:database.DatabaseModel):
+        """
+        Returns the input models built from db_model's table, in the order they have to be recomputed
+        """
+        return [input_model for input_model in self.__order if input_model._db_table_model is db_model or any(lookup_model is db_model for lookup_model in input_model._lookup_models)]
+
+    def refresh(self, db_model:database.DatabaseModel):
+        """
+        Recomputes the models affected by a write to db_model's table and pushes their summaries to the table navigators
+        """
+        row_ids = db_model.takeWrittenIds() # taken first, so a write landing during processData() is in the next refresh's ids
+        for input_model in self.affected(db_model):
+            input_model._recomputeSummary(row_ids if input_model._db_table_model is db_model else None) # a lookup table's write can change any row
+            input_model._publishSummary()
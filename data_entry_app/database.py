@@ -1,83 +1,568 @@
 # Core
 import os
+import re
+import asyncio
+import datetime
+import hashlib
 #from dotenv import load_dotenv
 import pandas as pd
+import numpy as np
 from pathlib import Path
 
 # Data Integration
-from sqlalchemy import create_engine, select, insert, update, delete
+from sqlalchemy import create_engine, select, insert, update, delete, event, cast, func, literal, literal_column, union_all, bindparam, inspect, text
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.schema import Table
+from sqlalchemy.schema import Table, Column, MetaData
+from sqlalchemy.types import Integer, Date, Boolean, Text
 
 # App specific
 import orm
 
+# Every app imports this module first, so Copy-on-Write is switched on here for all of them.  df_raw must never be modified in place.
+pd.set_option("mode.copy_on_write", True)
+
 cwd = Path(__file__).parent
 db_path = cwd.joinpath('local_guitar_data.db')
+parquet_path = cwd.joinpath('local_guitar_data_parquet') # one <table name>.parquet file per table, written by database_backup/DB_WRITE.py --parquet
+
+def compactDtypes(model):
+    """
+    Builds a {column name: pandas dtype} mapping from the orm table model.  Integer and Boolean columns get nullable dtypes, Date columns datetime64, and a column can ask for its own through info={'dtype':...}.
+    """
+    dtypes = {}
+    for column in model.columns:
+        if 'dtype' in column.info:
+            dtypes[column.name] = column.info['dtype']
+        elif isinstance(column.type, Integer):
+            dtypes[column.name] = 'Int32'
+        elif isinstance(column.type, Boolean):
+            dtypes[column.name] = 'boolean'
+        elif isinstance(column.type, Date):
+            dtypes[column.name] = 'datetime64[ns]'
+    return dtypes
+
+def rowHash(model):
+    """
+    Builds a SQL expression (labelled row_hash) that md5 hashes every column of a row, the same way on PostgreSQL and SQLite
+    """
+    row_text = None
+    for column in model.columns:
+        if isinstance(column.type, (Integer, Boolean)):
+            value = cast(cast(column, Integer), Text)
+        else:
+            value = cast(column, Text)
+        value = func.coalesce(value, '\\N')
+        row_text = value if row_text is None else row_text+'|'+value
+    return func.md5(row_text).label('row_hash')
+
+# Change counter of each table, bumped by the triggers createTableVersions() adds, so readTableVersions() can tell a table changed without reading its rows
+table_version = Table(
+    'table_version',
+    MetaData(),
+    Column('table_name', Text, primary_key=True),
+    Column('version', Integer, nullable=False),
+    schema=orm.schema,
+)
 
+def createTableVersions(connection, models:list):
+    """
+    Creates table_version and the triggers that bump a table's version on every insert, update and delete: statement triggers on PostgreSQL, row triggers in the SQLite cache.  Safe to run again, and each run counts as a change to the tables, since the rows of a table the backup rewrites were written without its triggers.
+    """
+    table_version.create(connection, checkfirst=True)
+    postgres = connection.dialect.name=='postgresql'
+    version_name = f'"{orm.schema}".{table_version.name}' if postgres else table_version.name
+    if postgres:
+        connection.exec_driver_sql(f"""CREATE OR REPLACE FUNCTION "{orm.schema}".bump_table_version() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE {version_name} SET version = version+1 WHERE table_name = TG_TABLE_NAME;
+            RETURN NULL;
+        END $$""")
+    for model in models:
+        connection.exec_driver_sql(f"INSERT INTO {version_name}(table_name, version) VALUES ('{model.name}', 1) ON CONFLICT (table_name) DO UPDATE SET version = {table_version.name}.version+1")
+        if postgres:
+            connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {model.name}_version ON "{model.schema}"."{model.name}"')
+            connection.exec_driver_sql(f'CREATE TRIGGER {model.name}_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "{model.schema}"."{model.name}" FOR EACH STATEMENT EXECUTE FUNCTION "{orm.schema}".bump_table_version()')
+            continue
+        for operation in ['INSERT', 'UPDATE', 'DELETE']:
+            connection.exec_driver_sql(f"""CREATE TRIGGER IF NOT EXISTS {model.name}_version_{operation.lower()} AFTER {operation} ON {model.name} BEGIN
+                UPDATE {version_name} SET version = version+1 WHERE table_name = '{model.name}';
+            END""")
+
+notes_search_table = 'practice_session_notes' # FTS5 table indexing practice_session.notes in the SQLite cache (see createNotesSearchIndex())
+
+def notesVector(model):
+    """
+    The tsvector of a practice session's notes that the PostgreSQL full-text index is built on
+    """
+    return func.to_tsvector(literal_column("'english'::regconfig"), func.coalesce(model.c.notes, literal_column("''")))
+
+def createNotesSearchIndex(connection):
+    """
+    Creates the full-text index over practice session notes if it is missing: a GIN index on notesVector() on PostgreSQL, an FTS5 table kept in step by triggers in the SQLite cache.  Safe to run again.
+    """
+    model = orm.tbl_practice_session
+    if connection.dialect.name=='postgresql':
+        connection.exec_driver_sql(f"""CREATE INDEX IF NOT EXISTS ix_practice_session_notes_search ON "{model.schema}"."{model.name}" USING GIN (to_tsvector('english'::regconfig, coalesce(notes, '')))""")
+        return
+    connection.exec_driver_sql(f"CREATE VIRTUAL TABLE IF NOT EXISTS {notes_search_table} USING fts5(notes, content='{model.name}', content_rowid='id', tokenize='porter unicode61')")
+    connection.exec_driver_sql(f"""CREATE TRIGGER IF NOT EXISTS {notes_search_table}_insert AFTER INSERT ON {model.name} BEGIN
+        INSERT INTO {notes_search_table}(rowid, notes) VALUES (new.id, new.notes);
+    END""")
+    connection.exec_driver_sql(f"""CREATE TRIGGER IF NOT EXISTS {notes_search_table}_delete AFTER DELETE ON {model.name} BEGIN
+        INSERT INTO {notes_search_table}({notes_search_table}, rowid, notes) VALUES ('delete', old.id, old.notes);
+    END""")
+    connection.exec_driver_sql(f"""CREATE TRIGGER IF NOT EXISTS {notes_search_table}_update AFTER UPDATE OF id, notes ON {model.name} BEGIN
+        INSERT INTO {notes_search_table}({notes_search_table}, rowid, notes) VALUES ('delete', old.id, old.notes);
+        INSERT INTO {notes_search_table}(rowid, notes) VALUES (new.id, new.notes);
+    END""")
+    connection.exec_driver_sql(f"INSERT INTO {notes_search_table}({notes_search_table}) VALUES ('rebuild')")
+
+def configureSqliteConnection(dbapi_connection, connection_record):
+    """
+    Registers md5() for rowHash() on a new SQLite connection and turns off the sqlite3 driver's own transaction handling
+    """
+    dbapi_connection.create_function('md5', 1, lambda text: hashlib.md5(text.encode()).hexdigest(), deterministic=True)
+    dbapi_connection.isolation_level = None
+
+def enforceSqliteForeignKeys(dbapi_connection, connection_record):
+    """
+    Makes a SQLite connection check foreign keys, as PostgreSQL does
+    """
+    dbapi_connection.execute('PRAGMA foreign_keys = ON')
+
+def beginSqliteTransaction(connection):
+    """
+    Begins every SQLite transaction explicitly, so DDL is part of it and rolls back with it
+    """
+    connection.exec_driver_sql('BEGIN')
+
+def sqliteEngine(path=None, foreign_keys:bool=False):
+    """
+    Creates an engine for a SQLite file, the local cache (db_path) by default.  Tables are addressed without the pg_schema.
+    foreign_keys (bool): If True, every connection enforces the foreign keys declared in orm.py
+    """
+    engine = create_engine(f'sqlite:///{Path(path or db_path).resolve().as_posix()}')
+    event.listen(engine, 'connect', configureSqliteConnection)
+    if foreign_keys:
+        event.listen(engine, 'connect', enforceSqliteForeignKeys)
+    event.listen(engine, 'begin', beginSqliteTransaction)
+    return engine.execution_options(schema_translate_map={orm.schema:None})
 
 class DatabaseSession:
     """
-    This class manages the connection with PostgreSQL and contains the active database session and manages data transmission with the database.
+    This class manages the connection with PostgreSQL and contains the active database session and manages data transmission with the database.  Outside a snapshot (see beginSnapshot()) reads and writes each check out their own connection, so they can run on several threads at once.
     """
     __session=None
     __host=None
     __port=None
     __dbname=None
+    __compact_dtypes=False
+    __cache_format='sqlite'
+    __parquet_dir=None # set instead of __session when reading the Parquet cache
+    __snapshot_connection=None # connection holding the open snapshot transaction (see beginSnapshot())
+    __sqlite_path=None
+    __table_versions=False # True once table_version has been found (see readTableVersions())
 
-    def __init__(self, host:str=None, port:str=None, dbname:str=None):
+    def __init__(self, host:str=None, port:str=None, dbname:str=None, compact_dtypes:bool=False, cache_format:str='sqlite', sqlite_path=None):
+        """
+        compact_dtypes (bool): If True, readTable() converts each table to the dtypes declared by the orm model (see compactDtypes())
+        cache_format (str): local cache opened when no host is given, 'sqlite' or 'parquet'
+        sqlite_path (str|Path): SQLite file opened instead of db_path when no host is given
+        """
+        if cache_format not in ('sqlite', 'parquet'):
+            raise ValueError(f"Unknown cache format: {cache_format}")
         self.__host = host
         self.__port = port
         self.__dbname = dbname
+        self.__compact_dtypes = compact_dtypes
+        self.__cache_format = cache_format
+        self.__sqlite_path = sqlite_path
 
     def connect(self, user:str=None, password:str=None):
         if self.__host:
             connect_string = f'postgresql+psycopg2://{user}:{password}@{self.__host}:{self.__port}/{self.__dbname}'
+            engine = create_engine(connect_string)
+        elif self.__cache_format=='parquet':
+            print("variables.env not detected...  Loading local parquet cache")
+            self.__parquet_dir = parquet_path
+            return
         else:
             print("variables.env not detected...  Loading local sqllite datebase")
-            connect_string=f'sqlite:///{db_path.resolve().as_posix()}'
+            engine = sqliteEngine(self.__sqlite_path, foreign_keys=True) # the cache is written to like the live database, so it checks the same foreign keys
 
-        # Connect to db and establish session
-        engine = create_engine(connect_string)
+        # Establish session
 
         Session = sessionmaker(bind=engine)
         self.__session=Session()
 
-    def readTable(self, model):
+    def beginSnapshot(self, snapshot_id:str=None):
+        """
+        Opens a REPEATABLE READ transaction that every read of this session goes through until endSnapshot().  On PostgreSQL the snapshot id is returned, to pass to beginSnapshot() on other sessions; None on SQLite.
+        snapshot_id (str): id returned by another session's beginSnapshot() to join
+        """
+        self.__requireSql("beginSnapshot")
+        connection = self.__session.bind.connect()
+        if connection.dialect.name=='postgresql':
+            connection.execution_options(isolation_level='REPEATABLE READ')
+            connection.begin()
+            if snapshot_id:
+                if not re.fullmatch(r'[0-9A-Fa-f-]+', snapshot_id):
+                    raise ValueError(f"Invalid snapshot id: {snapshot_id}")
+                connection.exec_driver_sql(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'")
+            else:
+                snapshot_id = connection.exec_driver_sql("SELECT pg_export_snapshot()").scalar()
+        else:
+            connection.begin() # a SQLite read transaction already sees one consistent state of the file
+            snapshot_id = None
+        self.__snapshot_connection = connection
+        return snapshot_id
+
+    def endSnapshot(self):
+        """
+        Closes the transaction opened by beginSnapshot()
+        """
+        if self.__snapshot_connection is not None:
+            self.__snapshot_connection.rollback()
+            self.__snapshot_connection.close()
+            self.__snapshot_connection = None
+
+    def __readBind(self):
+        """
+        Returns the snapshot connection while a snapshot is open, otherwise the engine
+        """
+        if self.__snapshot_connection is not None:
+            return self.__snapshot_connection
+        return self.__session.bind
+
+    def __selectStatement(self, model, columns:list=None, date_range:tuple=None, id_set:tuple=None):
+        """
+        Builds the SELECT used by readTable() and readTableChunks()
+        """
+        if columns:
+            stmt = select(*[model.c[column] for column in columns])
+        else:
+            stmt = select(model)
+        if date_range:
+            date_column, start_date, end_date = date_range
+            if start_date is not None:
+                stmt = stmt.where(model.c[date_column] >= start_date)
+            if end_date is not None:
+                stmt = stmt.where(model.c[date_column] <= end_date)
+        if id_set:
+            id_column, ids = id_set
+            stmt = stmt.where(model.c[id_column].in_([int(row_id) for row_id in ids]))
+        return stmt
+
+    def __parquetScanner(self, model, columns:list=None, date_range:tuple=None, id_set:tuple=None, batch_size:int=None):
+        """
+        Builds a pyarrow scanner over the table's Parquet file with the column list and filters pushed down to it
         """
-        Selects all data from the defined table model and returns as a pd.DataFrame"""
-        return pd.read_sql(select(model), self.__session.bind).copy()
+        import pyarrow.dataset as ds # only needed by the Parquet cache, so pyarrow stays optional for the SQL backends
+
+        row_filter = None
+        def addFilter(expression):
+            nonlocal row_filter
+            row_filter = expression if row_filter is None else row_filter & expression
+
+        if date_range:
+            date_column, start_date, end_date = date_range
+            if start_date is not None:
+                addFilter(ds.field(date_column) >= pd.Timestamp(start_date).date())
+            if end_date is not None:
+                addFilter(ds.field(date_column) <= pd.Timestamp(end_date).date())
+        if id_set:
+            id_column, ids = id_set
+            addFilter(ds.field(id_column).isin([int(row_id) for row_id in ids]))
 
-    def updateRecord(self, model, row_id, row_data):
+        scan_options = {'batch_size':batch_size} if batch_size else {}
+        dataset = ds.dataset(self.__parquet_dir.joinpath(f'{model.name}.parquet'), format='parquet')
+        return dataset.scanner(columns=columns or [column.name for column in model.columns], filter=row_filter, **scan_options)
+
+    def __applyDtypes(self, model, df):
+        if self.__compact_dtypes:
+            df = df.astype({column:dtype for column, dtype in compactDtypes(model).items() if column in df.columns})
+        return df
+
+    def readTable(self, model, columns:list=None, date_range:tuple=None, id_set:tuple=None):
         """
-        Given a single row dataframe, this will add a record to an existing table
+        Selects data from the defined table model and returns as a pd.DataFrame.  The optional arguments are pushed down to the database:
+        columns (list): names of the columns to select, every column if omitted
+        date_range (tuple): (column name, start date, end date), either date can be None
+        id_set (tuple): (column name, ids)
+        """
+        if self.__parquet_dir is not None:
+            df = self.__parquetScanner(model, columns, date_range, id_set).to_table().to_pandas()
+        else:
+            df = pd.read_sql(self.__selectStatement(model, columns, date_range, id_set), self.__readBind())
+        return self.__applyDtypes(model, df)
+
+    def readTableChunks(self, model, chunksize:int, columns:list=None, date_range:tuple=None, id_set:tuple=None):
+        """
+        Same as readTable() but yields pd.DataFrames of at most chunksize rows, streamed from a server-side cursor
+        """
+        if self.__parquet_dir is not None:
+            for batch in self.__parquetScanner(model, columns, date_range, id_set, chunksize).to_batches():
+                if batch.num_rows:
+                    yield self.__applyDtypes(model, batch.to_pandas())
+            return
+        stmt = self.__selectStatement(model, columns, date_range, id_set).execution_options(stream_results=True, max_row_buffer=chunksize)
+        if self.__snapshot_connection is not None:
+            for df in pd.read_sql(stmt, self.__snapshot_connection, chunksize=chunksize):
+                yield self.__applyDtypes(model, df)
+        else:
+            with self.__session.bind.connect() as connection:
+                for df in pd.read_sql(stmt, connection, chunksize=chunksize):
+                    yield self.__applyDtypes(model, df)
+
+    def readRowHashes(self, model):
+        """
+        Returns a pd.DataFrame of id and row_hash (see rowHash()) for every row of the table, ordered by id
+        """
+        self.__requireSql("readRowHashes")
+        stmt = select(model.c.id, rowHash(model)).order_by(model.c.id)
+        return pd.read_sql(stmt, self.__readBind())
+
+    def __requireSql(self, operation:str):
+        if self.__parquet_dir is not None:
+            raise NotImplementedError(f"{operation} isn't supported by the read only Parquet cache.  Use the SQLite cache or the live database.")
+
+    def readTableVersions(self, models:list):
+        """
+        Returns {table name: {'max_id', 'row_count', 'version'}} for every table in models, read in a single query without reading the rows.  version is kept by the triggers createTableVersions() adds.  A database without them gets readTableChecksums() instead.
+        """
+        if self.__parquet_dir is not None:
+            return {model.name:self.__parquetVersion(model) for model in models}
+        bind = self.__readBind()
+        if not self.__hasTableVersions(bind):
+            return self.readTableChecksums(models)
+        selects = [select(
+            literal(model.name).label('table_name'),
+            func.max(model.c.id).label('max_id'),
+            func.count().label('row_count'),
+            select(table_version.c.version).where(table_version.c.table_name==model.name).scalar_subquery().label('version'),
+        ).select_from(model) for model in models]
+        df = pd.read_sql(union_all(*selects), bind)
+        return {row.table_name:{'max_id':None if pd.isna(row.max_id) else int(row.max_id), 'row_count':int(row.row_count), 'version':None if pd.isna(row.version) else int(row.version)} for row in df.itertuples()}
+
+    def __hasTableVersions(self, bind):
+        if not self.__table_versions:
+            self.__table_versions = inspect(bind).has_table(table_version.name, schema=orm.schema if bind.dialect.name=='postgresql' else None)
+        return self.__table_versions
+
+    def readTableChecksums(self, models:list):
+        """
+        Returns {table name: {'max_id', 'row_count', 'checksum'}} for every table in models, read in a single query.  The checksum is an md5 over the row hashes, or the file size and modification time on the Parquet cache.  It reads every row, so it is only for comparing two copies of a table (see database_backup).
+        """
+        if self.__parquet_dir is not None:
+            return {model.name:self.__parquetVersion(model) for model in models}
+        bind = self.__readBind()
+        selects = []
+        for model in models:
+            rows = select(model.c.id, rowHash(model)).order_by(model.c.id).subquery()
+            if bind.dialect.name=='postgresql':
+                row_hashes = func.string_agg(rows.c.row_hash, aggregate_order_by(literal_column("''"), rows.c.id))
+            else:
+                row_hashes = func.group_concat(rows.c.row_hash, '') # SQLite concatenates in the order of the subquery
+            selects.append(select(
+                literal(model.name).label('table_name'),
+                func.max(rows.c.id).label('max_id'),
+                func.count().label('row_count'),
+                func.md5(func.coalesce(row_hashes, '')).label('checksum'),
+            ).select_from(rows))
+        df = pd.read_sql(union_all(*selects), bind)
+        return {row.table_name:{'max_id':None if pd.isna(row.max_id) else int(row.max_id), 'row_count':int(row.row_count), 'checksum':row.checksum} for row in df.itertuples()}
+
+    def __parquetVersion(self, model):
+        import pyarrow.parquet as pq
+        path = self.__parquet_dir.joinpath(f'{model.name}.parquet')
+        stat = path.stat()
+        return {'max_id':None, 'row_count':pq.ParquetFile(path).metadata.num_rows, 'checksum':f'{stat.st_size}-{stat.st_mtime_ns}'}
+
+    def explain(self, model, columns:list=None, date_range:tuple=None, id_set:tuple=None):
         """
+        Returns the query plan of the SELECT readTable() would run for these arguments as a list of lines.  Sequential scans are disabled while planning on PostgreSQL.
+        """
+        self.__requireSql("explain")
+        stmt = self.__selectStatement(model, columns, date_range, id_set)
+        with self.__session.bind.connect() as connection:
+            # The values are rendered into the SQL and the cache's schema translation applied by hand, since EXPLAIN has to be sent as plain text
+            sql = stmt.compile(dialect=connection.dialect, schema_translate_map=connection.get_execution_options().get('schema_translate_map'), render_schema_translate=True, compile_kwargs={'literal_binds':True})
+            if connection.dialect.name=='postgresql':
+                connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+                rows = connection.exec_driver_sql(f"EXPLAIN {sql}").all()
+            else:
+                rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+        return [row[-1] for row in rows] # PostgreSQL returns one column of plan text, SQLite puts the detail last
+
+    def searchNotes(self, query:str, limit:int=None):
+        """
+        Returns the ids of the practice sessions whose notes match every word of query, best match first, at most limit of them.  Falls back to LIKE on a SQLite cache without the notes index.
+        """
+        self.__requireSql("searchNotes")
+        words = re.findall(r'\w+', query)
+        if not words:
+            return []
+        model = orm.tbl_practice_session
+        bind = self.__readBind()
+        if bind.dialect.name=='postgresql':
+            ts_query = func.plainto_tsquery(literal_column("'english'::regconfig"), ' '.join(words))
+            stmt = select(model.c.id).where(notesVector(model).op('@@')(ts_query)).order_by(func.ts_rank(notesVector(model), ts_query).desc(), model.c.session_date.desc())
+        elif not inspect(bind).has_table(notes_search_table):
+            stmt = select(model.c.id).where(*[model.c.notes.icontains(word, autoescape=True) for word in words]).order_by(model.c.session_date.desc())
+        else:
+            stmt = select(literal_column('rowid').label('id')).select_from(text(notes_search_table)).where(text(f"{notes_search_table} MATCH :match")).order_by(literal_column('rank'))
+            stmt = stmt.params(match=' '.join(f'"{word}"' for word in words)) # quoted, so words like AND/NOT/NEAR aren't read as operators
+        if limit:
+            stmt = stmt.limit(limit)
+        return pd.read_sql(stmt, bind)['id'].tolist()
+
+    def getEngine(self):
+        """
+        Returns the SQLAlchemy engine of the connected database
+        """
+        self.__requireSql("getEngine")
+        return self.__session.bind
+
+    def updateRecord(self, model, row_id, row_data, exclusive_flag:str=None):
+        """
+        Given a single row dataframe, this will add a record to an existing table.  If exclusive_flag names a Boolean column, the record takes it from every other record (see exclusiveFlag()).
+        """
+        self.__requireSql("updateRecord")
         row_id = int(row_id)
-        stmt = update(model).where(model.c.id == row_id).values(row_data)
-        self.__session.execute(stmt)
-        self.__session.commit()
+        with self.__session.bind.begin() as connection:
+            if row_data:
+                connection.execute(update(model).where(model.c.id == row_id).values(row_data))
+            if exclusive_flag:
+                connection.execute(exclusiveFlag(model, exclusive_flag, row_id))
+
+    def updateRecords(self, model, rows:list):
+        """
+        Updates several records in one transaction.  rows is a list of {column: value} dicts that each hold the id and the same columns.
+        """
+        self.__requireSql("updateRecords")
+        columns = [column for column in rows[0] if column!='id']
+        stmt = update(model).where(model.c.id == bindparam('row_id')).values({column:bindparam(f'new_{column}') for column in columns}) # the bind names can't be the column names themselves
+        with self.__session.bind.begin() as connection:
+            connection.execute(stmt, [{'row_id':int(row['id']), **{f'new_{column}':row[column] for column in columns}} for row in rows])
 
-    def insertRecord(self, model, row_data):
+    def insertRecord(self, model, row_data, exclusive_flag:str=None):
         """
-        Given a single row dataframe, this will add a record to an existing table
+        Given a single row dataframe, this will add a record to an existing table and return its generated id.  exclusive_flag works as in updateRecord().
         """
-        stmt = insert(model).values(row_data)
-        self.__session.execute(stmt)
-        self.__session.commit()
+        self.__requireSql("insertRecord")
+        stmt = insert(model).values(row_data).returning(model.c.id)
+        with self.__session.bind.begin() as connection:
+            row_id = connection.execute(stmt).scalar_one()
+            if exclusive_flag:
+                connection.execute(exclusiveFlag(model, exclusive_flag, row_id))
+            return row_id
+
+    def insertRecords(self, model, rows:list):
+        """
+        Inserts several records in one transaction and returns their generated ids in the order of rows
+        """
+        self.__requireSql("insertRecords")
+        stmt = insert(model).returning(model.c.id, sort_by_parameter_order=True)
+        with self.__session.bind.begin() as connection:
+            return connection.execute(stmt, rows).scalars().all()
 
     def deleteRecord(self, model, row_id):
-        stmt = delete(model).where(model.c.id == row_id)
-        self.__session.execute(stmt)
-        self.__session.commit()
+        self.__requireSql("deleteRecord")
+        stmt = delete(model).where(model.c.id == int(row_id))
+        with self.__session.bind.begin() as connection:
+            connection.execute(stmt)
+
+def exclusiveFlag(model, column:str, row_id):
+    """
+    UPDATE that sets a Boolean column (e.g. guitar.default_guitar) on one record and clears it on every other
+    """
+    return update(model).values({column:model.c.id == int(row_id)})
+
+def rowData(row):
+    """
+    Turns a row (pd.Series) into a {column: value} dict of plain python values, with missing values as None
+    """
+    row_data = {}
+    for key, value in row.items():
+        if not isinstance(value, (list, tuple, dict)) and pd.isna(value):
+            value = None
+        elif isinstance(value, np.generic):
+            value = value.item()
+        row_data[key] = value
+    return row_data
+
+def coerceRow(model, row_data:dict):
+    """
+    Converts form values to the python types of the orm model's columns.  An empty string in an Integer column becomes None.
+    """
+    coerced = {}
+    for key, value in row_data.items():
+        column_type = model.c[key].type
+        if value is None:
+            pass
+        elif isinstance(column_type, Integer):
+            value = None if value=='' else int(value)
+        elif isinstance(column_type, Boolean):
+            value = bool(value)
+        elif isinstance(column_type, Date):
+            if isinstance(value, str):
+                value = datetime.date.fromisoformat(value) if value else None
+            elif isinstance(value, datetime.datetime):
+                value = value.date()
+        coerced[key] = value
+    return coerced
+
+def changedColumns(model, row_data:dict, cached_row:dict):
+    """
+    Returns the part of row_data, coerced by coerceRow(), whose values differ from cached_row.  An empty Text value and NULL count as equal.
+    """
+    row_data = coerceRow(model, row_data)
+    cached_row = coerceRow(model, {key:None if pd.isna(value) else value for key, value in cached_row.items() if key in row_data})
+    def comparable(key, value):
+        return None if value=='' and isinstance(model.c[key].type, Text) else value
+    return {key:value for key, value in row_data.items() if key not in cached_row or comparable(key, value)!=comparable(key, cached_row[key])}
 
 class DatabaseModel:
     __session = None
     __orm = None
     __read_only_acct=False
+    __columns = None
+    __date_range = None
+    __id_set = None
+    __track_version = False
+    __version = None # table version when df_raw was read (see isStale())
+    __journal = None # write journal that insert(), update() and delete() go through (see useJournal())
+    __rows = (None, None) # (df_raw the index was built from, pd.Index of its ids), see getRow()
+    __written_ids = None # ids of the rows journaled writes changed in df_raw, see takeWrittenIds()
     df_raw = None
-    def __init__(self, orm_model: Table, db_session: DatabaseSession):
+    def __init__(self, orm_model: Table, db_session: DatabaseSession, columns:list=None, date_range:tuple=None, id_set:tuple=None, track_version:bool=False):
+        """
+        columns, date_range and id_set restrict what read() pulls into df_raw (see DatabaseSession.readTable())
+        track_version (bool): If True, every read() also reads the table's version for isStale()
+        """
         self.__session = db_session
         self.__orm = orm_model
+        self.__columns = columns
+        self.__date_range = date_range
+        self.__id_set = id_set
+        self.__track_version = track_version
+
+    def getRow(self, row_id):
+        """
+        Returns the df_raw row with this id as a {column: value} dict, or None if there isn't one
+        """
+        df, ids = self.__rows
+        if df is not self.df_raw:
+            df = self.df_raw
+            ids = pd.Index(df['id'])
+            self.__rows = (df, ids) # stored with the frame it was built from
+        try:
+            position = ids.get_loc(row_id)
+        except (KeyError, TypeError):
+            real_id = self.__journal.realId(row_id) if self.__journal is not None else None # a flushed insert still selected by its temporary id
+            return None if real_id is None else self.getRow(real_id)
+        return df.iloc[position].to_dict()
 
     def connect(self, user:str, pw:str, read_only_acct:bool):
         self.__session.connect(user, pw)
@@ -86,30 +571,168 @@ class DatabaseModel:
 
     def read(self):
         """
-        Performs the equivelant of a SELECT * operation from the database based on the model provided and stores the result in public df_raw class attribute
+        Performs the equivelant of a SELECT * operation from the database based on the model provided and stores the result in public df_raw class attribute.  The SELECT is narrowed by any columns, date_range or id_set given to the constructor.
         """
-        self.df_raw = self.__session.readTable(self.__orm)
+        if self.__track_version:
+            self.__version = self.__session.readTableVersions([self.__orm])[self.__orm.name] # taken first, so a write that lands during the read makes the model stale rather than being missed
+        if self.__journal is None:
+            self.df_raw = self.__session.readTable(self.__orm, self.__columns, self.__date_range, self.__id_set)
+            return
+        entries = self.__journal.pending(self.__orm) # taken before the read, so a write flushed during it isn't missed
+        df = self.__session.readTable(self.__orm, self.__columns, self.__date_range, self.__id_set)
+        with self.__journal.lock:
+            self.df_raw = self.__journal.apply(df, entries)
+            self.__written_ids = None
 
+    def isStale(self):
+        """
+        Returns True if the table has changed in the database since df_raw was last read.  Needs a model created with track_version=True.
+        """
+        if not self.__track_version:
+            raise ValueError(f"isStale() needs a DatabaseModel of {self.__orm.name} created with track_version=True")
+        return self.__session.readTableVersions([self.__orm])[self.__orm.name]!=self.__version
+
+
+    def useJournal(self, journal):
+        """
+        Sends insert(), update() and delete() through a write journal (see write_journal.py) instead of writing to the database directly
+        """
+        self.__journal = journal
+        journal.register(self)
+        if self.df_raw is not None:
+            with journal.lock:
+                self.df_raw = journal.apply(self.df_raw, journal.pending(self.__orm))
 
-    def update(self, df_row):
+    def reconcileIds(self, id_map:dict):
+        """
+        Replaces temporary ids of journaled inserts ({temporary id: id}) in the id and foreign key columns of df_raw.  Returns True if there were any.
+        """
+        columns = [column for column in ['id']+[column.name for column in self.__orm.columns if column.foreign_keys] if column in self.df_raw.columns]
+        if not self.df_raw[columns].isin(list(id_map)).any(axis=None):
+            return False
+        self.df_raw = self.df_raw.assign(**{column:self.df_raw[column].replace(id_map) for column in columns})
+        self.__written_ids = None
+        return True
+
+    def takeWrittenIds(self):
+        """
+        Returns the set of ids of the rows journaled writes changed in df_raw since the last call, or None if df_raw may have changed anywhere (it was read, had ids reconciled, took a write with an exclusive flag, or the model writes without a journal)
+        """
+        if self.__journal is None:
+            return None
+        with self.__journal.lock:
+            written_ids, self.__written_ids = self.__written_ids, set()
+        return written_ids
+
+    def __addWrittenIds(self, entry):
+        if entry['exclusive_flag']:
+            self.__written_ids = None
+        elif self.__written_ids is not None:
+            self.__written_ids.update(entry['row_id'] if isinstance(entry['row_id'], list) else [entry['row_id']])
+
+    def __journalWrite(self, operation, row_id, row_data, exclusive_flag:str=None):
+        with self.__journal.lock:
+            entry = self.__journal.record(self.__orm, operation, row_id, row_data, exclusive_flag)
+            self.df_raw = self.__journal.apply(self.df_raw, [entry])
+            self.__addWrittenIds(entry)
+        return entry['row_id']
+
+    def update(self, df_row, exclusive_flag:str=None):
+        """
+        Updates the record of the single row dataframe with only the columns that differ from its row in df_raw, and returns them ({} if nothing changed).
+        exclusive_flag (str): Boolean column the record takes from every other record (see exclusiveFlag())
+        """
         row = df_row.iloc[0]
         row_id = row['id']
-        row = row.drop('id',errors='ignore')
-        row_data = {key:value for key, value in zip(row.keys(), row.values)}
-        self.__session.updateRecord(self.__orm, row_id, row_data)
+        row_data = rowData(row.drop('id',errors='ignore'))
+        cached_row = self.getRow(row_id)
+        if cached_row is not None:
+            row_data = changedColumns(self.__orm, row_data, cached_row)
+        if exclusive_flag:
+            row_data.pop(exclusive_flag, None)
+            if cached_row is not None and (self.df_raw[exclusive_flag].fillna(False).astype(bool)==(self.df_raw['id']==int(row_id))).all():
+                exclusive_flag = None
+        if cached_row is not None and not row_data and not exclusive_flag:
+            return {}
+        if self.__journal is not None:
+            self.__journalWrite('update', row_id, row_data, exclusive_flag)
+        else:
+            self.__session.updateRecord(self.__orm, row_id, row_data, exclusive_flag)
+            self.read()
+        return {**row_data, exclusive_flag:True} if exclusive_flag else row_data
+
+    def updateMany(self, df_rows):
+        """
+        Updates every row of df_rows (the id plus the columns to change) in one transaction followed by a single re-read
+        """
+        rows = [rowData(row) for _, row in df_rows.iterrows()]
+        if not rows:
+            return
+        if self.__journal is not None:
+            with self.__journal.lock:
+                entries = [self.__journal.record(self.__orm, 'update', row.pop('id'), row) for row in rows]
+                self.df_raw = self.__journal.apply(self.df_raw, entries)
+                for entry in entries:
+                    self.__addWrittenIds(entry)
+            return
+        self.__session.updateRecords(self.__orm, rows)
         self.read()
 
-    def insert(self, df_row):
+    def insert(self, df_row, exclusive_flag:str=None):
+        """
+        Inserts the single row dataframe and returns the id generated for it, a temporary negative one with a write journal.  exclusive_flag works as in update().
+        """
         row = df_row.iloc[0]
         row = row.drop('id',errors='ignore')
-        row_data = {key:value for key, value in zip(row.keys(), row.values)}
-        self.__session.insertRecord(self.__orm, row_data)
+        if self.__journal is not None:
+            return self.__journalWrite('insert', None, rowData(row), exclusive_flag)
+        row_id = self.__session.insertRecord(self.__orm, rowData(row), exclusive_flag)
+        self.read()
+        return row_id
+
+    def insertMany(self, df_rows):
+        """
+        Inserts every row of df_rows in one transaction followed by a single re-read and returns their ids
+        """
+        rows = [rowData(row.drop('id',errors='ignore')) for _, row in df_rows.iterrows()]
+        if not rows:
+            return []
+        if self.__journal is not None:
+            return self.__journalWrite('insert_many', None, rows)
+        row_ids = self.__session.insertRecords(self.__orm, rows)
         self.read()
+        return row_ids
 
     def delete(self, df_row):
         row = df_row.iloc[0]
         row_id=row['id']
+        if self.__journal is not None:
+            self.__journalWrite('delete', row_id, {})
+            return
         self.__session.deleteRecord(self.__orm, row_id)
 
+    # Awaitable versions of the methods above, run on a worker thread (asyncio.to_thread)
+
+    async def connectAsync(self, user:str, pw:str, read_only_acct:bool):
+        await asyncio.to_thread(self.connect, user, pw, read_only_acct)
+
+    async def readAsync(self):
+        await asyncio.to_thread(self.read)
+
+    async def updateAsync(self, df_row, exclusive_flag:str=None):
+        return await asyncio.to_thread(self.update, df_row, exclusive_flag)
+
+    async def updateManyAsync(self, df_rows):
+        await asyncio.to_thread(self.updateMany, df_rows)
+
+    async def insertAsync(self, df_row, exclusive_flag:str=None):
+        return await asyncio.to_thread(self.insert, df_row, exclusive_flag)
+
+    async def insertManyAsync(self, df_rows):
+        return await asyncio.to_thread(self.insertMany, df_rows)
+
+    async def deleteAsync(self, df_row):
+        await asyncio.to_thread(self.delete, df_row)
+
     def isReadOnly(self):
         return self.__read_only_acct
@@ -0,0 +1,110 @@
+"""
+Times the form submit path of the data entry app (a DatabaseModel write followed by processData()) against a scratch copy of the local SQLite cache:
+
+    python submit_benchmark.py [number of submits]
+
+Reports the mean and worst time of an insert, an update and a delete of a practice session.
+"""
+# Core
+import sys
+import time
+import shutil
+import datetime
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+# App specific
+import orm
+import database
+from data_processing import SessionInputTableModel
+
+
+def build_models(db_session):
+    """
+    Builds and reads the models the Sessions form needs, wired together the same way as in app.py
+    """
+    models = {name:database.DatabaseModel(table, db_session) for name, table in [
+        ('artist', orm.tbl_artist), ('song', orm.tbl_song), ('arrangement', orm.tbl_arrangement),
+        ('session', orm.tbl_practice_session), ('guitar', orm.tbl_guitar)]}
+    for model in models.values():
+        model.connect(None, None, False)
+    session_input_table_model = SessionInputTableModel(namespace_id='session',
+                                                       title='Session',
+                                                       db_table_model=models['session'],
+                                                       db_arrangement_model=models['arrangement'],
+                                                       db_song_model=models['song'],
+                                                       db_artist_model=models['artist'],
+                                                       db_guitar_model=models['guitar'])
+    models['artist'].df_raw = models['artist'].df_raw.assign(last_name=models['artist'].df_raw['name'].str.split(' ').str[-1]) # normally added by ArtistInputTableModel.processData()
+    session_input_table_model.processData()
+    return models, session_input_table_model
+
+
+def timed(action, *args):
+    """
+    Runs action(*args) and returns (seconds taken, what action returned)
+    """
+    start = time.perf_counter()
+    result = action(*args)
+    return time.perf_counter()-start, result
+
+
+def run(submits:int):
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        scratch_path = Path(scratch_dir).joinpath('local_guitar_data.db')
+        shutil.copyfile(database.db_path, scratch_path)
+        models, session_input_table_model = build_models(database.DatabaseSession(sqlite_path=scratch_path))
+        session_model = models['session']
+
+        # Each submit does what the Sessions form's triggerInputFormSubmit does (a delete isn't offered by the form, so it gets an explicit re-read)
+        def insert(df_row):
+            row_id = session_model.insert(df_row)
+            session_input_table_model.processData()
+            return row_id
+
+        def update(df_row):
+            session_model.update(df_row)
+            session_input_table_model.processData()
+
+        def delete(df_row):
+            session_model.delete(df_row)
+            session_model.read()
+            session_input_table_model.processData()
+
+        arrangement_id = int(models['arrangement'].df_raw['id'].iloc[0])
+        guitar_id = int(models['guitar'].df_raw['id'].iloc[0])
+
+        timings = {'insert':[], 'update':[], 'delete':[]}
+        new_ids = []
+        for i in range(submits):
+            df_row = pd.DataFrame({'id':[None],
+                                   'session_date':[datetime.date.today()],
+                                   'duration':[30],
+                                   'l_arrangement_id':[arrangement_id],
+                                   'notes':[f'benchmark session {i}'],
+                                   'video_url':[''],
+                                   'guitar_id':[guitar_id],
+                                   'stage':['Learning Notes']})
+            elapsed, row_id = timed(insert, df_row)
+            timings['insert'].append(elapsed)
+            new_ids.append(row_id)
+
+        for row_id in new_ids:
+            df_row = session_model.df_raw[session_model.df_raw['id']==row_id].assign(notes='updated benchmark session')
+            elapsed, _ = timed(update, df_row)
+            timings['update'].append(elapsed)
+
+        for row_id in new_ids:
+            df_row = session_model.df_raw[session_model.df_raw['id']==row_id]
+            elapsed, _ = timed(delete, df_row)
+            timings['delete'].append(elapsed)
+
+    print(f"{'Submit':<10}{'Count':>8}{'Mean (ms)':>12}{'Max (ms)':>12}")
+    for action, elapsed in timings.items():
+        print(f"{action:<10}{len(elapsed):>8}{1000*sum(elapsed)/len(elapsed):>12.1f}{1000*max(elapsed):>12.1f}")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv)>1 else 50)
@@ -1,4 +1,7 @@
 # core
+import re
+import sys
+import bisect
 import pandas as pd
 from abc import ABC, abstractmethod
 
@@ -8,30 +11,186 @@ from shiny import module, reactive, render, ui, req
 # Web App Specific
 import data_processing
 
+def sortKey(values:pd.Series):
+    """
+    Sort key for a summary table column: 'Date' columns sort as dates, other text ignoring case
+    """
+    if 'Date' in str(values.name):
+        return pd.to_datetime(values, format="%m/%d/%Y", errors='coerce')
+    if values.dtype==object:
+        return values.where(values.isna(), values.astype(str).str.casefold())
+    return values
+
+def prefixEnd(prefix:str):
+    """
+    Smallest string after every string that starts with prefix (its last character incremented), None if there isn't one
+    """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    return prefix[:-1]+chr(ord(prefix[-1])+1) if prefix else None
+
+class SearchIndex:
+    """
+    Token index over the text columns of a summary table, mapping every word to the ids of the rows it appears in
+    """
+    __token_pattern = r'\w+'
+
+    def __init__(self):
+        self.__postings = {} # token: set of row ids
+        self.__row_tokens = {} # row id: set of tokens
+        self.__tokens = [] # sorted keys of __postings
+        self.__text = pd.Series(dtype=object) # indexed text of each row, indexed by row id
+        self.__source = None # df_summary the index is up to date with
+
+    def __rowText(self, df_summary:pd.DataFrame):
+        columns = [column for column in df_summary.columns if df_summary[column].dtype==object and 'link' not in column.lower() and 'url' not in column.lower()]
+        text = df_summary[columns].fillna('').astype(str)
+        text = text[columns[0]].str.cat([text[column] for column in columns[1:]], sep=' ') if columns else pd.Series('', index=df_summary.index)
+        text.index = df_summary['id']
+        return text
+
+    def update(self, df_summary:pd.DataFrame, previous_summary:pd.DataFrame=None, row_ids:set=None):
+        """
+        Re-tokenizes the rows of df_summary that were added or changed since the last summary indexed
+        previous_summary (pd.DataFrame): summary df_summary was recomputed from (see ShinyInputTableModel.summaryChange())
+        row_ids (set): ids of the only rows that differ from previous_summary.  If the index is up to date with previous_summary, only these rows are re-tokenized.
+        """
+        if df_summary is self.__source:
+            return
+        if row_ids is not None and previous_summary is not None and previous_summary is self.__source:
+            self.__updateRows(df_summary, row_ids)
+            return
+        text = self.__rowText(df_summary)
+        old_text = self.__text.reindex(text.index)
+        changed = text[old_text.isna() | (old_text!=text)]
+        removed = self.__text.index.difference(text.index)
+
+        tokens_changed = False
+        for row_id in removed:
+            tokens_changed |= bool(self.__removeRow(row_id))
+        for row_id, tokens in zip(changed.index, changed.str.casefold().str.findall(self.__token_pattern)):
+            tokens_changed |= bool(self.__removeRow(row_id))
+            tokens_changed |= bool(self.__addRow(row_id, tokens))
+        if tokens_changed:
+            self.__tokens = sorted(self.__postings)
+        self.__text = text
+        self.__source = df_summary
+
+    def __updateRows(self, df_summary:pd.DataFrame, row_ids:set):
+        """
+        Re-tokenizes just the rows of row_ids, keeping __tokens sorted as tokens come and go
+        """
+        text = self.__rowText(df_summary[df_summary['id'].isin(row_ids)])
+        removed = [row_id for row_id in row_ids if row_id in self.__row_tokens and row_id not in text.index]
+        for row_id in removed:
+            self.__dropTokens(self.__removeRow(row_id))
+        for row_id, tokens in zip(text.index, text.str.casefold().str.findall(self.__token_pattern)):
+            self.__dropTokens(self.__removeRow(row_id))
+            for token in self.__addRow(row_id, tokens):
+                bisect.insort(self.__tokens, token)
+        self.__text = pd.concat([self.__text[~self.__text.index.isin(list(row_ids))], text])
+        self.__source = df_summary
+
+    def __addRow(self, row_id, tokens:list):
+        """
+        Indexes a row's tokens and returns those new to the index
+        """
+        self.__row_tokens[row_id] = set(tokens)
+        new_tokens = [token for token in self.__row_tokens[row_id] if token not in self.__postings]
+        for token in self.__row_tokens[row_id]:
+            self.__postings.setdefault(token, set()).add(row_id)
+        return new_tokens
+
+    def __removeRow(self, row_id):
+        """
+        Takes a row out of the index and returns the tokens no row has any more
+        """
+        dropped_tokens = []
+        for token in self.__row_tokens.pop(row_id, ()):
+            row_ids = self.__postings[token]
+            row_ids.discard(row_id)
+            if not row_ids:
+                del self.__postings[token]
+                dropped_tokens.append(token)
+        return dropped_tokens
+
+    def __dropTokens(self, tokens:list):
+        for token in tokens:
+            del self.__tokens[bisect.bisect_left(self.__tokens, token)]
+
+    def search(self, query:str):
+        """
+        Returns the set of ids of the rows with a word beginning with each word of query (ignoring case), or None for an empty query
+        """
+        terms = re.findall(self.__token_pattern, query.casefold())
+        if not terms:
+            return None
+        row_ids = None
+        for term in sorted(set(terms), key=len, reverse=True): # longest terms first, they match the fewest rows
+            start = bisect.bisect_left(self.__tokens, term)
+            term_end = prefixEnd(term)
+            end = len(self.__tokens) if term_end is None else bisect.bisect_left(self.__tokens, term_end, lo=start)
+            postings = [self.__postings[token] for token in self.__tokens[start:end]]
+            if row_ids is None:
+                row_ids = set().union(*postings)
+            else:
+                row_ids = set().union(*(row_ids & token_ids for token_ids in postings)) # each intersection costs the smaller of the two sets
+            if not row_ids:
+                break
+        return row_ids
+
 class ShinyFormTemplate:
     _namespace_id = None
     _form_data=None
+    _page_size=None
     __server_executed=False
     
-    def __init__(self, namespace_id:str, form_data:data_processing.ShinyInputTableModel):
+    def __init__(self, namespace_id:str, form_data:data_processing.ShinyInputTableModel, page_size:int=None):
         """
         _namespace_id (str):            This is the id value of the namespace that the form's shiny module will use.  It will prefix the id value of every applicable component on the DOM
         _df_form_data (pd.DataFrame):   This is the dataframe that can either be used to populate the form data as it would be 
-
+        _page_size (int):               Rows per page of the summary table, which is then filtered, sorted and paged on the server.  If None the whole df_summary is sent to the DataGrid.
         """
         self._namespace_id=namespace_id
         self._form_data=form_data
+        self._page_size=page_size
+        self._search_index=SearchIndex() # shared by every session's navigator of this table
+
+    def __grid_controls_ui(self):
+        """
+        Search box above the summary table, with the sort controls of a paged one
+        """
+        if not self._page_size:
+            return ui.row(ui.column(12, ui.input_text("grid_search", None, placeholder="Search", width="100%")))
+        sort_choices = {'':'(Default order)'}
+        sort_choices.update({column:column for column in self._form_data.df_summary.columns if column!='id'})
+        return ui.row(
+            ui.column(6, ui.input_text("grid_search", None, placeholder="Search", width="100%")),
+            ui.column(4, ui.input_select("grid_sort", None, choices=sort_choices, width="100%")),
+            ui.column(2, ui.input_checkbox("grid_sort_desc", "Descending")),
+        )
+
+    def __grid_pager_ui(self):
+        """
+        Page buttons below a paged summary table
+        """
+        return ui.row(
+            ui.column(4, ui.input_action_button("btn_page_prev", "Previous", width="100%")),
+            ui.column(4, ui.output_text("grid_page_text")).add_style("text-align: center;"),
+            ui.column(4, ui.input_action_button("btn_page_next", "Next", width="100%")),
+        )
 
     def ui_call(self):
         @module.ui
         def nav_ui():
             return ui.row(
                 ui.row(ui.column(4, ui.div(id=f"{self._namespace_id}_btn_update_placeholder")),
-                    ui.column(4),
+                    ui.column(4, self._form_data._navigator_tools_ui()),
                     ui.column(4, ui.input_action_button(
                         "btn_new", "New", width="100%")),
                     ),
+                self.__grid_controls_ui(),
                 ui.output_data_frame("summary_table"),
+                self.__grid_pager_ui() if self._page_size else None,
                 ui.div(id=f"{self._namespace_id}_modal_ui_placeholder")
             )
         return nav_ui(self._namespace_id)
@@ -43,18 +202,76 @@ class ShinyFormTemplate:
             updateButtonVisible = reactive.value(False)
             df_selected_row = reactive.value(pd.DataFrame()) # Single Row dataframe of the selected row in the summary table
             df_selected_id=reactive.value(None) # id value of the selected row
-            df_summary=reactive.value(self._form_data.df_summary.copy()) # This reactive is updated upon completion of input form modal to refresh the navigator window with newly adjusted data
+            df_summary=reactive.value(self._form_data.df_summary) # This reactive is updated upon completion of input form modal to refresh the navigator window with newly adjusted data
+            self._form_data.addSummaryListener(df_summary) # set whenever a write recomputes this table's summary
+            session.on_ended(lambda: self._form_data.removeSummaryListener(df_summary))
+            self._form_data._navigator_tools_server(input, output, session)
 
             ## Renders the summary dataframe for the nav_panel
             @render.data_frame
             def summary_table():
                 return render.DataGrid(
-                df_summary(),
+                df_grid() if self._page_size is None else df_page(),
                 width="100%",
                 height="100%",
                 selection_mode="row"
             )
 
+            ## Search (see SearchIndex), and in paged mode sort and page df_summary on the server
+            page_number = reactive.value(0)
+            df_page = reactive.value(pd.DataFrame()) # the rows on the current page, the only part of df_summary sent to the browser
+
+            @reactive.calc
+            def df_grid():
+                df = df_summary()
+                self._search_index.update(df, *self._form_data.summaryChange(df))
+                row_ids = self._search_index.search(input.grid_search())
+                if row_ids is not None:
+                    df = df[df['id'].isin(row_ids)]
+                if self._page_size is None:
+                    return df
+                if input.grid_sort():
+                    df = df.sort_values(input.grid_sort(), ascending=not input.grid_sort_desc(), key=sortKey, na_position='last', kind='stable')
+                return df
+
+            @reactive.effect
+            @reactive.event(lambda: (input.grid_search(), input.grid_sort(), input.grid_sort_desc()) if self._page_size else None)
+            def resetPage():
+                page_number.set(0)
+
+            @reactive.effect
+            @reactive.event(input.btn_page_prev)
+            def triggerPagePrev():
+                page_number.set(max(page_number.get()-1, 0))
+
+            @reactive.effect
+            @reactive.event(input.btn_page_next)
+            def triggerPageNext():
+                if (page_number.get()+1)*self._page_size<df_grid().shape[0]:
+                    page_number.set(page_number.get()+1)
+
+            @reactive.effect
+            def setPage():
+                req(self._page_size)
+                df = df_grid()
+                last_page = max((df.shape[0]-1)//self._page_size, 0)
+                start = min(page_number(), last_page)*self._page_size
+                df_window = df.iloc[start:start+self._page_size]
+                # a write that doesn't touch the visible rows doesn't re-send the page
+                with reactive.isolate():
+                    if df_window.equals(df_page()):
+                        return
+                df_page.set(df_window)
+
+            @render.text
+            def grid_page_text():
+                req(self._page_size)
+                rows = df_grid().shape[0]
+                if rows==0:
+                    return "No rows"
+                start = min(page_number(), (rows-1)//self._page_size)*self._page_size
+                return f"Rows {start+1}-{min(start+self._page_size, rows)} of {rows}"
+
             ## Stores the ID of the selected table row in reactive val
             @reactive.effect
             @reactive.event(df_selected_row)
@@ -101,7 +318,7 @@ class ShinyFormTemplate:
             @reactive.effect
             def insert_update_button():
                 data_selected = summary_table.data_view(selected=True) 
-                df_selected_row.set(data_selected.copy())
+                df_selected_row.set(data_selected)
                 req(not (data_selected.empty or updateButtonVisible.get()))
                 ui.insert_ui(
                     ui.input_action_button("btn_update",
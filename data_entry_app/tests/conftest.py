@@ -0,0 +1,22 @@
+# Core
+import sys
+import shutil
+from pathlib import Path
+
+import pytest
+
+app_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(app_dir)) # the app's modules import each other by name
+
+import database
+
+@pytest.fixture
+def db_session(tmp_path):
+    """
+    DatabaseSession connected to a scratch copy of the local cache, so tests can write to it
+    """
+    sqlite_path = tmp_path.joinpath('live.db')
+    shutil.copyfile(app_dir.joinpath('local_guitar_data.db'), sqlite_path)
+    session = database.DatabaseSession(sqlite_path=sqlite_path)
+    session.connect()
+    return session
@@ -0,0 +1,56 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+import orm
+import database
+from database import coerceRow, changedColumns
+
+def test_coerce_row_converts_form_text():
+    row_data = coerceRow(orm.tbl_practice_session, {'session_date':'2024-09-05', 'duration':'45', 'guitar_id':'', 'notes':'', 'video_url':None})
+    assert row_data=={'session_date':datetime.date(2024, 9, 5), 'duration':45, 'guitar_id':None, 'notes':'', 'video_url':None}
+    assert coerceRow(orm.tbl_arrangement, {'off_book_date':'', 'at_tempo_date':pd.Timestamp('2024-09-10 13:30')})=={'off_book_date':None, 'at_tempo_date':datetime.date(2024, 9, 10)}
+    assert coerceRow(orm.tbl_guitar, {'default_guitar':1})=={'default_guitar':True}
+
+def test_unchanged_form_values_are_not_changes():
+    cached_row = {'id':np.int64(4), 'session_date':pd.Timestamp('2024-09-05'), 'duration':np.int64(42), 'guitar_id':np.int64(1), 'l_arrangement_id':np.int64(1), 'notes':None, 'video_url':'', 'stage':'Achieving Tempo'}
+    row_data = {'session_date':'2024-09-05', 'duration':'42', 'guitar_id':'1', 'l_arrangement_id':1, 'notes':'', 'video_url':None, 'stage':'Achieving Tempo'}
+    assert changedColumns(orm.tbl_practice_session, row_data, cached_row)=={}
+
+def test_changed_values_are_returned_coerced():
+    cached_row = {'id':4, 'session_date':pd.Timestamp('2024-09-05'), 'duration':42, 'notes':np.nan, 'guitar_id':1}
+    row_data = {'session_date':'2024-09-06', 'duration':'42', 'notes':'scales', 'guitar_id':'4', 'stage':'Phrasing'}
+    assert changedColumns(orm.tbl_practice_session, row_data, cached_row)=={'session_date':datetime.date(2024, 9, 6), 'notes':'scales', 'guitar_id':4, 'stage':'Phrasing'}
+
+def test_clearing_an_integer_column_is_a_change():
+    assert changedColumns(orm.tbl_song, {'style_id':''}, {'style_id':2})=={'style_id':None}
+    assert changedColumns(orm.tbl_song, {'style_id':''}, {'style_id':np.nan})=={}
+
+def test_update_that_changes_nothing_is_skipped(db_session):
+    sessions = database.DatabaseModel(orm.tbl_practice_session, db_session)
+    sessions.read()
+    df_raw = sessions.df_raw
+    df_row = df_raw[df_raw['id']==4].astype(object)
+    assert sessions.update(df_row)=={}
+    assert sessions.df_raw is df_raw # not re-read
+    df_row = df_row.assign(duration=50)
+    assert sessions.update(df_row)=={'duration':50}
+    assert sessions.getRow(4)['duration']==50
+
+def test_staleness_follows_the_table_version(db_session):
+    with db_session.getEngine().begin() as connection:
+        database.createTableVersions(connection, [orm.tbl_practice_session, orm.tbl_guitar])
+    sessions = database.DatabaseModel(orm.tbl_practice_session, db_session, track_version=True)
+    sessions.read()
+    assert 'version' in db_session.readTableVersions([orm.tbl_practice_session])['practice_session']
+    assert not sessions.isStale()
+    guitars = database.DatabaseModel(orm.tbl_guitar, db_session)
+    guitars.read()
+    guitars.update(guitars.df_raw.iloc[[0]].astype(object).assign(about='Renamed'))
+    assert not sessions.isStale() # another table's write
+    with db_session.getEngine().begin() as connection:
+        connection.execute(orm.tbl_practice_session.update().where(orm.tbl_practice_session.c.id==4).values(duration=51)) # same row count and max id
+    assert sessions.isStale()
+    sessions.read()
+    assert not sessions.isStale()
@@ -0,0 +1,37 @@
+import pandas as pd
+
+from table_navigator import SearchIndex, prefixEnd
+
+def summary(rows):
+    return pd.DataFrame(rows, columns=['id', 'Title', 'Composer', 'Sheet Music Link'])
+
+def test_written_rows_are_reindexed_alone():
+    df_before = summary([[1, 'Lagrima', 'Tárrega', 'http://lagrima'], [2, 'Adelita', 'Tárrega', None], [3, 'Study in E Minor', 'Tárrega', None]])
+    index = SearchIndex()
+    index.update(df_before)
+    assert index.search('tár')=={1, 2, 3}
+    assert index.search('http')==set() # link columns aren't indexed
+
+    df_after = summary([[1, 'Lagrima', 'Tárrega', None], [3, 'Study in E Minor', 'Sor', None], [4, 'Mazurka', 'Tárrega', None], [5, 'Marieta', 'Tárrega', None]]) # 2 deleted, 3 changed, 4 and 5 inserted
+    index.update(df_after, df_before, {2, 3, 4, 5})
+    full_index = SearchIndex()
+    full_index.update(df_after)
+    for query in ['tár', 'adelita', 'sor', 'ma', 'study minor', 'lagrima']:
+        assert index.search(query)==full_index.search(query), query
+    assert index.search('ma')=={4, 5}
+
+def test_ids_of_another_summary_fall_back_to_a_full_diff():
+    df_first = summary([[1, 'Lagrima', 'Tárrega', None]])
+    index = SearchIndex()
+    index.update(df_first)
+    df_skipped = summary([[1, 'Lagrima', 'Tárrega', None], [2, 'Adelita', 'Tárrega', None]])
+    df_latest = summary([[1, 'Lagrima', 'Tárrega', None], [2, 'Adelita', 'Tárrega', None], [3, 'Marieta', 'Tárrega', None]])
+    index.update(df_latest, df_skipped, {3}) # never saw df_skipped, so row 2 is found by diffing
+    assert index.search('adelita')=={2}
+
+def test_prefix_search_covers_every_code_point():
+    assert prefixEnd('ab')=='ac'
+    assert prefixEnd('\U0010ffff') is None
+    index = SearchIndex()
+    index.update(summary([[1, 'a\U0001d4b6', '', None], [2, 'b', '', None]])) # a letter past ￿
+    assert index.search('a')=={1}
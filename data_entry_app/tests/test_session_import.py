@@ -0,0 +1,88 @@
+import io
+import json
+
+import pytest
+import pandas as pd
+
+import orm
+import database
+from data_processing import readSessionFile, prepareSessionImport
+
+arrangement_lookup = {'':'', 1:'Study in E Minor (Tárrega/Tárrega)', 3:'Lagrima (Tárrega/Tárrega)'}
+guitar_lookup = {'':'', 1:'YAMAHA CG-101MS', 4:'YAMAHA G-245S (Default)'}
+
+@pytest.fixture
+def raw_tables(db_session):
+    tables = []
+    for orm_model in [orm.tbl_practice_session, orm.tbl_arrangement]:
+        db_model = database.DatabaseModel(orm_model, db_session)
+        db_model.read()
+        tables.append(db_model.df_raw)
+    return tables
+
+def prepare(rows, raw_tables, default_guitar_id=4):
+    df_raw_session, df_raw_arrangement = raw_tables
+    return prepareSessionImport(pd.DataFrame(rows, dtype=str), df_raw_session, df_raw_arrangement, arrangement_lookup, guitar_lookup, default_guitar_id)
+
+def test_valid_rows_are_resolved_and_staged(raw_tables):
+    df_import, df_preview = prepare([
+        {'Session Date':'2024-09-06', 'Duration':'45', 'Arrangement':' study in e minor (tárrega/tárrega) ', 'Guitar':'YAMAHA G-245S'},
+        {'Session Date':'09/20/2024', 'Duration':'30', 'Arrangement':'Study in E Minor (Tárrega/Tárrega)', 'Guitar':'YAMAHA CG-101MS'},
+    ], raw_tables)
+    assert list(df_preview['Problem'])==['', '']
+    assert df_import[['duration','l_arrangement_id','guitar_id','stage']].to_dict('records')==[
+        {'duration':45, 'l_arrangement_id':1, 'guitar_id':4, 'stage':'Achieving Tempo'},
+        {'duration':30, 'l_arrangement_id':1, 'guitar_id':1, 'stage':'Maintenance'},
+    ]
+    assert list(df_import['session_date'].astype(str))==['2024-09-06', '2024-09-20']
+
+def test_invalid_rows_are_reported(raw_tables):
+    df_import, df_preview = prepare([
+        {'session_date':'not a date', 'duration':'30', 'arrangement':'Lagrima (Tárrega/Tárrega)', 'guitar':''},
+        {'session_date':'2024-10-01', 'duration':'12.5', 'arrangement':'Lagrima (Tárrega/Tárrega)', 'guitar':''},
+        {'session_date':'2024-10-01', 'duration':'0', 'arrangement':'Lagrima (Tárrega/Tárrega)', 'guitar':''},
+        {'session_date':'2024-10-01', 'duration':'thirty', 'arrangement':'Lagrima (Tárrega/Tárrega)', 'guitar':''},
+        {'session_date':'2024-10-01', 'duration':'30', 'arrangement':'Recuerdos de la Alhambra', 'guitar':''},
+        {'session_date':'2024-10-01', 'duration':'30', 'arrangement':'Lagrima (Tárrega/Tárrega)', 'guitar':'Cordoba C5'},
+    ], raw_tables)
+    assert list(df_preview['Problem'])==['Invalid session date']+['Duration must be a whole number of minutes']*3+['Unknown arrangement', 'Unknown guitar']
+    assert df_import.empty
+    assert list(df_preview['Stage'])==['']*6
+
+def test_unknown_guitar_without_a_default(raw_tables):
+    df_import, df_preview = prepare([{'session_date':'2024-10-01', 'duration':'30', 'l_arrangement_id':'3'}], raw_tables, default_guitar_id=None)
+    assert list(df_preview['Problem'])==['Unknown guitar (and no default guitar set)']
+    assert df_import.empty
+
+def test_ids_can_be_given_instead_of_labels(raw_tables):
+    df_import, df_preview = prepare([
+        {'session_date':'2024-10-01', 'duration':'30', 'l_arrangement_id':'3', 'guitar_id':'1'},
+        {'session_date':'2024-10-01', 'duration':'30', 'l_arrangement_id':'999', 'guitar_id':'1'},
+        {'session_date':'2024-10-02', 'duration':'30', 'l_arrangement_id':'3', 'guitar_id':'999'},
+    ], raw_tables)
+    assert list(df_preview['Problem'])==['', 'Unknown arrangement', 'Unknown guitar']
+    assert df_import[['l_arrangement_id','guitar_id']].to_dict('records')==[{'l_arrangement_id':3, 'guitar_id':1}]
+
+def test_saved_and_repeated_sessions_are_skipped(raw_tables):
+    df_import, df_preview = prepare([
+        {'session_date':'2024-09-03', 'duration':'60', 'l_arrangement_id':'1'}, # already in practice_session
+        {'session_date':'2024-10-01', 'duration':'30', 'l_arrangement_id':'3'},
+        {'session_date':'10/01/2024', 'duration':'30', 'l_arrangement_id':'3'},
+        {'session_date':'2024-10-01', 'duration':'30', 'l_arrangement_id':'3'},
+        {'session_date':'2024-10-01', 'duration':'45', 'l_arrangement_id':'3'},
+    ], raw_tables)
+    assert list(df_preview['Problem'])==['Already saved', '', 'Repeats an earlier row', 'Repeats an earlier row', '']
+    assert list(df_import['duration'])==[30, 45]
+
+def test_missing_columns_raise(raw_tables):
+    with pytest.raises(ValueError, match='session_date, arrangement'):
+        prepare([{'duration':'30'}], raw_tables)
+
+def test_json_and_csv_files_read_the_same(tmp_path):
+    rows = [{'session_date':'2024-10-01', 'duration':'30', 'arrangement':'Lagrima (Tárrega/Tárrega)', 'notes':''}]
+    json_path = tmp_path.joinpath('sessions.json')
+    json_path.write_text(json.dumps(rows))
+    csv_file = io.StringIO(pd.DataFrame(rows).to_csv(index=False))
+    df_json = readSessionFile(json_path, 'Sessions.JSON')
+    df_csv = readSessionFile(csv_file, 'sessions.csv')
+    assert df_json.equals(df_csv)
@@ -0,0 +1,156 @@
+import pytest
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+import orm
+import database
+from write_journal import WriteJournal
+from data_processing import ArtistInputTableModel
+
+@pytest.fixture
+def journal(tmp_path, db_session):
+    journal = WriteJournal(tmp_path.joinpath('write_journal.db'), max_attempts=2)
+    journal.start(db_session)
+    journal.stop() # flush() is called by the tests themselves
+    return journal
+
+def journaledModel(orm_model, db_session, journal):
+    db_model = database.DatabaseModel(orm_model, db_session)
+    db_model.read()
+    db_model.useJournal(journal)
+    return db_model
+
+def liveRow(db_session, orm_model, row_id):
+    with db_session.getEngine().connect() as connection:
+        return connection.execute(select(orm_model).where(orm_model.c.id==int(row_id))).mappings().one_or_none()
+
+def test_insert_gets_a_temporary_id_until_flushed(db_session, journal):
+    artists = journaledModel(orm.tbl_artist, db_session, journal)
+    temp_id = artists.insert(pd.DataFrame([{'name':'Agustín Barrios'}]))
+    assert temp_id<0
+    assert artists.getRow(temp_id)['name']=='Agustín Barrios'
+    assert journal.flush()==1
+    assert journal.pending()==[]
+    row_id = artists.df_raw.loc[artists.df_raw['name']=='Agustín Barrios', 'id'].item()
+    assert row_id>0
+    assert liveRow(db_session, orm.tbl_artist, row_id)['name']=='Agustín Barrios'
+
+def test_later_writes_refer_to_the_generated_id(db_session, journal):
+    artists = journaledModel(orm.tbl_artist, db_session, journal)
+    songs = journaledModel(orm.tbl_song, db_session, journal)
+    composer_id = artists.insert(pd.DataFrame([{'name':'Fernando Sor'}]))
+    song_id = songs.insert(pd.DataFrame([{'title':'Study in B minor', 'composer_id':composer_id, 'style_id':None, 'song_type':'Study'}]))
+    artists.update(pd.DataFrame([{'id':composer_id, 'name':'Fernando Sor (1778-1839)'}]))
+    assert [entry['operation'] for entry in journal.pending()]==['insert', 'insert', 'update']
+    journal.flush()
+    song = liveRow(db_session, orm.tbl_song, songs.df_raw['id'].max())
+    assert song['title']=='Study in B minor'
+    assert liveRow(db_session, orm.tbl_artist, song['composer_id'])['name']=='Fernando Sor (1778-1839)'
+    assert song_id not in set(songs.df_raw['id'])
+    assert (songs.df_raw['composer_id']==song['composer_id']).sum()>=1
+
+def test_batches_keep_the_recorded_order(tmp_path, db_session):
+    journal = WriteJournal(tmp_path.joinpath('write_journal.db'), batch_size=2)
+    journal.start(db_session)
+    journal.stop()
+    artists = journaledModel(orm.tbl_artist, db_session, journal)
+    row_id = artists.insert(pd.DataFrame([{'name':'Name 0'}]))
+    for i in range(1, 5):
+        artists.update(pd.DataFrame([{'id':row_id, 'name':f'Name {i}'}]))
+    assert journal.flush()==5
+    assert liveRow(db_session, orm.tbl_artist, artists.df_raw['id'].max())['name']=='Name 4'
+
+def test_insert_many_reserves_a_temporary_id_per_row(db_session, journal):
+    artists = journaledModel(orm.tbl_artist, db_session, journal)
+    temp_ids = artists.insertMany(pd.DataFrame([{'name':'Tárrega'}, {'name':'Llobet'}, {'name':'Pujol'}]))
+    assert temp_ids==[temp_ids[0], temp_ids[0]-1, temp_ids[0]-2]
+    next_id = artists.insert(pd.DataFrame([{'name':'Segovia'}]))
+    assert next_id==temp_ids[-1]-1
+    assert journal.flush()==2
+    names = artists.df_raw.set_index('name')['id']
+    assert (names[['Tárrega', 'Llobet', 'Pujol', 'Segovia']]>0).all()
+    assert names['Llobet']==names['Tárrega']+1
+
+def test_unreachable_database_keeps_the_writes(tmp_path, db_session, journal):
+    artists = journaledModel(orm.tbl_artist, db_session, journal)
+    unreachable = database.DatabaseSession(sqlite_path=tmp_path.joinpath('missing', 'live.db'))
+    unreachable.connect()
+    journal.start(unreachable)
+    journal.stop()
+    artists.insert(pd.DataFrame([{'name':'Ida Presti'}]))
+    for _ in range(3): # more than max_attempts: a write is never set aside while the database can't be reached
+        with pytest.raises(OperationalError):
+            journal.flush()
+    assert len(journal.pending())==1
+    assert journal.failed().empty
+    journal.start(db_session)
+    journal.stop()
+    assert journal.pending()==[]
+    assert (artists.df_raw['name']=='Ida Presti').sum()==1
+
+def test_refused_write_is_set_aside_with_its_dependents(db_session, journal):
+    artists = journaledModel(orm.tbl_artist, db_session, journal)
+    sessions = journaledModel(orm.tbl_practice_session, db_session, journal)
+    session_id = sessions.insert(pd.DataFrame([{'session_date':'2024-12-01', 'duration':30, 'guitar_id':999, 'l_arrangement_id':1, 'notes':'', 'video_url':'', 'stage':'Learning Notes'}]))
+    sessions.update(pd.DataFrame([{'id':session_id, 'notes':'scales'}]))
+    artists.insert(pd.DataFrame([{'name':'Alirio Díaz'}]))
+    with pytest.raises(Exception):
+        journal.flush() # first refusal is retried on the next flush
+    assert journal.failed().empty
+    assert journal.flush()==1 # the artist gets through once the refused write is set aside
+    assert journal.pending()==[]
+    df_failed = journal.failed()
+    assert list(df_failed['operation'])==['insert', 'update']
+    assert 'FOREIGN KEY' in df_failed['last_error'].iloc[0]
+    assert df_failed['last_error'].iloc[1].startswith('Refers to write')
+
+    version = journal.failedVersion()
+    journal.retryFailed(df_failed['seq'].tolist())
+    assert [entry['seq'] for entry in journal.pending()]==df_failed['seq'].tolist()
+    assert journal.failed().empty
+    assert journal.failedVersion()!=version
+    with pytest.raises(Exception):
+        journal.flush() # the retried writes start counting attempts again
+    assert journal.flush()==0
+    assert journal.failed()['seq'].tolist()==df_failed['seq'].tolist()
+    journal.discardFailed(journal.failed()['seq'].tolist())
+    assert journal.failed().empty
+    assert journal.pending()==[]
+
+def test_exclusive_flag_moves_to_the_written_row(db_session, journal):
+    guitars = journaledModel(orm.tbl_guitar, db_session, journal)
+    assert guitars.update(pd.DataFrame([{'id':1, 'default_guitar':True}]), exclusive_flag='default_guitar')=={'default_guitar':True}
+    assert guitars.df_raw.set_index('id')['default_guitar'].to_dict()=={1:True, 4:False}
+    assert guitars.update(pd.DataFrame([{'id':1, 'default_guitar':True}]), exclusive_flag='default_guitar')=={} # already the only one
+    journal.flush()
+    assert liveRow(db_session, orm.tbl_guitar, 1)['default_guitar']
+    assert not liveRow(db_session, orm.tbl_guitar, 4)['default_guitar']
+
+def test_flushed_insert_opens_through_its_temporary_id(db_session, journal):
+    artists = journaledModel(orm.tbl_artist, db_session, journal)
+    artist_form = ArtistInputTableModel('artist', 'Artist', artists)
+    artist_form.processData()
+    temp_id = artists.insert(pd.DataFrame([{'name':'Maria Luisa Anido'}]))
+    version = journal.idMapVersion()
+    journal.flush()
+    assert journal.idMapVersion()!=version
+    assert journal.takeReconciled()==[artists]
+    assert journal.takeReconciled()==[]
+    artist_form._df_selected_id = temp_id # selected in a summary published before the flush
+    row = artist_form._selected_row()
+    assert row['name']=='Maria Luisa Anido'
+    assert row['id']==journal.realId(temp_id)
+    artists.update(pd.DataFrame([{'id':temp_id, 'name':'María Luisa Anido'}]))
+    journal.flush()
+    assert liveRow(db_session, orm.tbl_artist, row['id'])['name']=='María Luisa Anido'
+
+def test_written_ids_are_handed_to_the_summary(db_session, journal):
+    artists = journaledModel(orm.tbl_artist, db_session, journal)
+    assert artists.takeWrittenIds() is None # read, so any row can have changed
+    temp_id = artists.insert(pd.DataFrame([{'name':'Francisco Tárrega'}]))
+    artists.update(pd.DataFrame([{'id':1, 'name':'Renamed'}]))
+    assert artists.takeWrittenIds()=={temp_id, 1}
+    assert artists.takeWrittenIds()==set()
+    journal.flush() # swaps the generated id in
+    assert artists.takeWrittenIds() is None
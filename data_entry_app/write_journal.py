@@ -0,0 +1,386 @@
+"""
+Local write journal for the data entry app.  A DatabaseModel using it (DatabaseModel.useJournal()) appends its writes to an SQLite file and applies them to df_raw straight away, and a background thread sends them to the live database in order.
+
+A journaled insert has a temporary negative id (minus its journal sequence number) until it is flushed, and later writes that refer to it are sent with the generated id.  Writes are retried while the database can't be reached.  A write the database refuses is set aside in write_journal_failed after max_attempts, together with the writes that depend on it.
+
+A batch whose live transaction commits just before the app dies is sent again on the next start.
+"""
+# Core
+import json
+import datetime
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+# Data Integration
+from sqlalchemy import Column, Integer, Text, DateTime, MetaData, Table, select, insert, update, delete, func, text
+from sqlalchemy.types import Date
+from sqlalchemy.exc import OperationalError, InterfaceError, DisconnectionError
+
+# App specific
+import orm
+import database
+
+cwd = Path(__file__).parent
+journal_path = cwd.joinpath('write_journal.db')
+
+journal_table = Table(
+    'write_journal',
+    MetaData(),
+    Column('seq', Integer, primary_key=True),
+    Column('table_name', Text, nullable=False),
+    Column('operation', Text, nullable=False), # insert, insert_many, update or delete
+    Column('row_id', Integer, nullable=True), # None for an insert, whose temporary id is -seq (-seq, -seq-1, ... for the rows of an insert_many)
+    Column('row_data', Text, nullable=False), # JSON object of column values, a list of them for an insert_many
+    Column('exclusive_flag', Text, nullable=True), # Boolean column the row takes from every other row (see database.exclusiveFlag())
+    Column('recorded_at', DateTime, nullable=False),
+    Column('attempts', Integer, nullable=False, default=0),
+    Column('last_error', Text, nullable=True),
+    sqlite_autoincrement=True,
+)
+
+id_map_table = Table(
+    'write_journal_ids',
+    journal_table.metadata,
+    Column('temp_id', Integer, primary_key=True),
+    Column('table_name', Text, nullable=False),
+    Column('row_id', Integer, nullable=False),
+)
+
+failed_table = Table(
+    'write_journal_failed',
+    journal_table.metadata,
+    Column('seq', Integer, primary_key=True), # seq of the write in write_journal
+    Column('table_name', Text, nullable=False),
+    Column('operation', Text, nullable=False),
+    Column('row_id', Integer, nullable=True),
+    Column('row_data', Text, nullable=False),
+    Column('exclusive_flag', Text, nullable=True),
+    Column('recorded_at', DateTime, nullable=False),
+    Column('attempts', Integer, nullable=False),
+    Column('last_error', Text, nullable=False),
+    Column('failed_at', DateTime, nullable=False),
+)
+
+models = {table.name:table for table in orm.metadata.sorted_tables}
+
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, DisconnectionError) # the database couldn't be reached, so the write is retried until it can
+
+
+class WriteJournal:
+    """
+    Journals writes to an SQLite file and flushes them to the live database on a background thread
+    """
+    __engine=None # local journal file
+    __live_engine=None # set by start()
+    __batch_size=50
+    __flush_interval=2.0
+    __retry_interval=5.0
+    __max_retry_interval=300.0
+    __max_attempts=3
+    __thread=None
+
+    def __init__(self, path=None, batch_size:int=50, flush_interval:float=2.0, retry_interval:float=5.0, max_retry_interval:float=300.0, max_attempts:int=3):
+        """
+        path (str|Path): journal file, write_journal.db next to the app by default
+        batch_size (int): most writes sent to the live database in one transaction
+        flush_interval (float): seconds between flushes when nothing new is journaled
+        retry_interval (float): seconds before the first retry of a failed flush, doubling up to max_retry_interval
+        max_attempts (int): times a write the database refuses is sent before it is set aside
+        """
+        self.__engine = database.sqliteEngine(path or journal_path)
+        with self.__engine.begin() as connection:
+            journal_table.metadata.create_all(connection)
+        with self.__engine.connect() as connection:
+            connection.connection.driver_connection.execute("PRAGMA journal_mode=WAL") # readers don't block the journal while it's written to
+            self.__id_map = dict(connection.execute(select(id_map_table.c.temp_id, id_map_table.c.row_id)).all())
+        self.__reconciled = set() # registered models whose df_raw had temporary ids replaced since takeReconciled()
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__retry_interval = retry_interval
+        self.__max_retry_interval = max_retry_interval
+        self.__max_attempts = max_attempts
+        self.__models = []
+        self.__wake = threading.Event()
+        self.__stopping = threading.Event()
+        self.lock = threading.RLock() # held while df_raw of a registered model is replaced
+
+    def register(self, db_model):
+        """
+        Adds a DatabaseModel whose df_raw has its temporary ids replaced after each flush
+        """
+        if db_model not in self.__models:
+            self.__models.append(db_model)
+
+    def record(self, model, operation:str, row_id, row_data, exclusive_flag:str=None):
+        """
+        Appends a write to the journal and returns its entry: {'seq', 'table_name', 'operation', 'row_id', 'row_data', 'exclusive_flag'}.  row_id is the temporary id of an insert, a list of them for an insert_many.
+        """
+        if operation=='insert_many':
+            row_data = [database.coerceRow(model, row) for row in row_data]
+        else:
+            row_data = database.coerceRow(model, row_data)
+        with self.__engine.begin() as connection:
+            seq = connection.execute(insert(journal_table).values(
+                table_name=model.name,
+                operation=operation,
+                row_id=None if row_id is None else int(row_id),
+                row_data=json.dumps(row_data, default=str),
+                exclusive_flag=exclusive_flag,
+                recorded_at=datetime.datetime.now(),
+            ).returning(journal_table.c.seq)).scalar_one()
+            if operation=='insert_many' and len(row_data)>1:
+                # reserve the seqs behind this one for the temporary ids of the other rows
+                connection.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = :name"), {'seq':seq+len(row_data)-1, 'name':journal_table.name})
+        self.__wake.set()
+        return {'seq':seq, 'table_name':model.name, 'operation':operation, 'row_id':self.__rowId(seq, operation, row_id, row_data), 'row_data':row_data, 'exclusive_flag':exclusive_flag}
+
+    def __rowId(self, seq, operation, row_id, row_data):
+        if operation=='insert':
+            return -seq
+        if operation=='insert_many':
+            return [-seq-i for i in range(len(row_data))]
+        return int(row_id)
+
+    def pending(self, model=None):
+        """
+        Returns the journal entries (see record()) that haven't been flushed yet, oldest first, only those of one table if model is given
+        """
+        stmt = select(journal_table).order_by(journal_table.c.seq)
+        if model is not None:
+            stmt = stmt.where(journal_table.c.table_name==model.name)
+        with self.__engine.connect() as connection:
+            rows = connection.execute(stmt).mappings().all()
+        return [self.__entry(row) for row in rows]
+
+    def __entry(self, row):
+        model = models[row['table_name']]
+        decode = lambda row_data: {key:datetime.date.fromisoformat(value) if value is not None and isinstance(model.c[key].type, Date) else value for key, value in row_data.items()}
+        if row['operation']=='insert_many':
+            row_data = [decode(row_data) for row_data in json.loads(row['row_data'])]
+        else:
+            row_data = decode(json.loads(row['row_data']))
+        return {'seq':row['seq'], 'table_name':row['table_name'], 'operation':row['operation'], 'row_id':self.__rowId(row['seq'], row['operation'], row['row_id'], row_data), 'row_data':row_data, 'exclusive_flag':row['exclusive_flag']}
+
+    def __resolve(self, entry):
+        """
+        Returns (row id, row data) of an entry with flushed temporary ids replaced by their real ids
+        """
+        model = models[entry['table_name']]
+        resolveRow = lambda row_data: {key:self.__id_map.get(value, value) if model.c[key].foreign_keys and value is not None else value for key, value in row_data.items()}
+        if entry['operation']=='insert_many':
+            return [self.__id_map.get(row_id, row_id) for row_id in entry['row_id']], [resolveRow(row_data) for row_data in entry['row_data']]
+        return self.__id_map.get(entry['row_id'], entry['row_id']), resolveRow(entry['row_data'])
+
+    def apply(self, df, entries:list):
+        """
+        Returns df (a df_raw) with the journal entries applied to it.  Entries already flushed into df change nothing.
+        """
+        for entry in entries:
+            row_id, row_data = self.__resolve(entry)
+            if entry['operation']=='insert_many':
+                if df['id'].isin(row_id).any(): # already flushed into df
+                    df = self.apply(df, [{**entry, 'operation':'insert', 'row_id':temp_id, 'row_data':row} for temp_id, row in zip(entry['row_id'], entry['row_data'])])
+                else:
+                    df = pd.concat([df, pd.DataFrame([{'id':new_id, **{key:value for key, value in row.items() if key in df.columns}} for new_id, row in zip(row_id, row_data)]).dropna(axis=1, how='all')], ignore_index=True)
+                continue
+            if entry['operation']=='delete':
+                df = df[df['id']!=row_id]
+                continue
+            row_data = {key:value for key, value in row_data.items() if key in df.columns}
+            mask = df['id']==row_id
+            if mask.any():
+                if row_data:
+                    df = df.copy(deep=False) # Copy-on-Write: only the columns written below are copied, df_raw itself isn't touched
+                    df.loc[mask, list(row_data)] = [list(row_data.values())]
+            elif entry['operation']=='insert':
+                df = pd.concat([df, pd.DataFrame([{'id':row_id, **row_data}]).dropna(axis=1, how='all')], ignore_index=True) # empty columns are left for concat to fill, so they don't change the column dtypes
+            else:
+                continue
+            if entry['exclusive_flag'] in df.columns:
+                df = df.assign(**{entry['exclusive_flag']:df['id']==row_id})
+        return df
+
+    def flush(self):
+        """
+        Sends every pending write to the live database and returns the number sent.  A failed attempt is raised, unless the write is set aside.
+        """
+        flushed = 0
+        batch_size = self.__batch_size
+        while True:
+            with self.__engine.connect() as connection:
+                rows = connection.execute(select(journal_table).order_by(journal_table.c.seq).limit(batch_size)).mappings().all()
+            if not rows:
+                return flushed
+            entries = [self.__entry(row) for row in rows]
+            try:
+                new_ids = self.__send(entries)
+            except TRANSIENT_ERRORS as error:
+                self.__recordError(entries, error)
+                raise
+            except Exception as error:
+                if len(entries)>1:
+                    batch_size = 1 # find the refused write, sending the ones before it
+                    continue
+                if self.__recordError(entries, error)<self.__max_attempts:
+                    raise
+                self.__setAside(entries[0])
+                continue
+            with self.lock:
+                with self.__engine.begin() as connection:
+                    connection.execute(delete(journal_table).where(journal_table.c.seq.in_([entry['seq'] for entry in entries])))
+                    if new_ids:
+                        connection.execute(insert(id_map_table), [{'temp_id':temp_id, 'table_name':table_name, 'row_id':row_id} for temp_id, (table_name, row_id) in new_ids.items()])
+                self.__id_map.update({temp_id:row_id for temp_id, (table_name, row_id) in new_ids.items()})
+                if new_ids:
+                    for db_model in self.__models:
+                        if db_model.reconcileIds(self.__id_map):
+                            self.__reconciled.add(db_model)
+            flushed+=len(entries)
+
+    def idMapVersion(self):
+        """
+        Changes whenever a flush generates ids for journaled inserts.  Cheap enough to poll.
+        """
+        return len(self.__id_map)
+
+    def takeReconciled(self):
+        """
+        Returns the registered models whose df_raw had temporary ids replaced since the last call, so their summaries can be recomputed
+        """
+        with self.lock:
+            reconciled = list(self.__reconciled)
+            self.__reconciled.clear()
+        return reconciled
+
+    def realId(self, temp_id):
+        """
+        Returns the id generated for a flushed insert's temporary id, or None
+        """
+        return self.__id_map.get(temp_id)
+
+    def __recordError(self, entries, error):
+        """
+        Counts a failed attempt against each entry and returns the attempts of the first
+        """
+        with self.__engine.begin() as connection:
+            connection.execute(update(journal_table).where(journal_table.c.seq.in_([entry['seq'] for entry in entries])).values(attempts=journal_table.c.attempts+1, last_error=str(getattr(error, 'orig', None) or error)))
+            return connection.execute(select(journal_table.c.attempts).where(journal_table.c.seq==entries[0]['seq'])).scalar_one()
+
+    def __setAside(self, entry):
+        """
+        Moves a refused write, and every pending write that refers to its temporary id, from the journal to write_journal_failed
+        """
+        insertedIds = lambda entry: {entry['row_id']} if entry['operation']=='insert' else set(entry['row_id']) if entry['operation']=='insert_many' else set()
+        failed_ids = insertedIds(entry)
+        set_aside = [entry['seq']]
+        for pending_entry in self.pending():
+            if pending_entry['seq']==entry['seq']:
+                continue
+            model = models[pending_entry['table_name']]
+            rows = pending_entry['row_data'] if pending_entry['operation']=='insert_many' else [pending_entry['row_data']]
+            if (pending_entry['operation']!='insert_many' and pending_entry['row_id'] in failed_ids) or any(model.c[key].foreign_keys and value in failed_ids for row in rows for key, value in row.items()):
+                set_aside.append(pending_entry['seq'])
+                failed_ids|=insertedIds(pending_entry)
+        with self.__engine.begin() as connection:
+            rows = connection.execute(select(journal_table).where(journal_table.c.seq.in_(set_aside))).mappings().all()
+            connection.execute(insert(failed_table), [{**row, 'last_error':row['last_error'] if row['seq']==entry['seq'] else f"Refers to write {entry['seq']}, which was set aside", 'failed_at':datetime.datetime.now()} for row in rows])
+            connection.execute(delete(journal_table).where(journal_table.c.seq.in_(set_aside)))
+
+    def failed(self):
+        """
+        Returns the writes that were set aside, oldest first, as a pd.DataFrame
+        """
+        with self.__engine.connect() as connection:
+            return pd.read_sql(select(failed_table).order_by(failed_table.c.seq), connection)
+
+    def failedVersion(self):
+        """
+        Changes whenever a write is set aside, retried or discarded
+        """
+        with self.__engine.connect() as connection:
+            return tuple(connection.execute(select(func.count(), func.coalesce(func.sum(failed_table.c.seq), 0)).select_from(failed_table)).one())
+
+    def retryFailed(self, seqs:list):
+        """
+        Puts set aside writes back into the journal under their old seq
+        """
+        with self.__engine.begin() as connection:
+            rows = connection.execute(select(failed_table).where(failed_table.c.seq.in_(seqs))).mappings().all()
+            if rows:
+                connection.execute(insert(journal_table), [{column.name:row[column.name] for column in journal_table.columns if column.name!='attempts'} for row in rows])
+            connection.execute(delete(failed_table).where(failed_table.c.seq.in_(seqs)))
+        self.__wake.set()
+
+    def discardFailed(self, seqs:list):
+        with self.__engine.begin() as connection:
+            connection.execute(delete(failed_table).where(failed_table.c.seq.in_(seqs)))
+
+    def __send(self, entries):
+        """
+        Writes one batch of entries to the live database in a single transaction.  Returns {temporary id: (table name, generated id)} for its inserts.
+        """
+        new_ids = {}
+        with self.__live_engine.begin() as connection:
+            for entry in entries:
+                model = models[entry['table_name']]
+                row_id, row_data = self.__resolve(entry)
+                # ids generated earlier in this batch aren't in __id_map until it commits
+                resolveRow = lambda row_data: {key:new_ids[value][1] if model.c[key].foreign_keys and value in new_ids else value for key, value in row_data.items()}
+                if entry['operation']=='insert_many':
+                    generated_ids = connection.execute(insert(model).returning(model.c.id, sort_by_parameter_order=True), [resolveRow(row) for row in row_data]).scalars().all()
+                    new_ids.update({temp_id:(model.name, generated_id) for temp_id, generated_id in zip(entry['row_id'], generated_ids)})
+                    continue
+                row_id = new_ids.get(row_id, (None, row_id))[1]
+                row_data = resolveRow(row_data)
+                if entry['operation']=='insert':
+                    row_id = connection.execute(insert(model).values(row_data).returning(model.c.id)).scalar_one()
+                    new_ids[entry['row_id']] = (model.name, row_id)
+                elif entry['operation']=='update':
+                    if row_data:
+                        connection.execute(update(model).where(model.c.id==row_id).values(row_data))
+                else:
+                    connection.execute(delete(model).where(model.c.id==row_id))
+                if entry['exclusive_flag']:
+                    connection.execute(database.exclusiveFlag(model, entry['exclusive_flag'], row_id))
+        return new_ids
+
+    def start(self, db_session):
+        """
+        Starts the background flusher sending writes to the database db_session is connected to, or switches its database if it runs
+        """
+        self.__live_engine = db_session.getEngine()
+        if self.__thread is None or not self.__thread.is_alive():
+            self.__stopping.clear()
+            self.__thread = threading.Thread(target=self.__run, name='write_journal_flusher', daemon=True)
+            self.__thread.start()
+        self.__wake.set()
+
+    def stop(self, timeout:float=None):
+        """
+        Stops the background flusher after one last flush attempt
+        """
+        self.__stopping.set()
+        self.__wake.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+    def __run(self):
+        delay = self.__retry_interval
+        while True:
+            stopping = self.__stopping.is_set()
+            try:
+                self.flush()
+            except Exception as error:
+                if stopping:
+                    return
+                print(f"Write journal flush failed, retrying in {delay:.0f}s: {error}")
+                self.__stopping.wait(delay) # new writes don't cut the retry delay short
+                delay = min(delay*2, self.__max_retry_interval)
+                continue
+            if stopping:
+                return
+            delay = self.__retry_interval
+            self.__wake.wait(self.__flush_interval)
+            self.__wake.clear()
@@ -1,78 +1,114 @@
 #%%
 from dotenv import load_dotenv
 import os
-import sqlite3
+import argparse
 from pathlib import Path
 
-from sqlalchemy import create_engine, Column, Integer, String
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-
 cwd = Path(__file__).parent
 env_path = cwd.joinpath('variables.env')
 
 import orm # database models
 import database 
+import incremental_backup
+import parallel_backup
+import migrate
+
+parser = argparse.ArgumentParser(description="Backs up the PostgreSQL tables to local_guitar_data.db.  By default only new and changed rows are transferred (see incremental_backup.py).")
+parser.add_argument('--full', action='store_true', help="rewrite every table instead of transferring only new and changed rows")
+parser.add_argument('--batch-size', type=int, default=500, help="rows read and written at a time")
+parser.add_argument('--workers', type=int, default=4, help="tables dumped in parallel during a full rewrite")
+parser.add_argument('--parquet', action='store_true', help="also export every table to local_guitar_data_parquet as Parquet files (see parquet_export.py)")
+args, _ = parser.parse_known_args() # parse_known_args so the cells can still be run interactively
+
 print("Loading variables.env")
 # pull database location and credential information from env variables
 load_dotenv(env_path)
 
-# Establish database session minus credentials
-remote_pg_session = database.DatabaseSession(
-    os.getenv("pg_host"),
-    os.getenv("pg_port"),
-    os.getenv("pg_dbname")
-    )
-
 user_name = os.getenv("pg_user")
 pw = os.getenv('pg_pw')
-read_only_acct=True
+
+def remoteSession():
+    # Establish database session and connect
+    session = database.DatabaseSession(
+        os.getenv("pg_host"),
+        os.getenv("pg_port"),
+        os.getenv("pg_dbname")
+        )
+    session.connect(user_name, pw)
+    return session
 
 
 #%%
 ###Connect to Remote PostgreSQL Database
-print("Building object relational maps")
-# Create object relational mappings for the three database tables
-remote_artist_model = database.DatabaseModel(orm.tbl_artist,remote_pg_session)
-remote_style_model = database.DatabaseModel(orm.tbl_style, remote_pg_session)
-remote_song_model = database.DatabaseModel(orm.tbl_song, remote_pg_session)
-remote_arrangement_model = database.DatabaseModel(orm.tbl_arrangement, remote_pg_session)
-remote_session_model = database.DatabaseModel(orm.tbl_practice_session, remote_pg_session)
-remote_string_set_model = database.DatabaseModel(orm.tbl_string_set, remote_pg_session)
-remote_arrangement_goal_model = database.DatabaseModel(orm.tbl_arrangement_goals, remote_pg_session)
-remote_guitar_model = database.DatabaseModel(orm.tbl_guitar, remote_pg_session)
+print("Connecting to PostgreSQL Database")
+remote_pg_session = remoteSession()
 
-#%%
-# connect to database
-print("Connecting to PostgreSQL Database and reading tables")
-remote_string_set_model.connect(user_name, pw, read_only_acct)
-remote_artist_model.connect(user_name, pw, read_only_acct)
-remote_style_model.connect(user_name, pw, read_only_acct)
-remote_song_model.connect(user_name, pw, read_only_acct)
-remote_arrangement_model.connect(user_name, pw, read_only_acct)
-remote_session_model.connect(user_name, pw, read_only_acct)
-remote_arrangement_goal_model.connect(user_name, pw, read_only_acct)
-remote_guitar_model.connect(user_name, pw, read_only_acct)
+# Every table is read from this one snapshot so the backup can't mix rows from before and after a write
+snapshot_id = remote_pg_session.beginSnapshot()
+
+# Tables in the order they are backed up
+backup_tables = [
+    orm.tbl_string_set,
+    orm.tbl_artist,
+    orm.tbl_style,
+    orm.tbl_song,
+    orm.tbl_arrangement,
+    orm.tbl_practice_session,
+    orm.tbl_arrangement_goals,
+    orm.tbl_guitar,
+]
 
 
 print("Opening local SQLite Database")
 #%%
 #### Create Local SQLite Database
-db_path = cwd.joinpath('local_guitar_data.db').resolve().as_posix()
-engine = create_engine(f'sqlite:///{db_path}') 
+engine = database.sqliteEngine(cwd.joinpath('local_guitar_data.db'))
+
+# WAL mode lets the apps keep reading the cache while a backup writes to it.  It can't be set inside a transaction, hence the raw connection.
+with engine.connect() as connection:
+    connection.connection.driver_connection.execute("PRAGMA journal_mode=WAL")
 
-Session = sessionmaker(bind=engine)
-session=Session()
+# Bring a cache made by an older version of the backup up to the schema declared in orm.py
+for number, description in migrate.upgrade(engine):
+    print(f"  Applied migration {number}: {description}")
+
+local_session = database.DatabaseSession()
+local_session.connect()
 
 #%%
-print("Printing data to local database")
-# Write the DataFrame to the local SQLLite database
-remote_string_set_model.df_raw.to_sql('string_set', engine, if_exists='replace', index=False)
-remote_artist_model.df_raw.to_sql('artist', engine, if_exists='replace')
-remote_style_model.df_raw.to_sql('style', engine, if_exists='replace')
-remote_song_model.df_raw.to_sql('song', engine, if_exists='replace')
-remote_arrangement_model.df_raw.to_sql('arrangement', engine, if_exists='replace')
-remote_session_model.df_raw.to_sql('practice_session', engine, if_exists='replace')
-remote_arrangement_goal_model.df_raw.to_sql('arrangement_goals', engine, if_exists='replace')
-remote_guitar_model.df_raw.to_sql('guitar', engine, if_exists='replace')
-print("Backup Complete!")
\ No newline at end of file
+if args.full:
+    print("Printing data to local database (full refresh)")
+else:
+    print("Printing new and changed rows to local database")
+stored_states = {} if args.full else incremental_backup.readState(engine)
+remote_states = remote_pg_session.readTableChecksums(backup_tables)
+refresh_tables = []
+for model in backup_tables:
+    result = incremental_backup.syncTable(remote_pg_session, local_session, engine, model, stored_states.get(model.name), args.batch_size, remote_states[model.name])
+    if result is None:
+        refresh_tables.append(model)
+    else:
+        print(f"  {model.name}: {result}")
+
+if refresh_tables:
+    row_counts = parallel_backup.refreshTables(remote_pg_session, remoteSession, snapshot_id, engine, refresh_tables, args.workers, args.batch_size)
+    for model in refresh_tables:
+        print(f"  {model.name}: full refresh ({row_counts[model.name]} rows)")
+    with engine.begin() as connection:
+        # Rewriting a table dropped its triggers: the table version's, and the notes search index's on practice_session
+        database.createTableVersions(connection, refresh_tables)
+        if orm.tbl_practice_session in refresh_tables:
+            database.createNotesSearchIndex(connection)
+
+remote_pg_session.endSnapshot()
+
+#%%
+if args.parquet:
+    import parquet_export # needs pyarrow, which only the Parquet export uses
+    print("Exporting local database to Parquet")
+    row_counts = parquet_export.exportTables(local_session, backup_tables, cwd.joinpath('local_guitar_data_parquet'), args.batch_size)
+    for model in backup_tables:
+        print(f"  {model.name}: {row_counts[model.name]} rows")
+
+print("Backup Complete!")
+
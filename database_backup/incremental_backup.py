@@ -0,0 +1,114 @@
+"""
+Incremental backup of the live database into local_guitar_data.db.  DB_WRITE.py uses this unless it is run with --full.
+
+Each table's high-water mark (row count, max id and a checksum over the row hashes) is kept in the local backup_state table.  Tables whose mark matches are skipped, the others have their new and changed rows upserted and their deleted rows removed, and a table that can't be synced is rewritten in full (see parallel_backup.py).
+"""
+# Data Integration
+from sqlalchemy import Column, Integer, Text, MetaData, Table, inspect, select, insert, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+state_table = Table(
+    'backup_state',
+    MetaData(),
+    Column('table_name', Text, nullable=False),
+    Column('max_id', Integer, nullable=True),
+    Column('row_count', Integer, nullable=False),
+    Column('checksum', Text, nullable=False),
+)
+
+
+def readState(engine):
+    """
+    Returns the stored high-water marks as {table name: state}, empty if there are none
+    """
+    if not inspect(engine).has_table(state_table.name):
+        return {}
+    with engine.connect() as connection:
+        rows = connection.execute(select(state_table)).mappings().all()
+    return {row['table_name']:{'max_id':row['max_id'], 'row_count':row['row_count'], 'checksum':row['checksum']} for row in rows}
+
+
+def writeState(engine, table_name, state):
+    state_table.create(engine, checkfirst=True)
+    with engine.begin() as connection:
+        connection.execute(delete(state_table).where(state_table.c.table_name==table_name))
+        connection.execute(insert(state_table).values(table_name=table_name, **state))
+
+
+def schemaMatches(engine, model):
+    """
+    Returns True if the local copy of a table has the columns, primary key and indexes the orm model declares
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(model.name):
+        return False
+    columns = [column['name'] for column in inspector.get_columns(model.name)]
+    primary_key = inspector.get_pk_constraint(model.name)['constrained_columns']
+    indexes = {index['name'] for index in inspector.get_indexes(model.name)}
+    return columns==[column.name for column in model.columns] and primary_key==[column.name for column in model.primary_key] and indexes>={index.name for index in model.indexes}
+
+
+def toRecords(df):
+    """
+    Converts a frame into a list of row dicts with python scalars and None for missing values
+    """
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def refreshTable(remote_session, engine, model, batch_size=500):
+    """
+    Rewrites the whole local copy of a table, streamed in batches of batch_size rows within one transaction.  Returns the number of rows written.
+    """
+    row_count = 0
+    with engine.begin() as connection:
+        model.drop(connection, checkfirst=True)
+        model.create(connection)
+        for df_batch in remote_session.readTableChunks(model, batch_size):
+            connection.execute(insert(model), toRecords(df_batch))
+            row_count+=len(df_batch)
+    return row_count
+
+
+def syncTable(remote_session, local_session, engine, model, stored_state, batch_size=500, remote_state=None):
+    """
+    Brings the local copy of one table up to date with the live database and stores its new high-water mark.  Returns a short description of what was done, or None if the table needs a full refresh instead.
+    remote_session (database.DatabaseSession): connected to the live database
+    local_session (database.DatabaseSession): connected to the local SQLite cache
+    engine (sqlalchemy.Engine): engine of the local SQLite cache
+    model (Table): orm table to sync
+    stored_state (dict): high-water mark stored by the previous run, or None to force a full refresh
+    batch_size (int): number of rows read and written per transaction
+    remote_state (dict): current high-water mark of the live table, read here if omitted
+    """
+    if stored_state is None or not schemaMatches(engine, model):
+        return None
+
+    if remote_state is None:
+        remote_state = remote_session.readTableChecksums([model])[model.name]
+    if stored_state==remote_state:
+        return "unchanged"
+
+    # Only a changed table needs its row hashes transferred
+    df_remote_hashes = remote_session.readRowHashes(model)
+    df_local_hashes = local_session.readRowHashes(model)
+    df_compare = df_remote_hashes.merge(df_local_hashes, how='outer', on='id', suffixes=('_remote','_local'), indicator=True)
+    changed_ids = df_compare[(df_compare['_merge']=='left_only')|((df_compare['_merge']=='both')&(df_compare['row_hash_remote']!=df_compare['row_hash_local']))]['id'].tolist()
+    deleted_ids = df_compare[df_compare['_merge']=='right_only']['id'].tolist()
+
+    for start in range(0, len(changed_ids), batch_size):
+        batch_ids = changed_ids[start:start+batch_size]
+        df_batch = remote_session.readTable(model, id_set=('id', batch_ids))
+        stmt = sqlite_insert(model)
+        stmt = stmt.on_conflict_do_update(index_elements=['id'], set_={column.name:stmt.excluded[column.name] for column in model.columns if column.name!='id'})
+        with engine.begin() as connection:
+            connection.execute(stmt, toRecords(df_batch))
+
+    for start in range(0, len(deleted_ids), batch_size):
+        with engine.begin() as connection:
+            connection.execute(delete(model).where(model.c.id.in_(deleted_ids[start:start+batch_size])))
+
+    if local_session.readTableChecksums([model])[model.name]!=remote_state:
+        return None
+
+    writeState(engine, model.name, remote_state)
+    return f"{len(changed_ids)} rows written, {len(deleted_ids)} rows deleted"
@@ -0,0 +1,234 @@
+"""
+Versioned schema migrations for the live PostgreSQL database and the local SQLite cache.  Each migration adds part of what orm.py declares (keys, indexes) where it is missing, and the schema_version table records which ones a database has had.
+
+    python migrate.py           # apply pending migrations, then check the query plans
+    python migrate.py --check   # only check the query plans
+
+Like the apps, this connects to the live database when variables.env is present and to local_guitar_data.db otherwise.
+"""
+# Core
+from dotenv import load_dotenv
+import os
+import sys
+import argparse
+import datetime
+from pathlib import Path
+
+cwd = Path(__file__).parent
+env_path = cwd.joinpath('variables.env')
+load_dotenv(env_path)
+
+# Data Integration
+from sqlalchemy import Column, Integer, Text, DateTime, MetaData, Table, inspect, select, insert, func
+from sqlalchemy.schema import AddConstraint, CreateIndex, CreateTable, BLANK_SCHEMA
+
+# App specific
+import orm # database models
+import database
+
+version_table = Table(
+    'schema_version',
+    MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', Text, nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+    schema=orm.schema,
+)
+
+# Tables in the order their foreign keys depend on each other
+models = [
+    orm.tbl_string_set,
+    orm.tbl_artist,
+    orm.tbl_style,
+    orm.tbl_song,
+    orm.tbl_arrangement,
+    orm.tbl_practice_session,
+    orm.tbl_arrangement_goals,
+    orm.tbl_guitar,
+]
+
+
+def schemaName(connection):
+    """
+    Schema the tables live in as seen by the inspector, None in the SQLite cache
+    """
+    return orm.schema if connection.dialect.name=='postgresql' else None
+
+
+def existingModels(connection):
+    """
+    The models whose tables exist in the database
+    """
+    inspector = inspect(connection)
+    return [model for model in models if inspector.has_table(model.name, schema=schemaName(connection))]
+
+
+def rebuildSqliteTable(connection, model):
+    """
+    Rebuilds a SQLite table from its orm model, since SQLite can't add a primary key or foreign key to an existing table.  Columns the model doesn't declare are dropped.
+    """
+    inspector = inspect(connection)
+    existing_columns = {column['name'] for column in inspector.get_columns(model.name)}
+    column_list = ', '.join(f'"{column.name}"' for column in model.columns)
+    select_list = ', '.join(f'"{column.name}"' if column.name in existing_columns else 'NULL' for column in model.columns)
+    # The copy needs the tables its foreign keys point at in the same metadata, all without the live database's schema
+    rebuild_metadata = MetaData()
+    noSchema = lambda table, to_schema, constraint, referred_schema: BLANK_SCHEMA
+    for other_model in models:
+        other_model.to_metadata(rebuild_metadata, schema=None, referred_schema_fn=noSchema)
+    new_table = model.to_metadata(rebuild_metadata, schema=None, referred_schema_fn=noSchema, name=f'{model.name}_new')
+    for index in inspector.get_indexes(model.name):
+        connection.exec_driver_sql(f'DROP INDEX "{index["name"]}"')
+    connection.execute(CreateTable(new_table))
+    connection.exec_driver_sql(f'INSERT INTO "{new_table.name}" ({column_list}) SELECT {select_list} FROM "{model.name}"')
+    connection.exec_driver_sql(f'DROP TABLE "{model.name}"')
+    connection.exec_driver_sql(f'ALTER TABLE "{new_table.name}" RENAME TO "{model.name}"')
+    for index in model.indexes:
+        connection.execute(CreateIndex(index))
+
+
+def addPrimaryKeys(connection):
+    inspector = inspect(connection)
+    for model in existingModels(connection):
+        if inspector.get_pk_constraint(model.name, schema=schemaName(connection))['constrained_columns']:
+            continue
+        if connection.dialect.name=='sqlite':
+            rebuildSqliteTable(connection, model)
+        else:
+            connection.execute(AddConstraint(model.primary_key))
+
+
+def convertStyleIdToInteger(connection):
+    """
+    Converts song.style_id from text to an integer, so it can reference style.id
+    """
+    model = orm.tbl_song
+    if model not in existingModels(connection):
+        return
+    column = next(column for column in inspect(connection).get_columns(model.name, schema=schemaName(connection)) if column['name']=='style_id')
+    if isinstance(column['type'], Integer):
+        return
+    if connection.dialect.name=='sqlite':
+        rebuildSqliteTable(connection, model)
+    else:
+        connection.exec_driver_sql(f"""ALTER TABLE "{model.schema}"."{model.name}" ALTER COLUMN style_id TYPE integer USING NULLIF(style_id, '')::numeric::integer""")
+
+
+def addForeignKeys(connection):
+    inspector = inspect(connection)
+    for model in existingModels(connection):
+        existing = {tuple(foreign_key['constrained_columns']) for foreign_key in inspector.get_foreign_keys(model.name, schema=schemaName(connection))}
+        missing = [constraint for constraint in model.foreign_key_constraints if tuple(constraint.column_keys) not in existing]
+        if not missing:
+            continue
+        if connection.dialect.name=='sqlite':
+            rebuildSqliteTable(connection, model)
+        else:
+            for constraint in missing:
+                connection.execute(AddConstraint(constraint))
+
+
+def addIndexes(connection):
+    for model in existingModels(connection):
+        for index in model.indexes:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def addNotesSearchIndex(connection):
+    if orm.tbl_practice_session in existingModels(connection): # otherwise DB_WRITE.py adds it after copying the table
+        database.createNotesSearchIndex(connection)
+
+
+def addTableVersions(connection):
+    database.createTableVersions(connection, existingModels(connection)) # DB_WRITE.py adds the triggers of tables it copies later
+
+
+# (version, description, function).  Append new migrations with the next version number and never change one that has been released.
+migrations = [
+    (1, "Primary keys on every id column", addPrimaryKeys),
+    (2, "Integer song.style_id", convertStyleIdToInteger),
+    (3, "Foreign keys", addForeignKeys),
+    (4, "Indexes on session_date and the foreign key columns", addIndexes),
+    (5, "Full-text search index on practice session notes", addNotesSearchIndex),
+    (6, "Trigger-maintained table versions", addTableVersions),
+]
+
+
+def currentVersion(connection):
+    """
+    Returns the version of the newest migration applied to the database, 0 if it has never been migrated
+    """
+    if not inspect(connection).has_table(version_table.name, schema=schemaName(connection)):
+        return 0
+    return connection.execute(select(func.max(version_table.c.version))).scalar() or 0
+
+
+def upgrade(engine):
+    """
+    Applies every pending migration in one transaction and returns the list of (version, description) applied
+    """
+    applied = []
+    with engine.begin() as connection:
+        version_table.create(connection, checkfirst=True)
+        version = currentVersion(connection)
+        for number, description, migration in migrations:
+            if number<=version:
+                continue
+            migration(connection)
+            connection.execute(insert(version_table).values(version=number, description=description, applied_at=datetime.datetime.now()))
+            applied.append((number, description))
+    return applied
+
+
+# Queries the apps push down to the database: (description, model, readTable() arguments)
+checked_queries = [
+    ("recent practice sessions", orm.tbl_practice_session, {'date_range':('session_date', datetime.date(2024, 1, 1), None)}),
+    ("rows by id", orm.tbl_practice_session, {'id_set':('id', [1, 2, 3])}),
+    ("sessions of an arrangement", orm.tbl_practice_session, {'id_set':('l_arrangement_id', [1])}),
+    ("sessions on a guitar", orm.tbl_practice_session, {'id_set':('guitar_id', [1])}),
+    ("arrangements of a song", orm.tbl_arrangement, {'id_set':('song_id', [1])}),
+    ("goals of an arrangement", orm.tbl_arrangement_goals, {'id_set':('arrangement_id', [1])}),
+]
+
+
+def usesIndex(plan):
+    return any('INDEX' in line.upper() or 'INTEGER PRIMARY KEY' in line.upper() for line in plan)
+
+
+def checkQueryPlans(session):
+    """
+    Prints the plan of every query in checked_queries and returns the descriptions of those that don't use an index
+    """
+    failed = []
+    for description, model, read_args in checked_queries:
+        plan = session.explain(model, **read_args)
+        print(f"  {'ok' if usesIndex(plan) else 'NO INDEX'}: {description}")
+        for line in plan:
+            print(f"      {line}")
+        if not usesIndex(plan):
+            failed.append(description)
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Applies the primary keys, foreign keys and indexes declared in orm.py and checks that the apps' queries use them.")
+    parser.add_argument('--check', action='store_true', help="only check the query plans, don't migrate")
+    args = parser.parse_args()
+
+    session = database.DatabaseSession(
+        os.getenv("pg_host"),
+        os.getenv("pg_port"),
+        os.getenv("pg_dbname")
+        )
+    session.connect(os.getenv("pg_user"), os.getenv("pg_pw"))
+
+    if not args.check:
+        applied = upgrade(session.getEngine())
+        for number, description in applied:
+            print(f"Applied migration {number}: {description}")
+        if not applied:
+            print("Schema is up to date")
+
+    print("Checking query plans")
+    if checkQueryPlans(session):
+        sys.exit(1)
@@ -4,7 +4,7 @@ from dotenv import load_dotenv
 from pathlib import Path
 
 # Data Integration
-from sqlalchemy import Column, Integer, Text, Date, Boolean
+from sqlalchemy import Column, Integer, Text, Date, Boolean, ForeignKey
 from sqlalchemy.schema import Table, MetaData
 from sqlalchemy.orm import declarative_base
 
@@ -16,101 +16,109 @@ schema=os.getenv("pg_schema")
 if not schema:
     schema = 'main'
 
-Base = declarative_base()
+Base = declarative_base(metadata=MetaData(naming_convention={'ix':'ix_%(table_name)s_%(column_0_name)s', 'fk':'fk_%(table_name)s_%(column_0_name)s'})) # constraint and index names without the schema, so they are the same in PostgreSQL and the SQLite cache
 metadata = Base.metadata
 
-# Build table models with pertinent columns
+# Build table models with pertinent columns.  Keys and indexes are applied to existing databases by database_backup/migrate.py.
 tbl_artist = Table(
     'artist',
     metadata,
-    Column('id', Integer, nullable=False),
+    Column('id', Integer, primary_key=True),
     Column('name', Text, nullable=False),
     schema=schema,
+    sqlite_autoincrement=True,
 )
 
 tbl_style = Table(
     'style',
     metadata,
-    Column('id', Integer, nullable=False),
+    Column('id', Integer, primary_key=True),
     Column('style', Text, nullable=False),
     schema=schema,
+    sqlite_autoincrement=True,
 )
 
 tbl_arrangement = Table(
     'arrangement',
     metadata,
-    Column('id', Integer, nullable=False),
+    Column('id', Integer, primary_key=True),
     Column('start_date', Date, nullable=True),
     Column('off_book_date', Date, nullable=True),
     Column('at_tempo_date', Date, nullable=True),
     Column('play_ready_date', Date, nullable=True),
-    Column('song_id', Integer, nullable=False), # foreign key to song.id
-    Column('arranger', Integer, nullable=True), # foreign key to artist.id (writers and arrangers can be the same person)
-    Column('difficulty', Text, nullable=True),
+    Column('song_id', Integer, ForeignKey(f'{schema}.song.id'), nullable=False, index=True),
+    Column('arranger', Integer, ForeignKey(f'{schema}.artist.id'), nullable=True, index=True), # writers and arrangers can be the same person
+    Column('difficulty', Text, nullable=True, info={'dtype':'category'}),
     Column('sheet_music_link', Text, nullable=True), # Link to sheet music online or book where it's located
     Column('performance_link', Text, nullable=True), # This would be a particular performance that I heard of the arrangement that I really liked.  It will probably color my phrasing once I learn it..  :p
     schema=schema,
+    sqlite_autoincrement=True,
 )
 
 tbl_song = Table(
     'song',
     metadata,
-    Column('id', Integer, nullable=False),
+    Column('id', Integer, primary_key=True),
     Column('title', Text, nullable=False),
-    Column('style_id', Text, nullable=True), # foreign key to style.id
-    Column('composer_id', Integer, nullable=True), # foreign key to artist.id
-    Column('song_type', Text, nullable=True),
+    Column('style_id', Integer, ForeignKey(f'{schema}.style.id'), nullable=True, index=True),
+    Column('composer_id', Integer, ForeignKey(f'{schema}.artist.id'), nullable=True, index=True),
+    Column('song_type', Text, nullable=True, info={'dtype':'category'}),
     schema=schema,
+    sqlite_autoincrement=True,
 )
 
 tbl_practice_session = Table(
     'practice_session',
     metadata,
-    Column('id', Integer, nullable=False),
-    Column('session_date', Date, nullable=False),
+    Column('id', Integer, primary_key=True),
+    Column('session_date', Date, nullable=False, index=True),
     Column('duration', Integer, nullable=False),
-    Column('guitar_id', Integer, nullable=False), # foreign key to guitar.id
-    Column('l_arrangement_id', Integer, nullable=False), # foreign key to arrangement.id
-    Column('notes', Text, nullable=True),
+    Column('guitar_id', Integer, ForeignKey(f'{schema}.guitar.id'), nullable=False, index=True),
+    Column('l_arrangement_id', Integer, ForeignKey(f'{schema}.arrangement.id'), nullable=False, index=True),
+    Column('notes', Text, nullable=True, info={'dtype':'string[pyarrow]'}),
     Column('video_url', Text, nullable=True),
-    Column('stage', Text, nullable=True),
+    Column('stage', Text, nullable=True, info={'dtype':'category'}),
     schema=schema,
+    sqlite_autoincrement=True,
 )
 
 tbl_guitar = Table(
     'guitar',
     metadata,
-    Column('id', Integer, nullable=False),
+    Column('id', Integer, primary_key=True),
     Column('make', Text, nullable=False),
     Column('model', Text, nullable=False),
-    Column('status', Text, nullable=False), # Temporary, Permanent, or Retired
+    Column('status', Text, nullable=False, info={'dtype':'category'}), # Temporary, Permanent, or Retired
     Column('about', Text, nullable=False),
-    Column('string_set_id', Integer, nullable=False), # foreign key to string_set.id
-    Column('image_link', Integer, nullable=True),
+    Column('string_set_id', Integer, ForeignKey(f'{schema}.string_set.id'), nullable=False, index=True),
+    Column('image_link', Text, nullable=True),
     Column('date_added', Date, nullable=True),
     Column('date_retired', Date, nullable=True),
     Column('strings_install_date', Date, nullable=True),
     Column('default_guitar',Boolean, nullable=True),
     schema=schema,
+    sqlite_autoincrement=True,
 )
 
 tbl_arrangement_goals = Table(
     'arrangement_goals',
     metadata,
-    Column('id', Integer, nullable=False),
-    Column('arrangement_id', Integer, nullable=False), # foreign key to arrangement.id
+    Column('id', Integer, primary_key=True),
+    Column('arrangement_id', Integer, ForeignKey(f'{schema}.arrangement.id'), nullable=False, index=True),
     Column('discovery_date', Date, nullable=False),
     Column('description', Text, nullable=True),
     schema=schema,
+    sqlite_autoincrement=True,
 )
 
 tbl_string_set = Table(
     'string_set',
     metadata,
-    Column('id', Integer, nullable=False),
+    Column('id', Integer, primary_key=True),
     Column('name', Text, nullable = False),
     Column('hyperlink', Text, nullable=True),
     Column('image_url', Text, nullable=True),
     schema=schema,
+    sqlite_autoincrement=True,
 )
 
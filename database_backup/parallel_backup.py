@@ -0,0 +1,91 @@
+"""
+Full refresh of several tables at once from one consistent snapshot of the live database.  DB_WRITE.py uses this for every table the incremental backup can't sync.
+
+Worker threads join a snapshot exported by the main session (DatabaseSession.beginSnapshot()) and each stream one table at a time into its own staging SQLite file.  The staging files are then copied into the local cache in a single transaction.
+"""
+# Core
+import threading
+import tempfile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# App specific
+import database
+import incremental_backup
+
+
+def dumpTables(session_factory, snapshot_id, models, staging_dir, workers=4, batch_size=500):
+    """
+    Streams each table into its own staging SQLite file (<table name>.db in staging_dir) on a pool of worker threads.  Returns {table name: (staging file path, row count)}.
+    session_factory (callable): returns a new connected database.DatabaseSession for the live database
+    snapshot_id (str): snapshot exported by the main session that every worker joins
+    models (list): orm tables to dump
+    """
+    thread_data = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def workerSession():
+        if not hasattr(thread_data, 'session'):
+            thread_data.session = session_factory()
+            thread_data.session.beginSnapshot(snapshot_id)
+            with sessions_lock:
+                sessions.append(thread_data.session)
+        return thread_data.session
+
+    def dumpTable(model):
+        staging_path = Path(staging_dir).joinpath(f'{model.name}.db')
+        staging_engine = database.sqliteEngine(staging_path)
+        row_count = incremental_backup.refreshTable(workerSession(), staging_engine, model, batch_size)
+        staging_engine.dispose()
+        return model.name, (staging_path, row_count)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(executor.map(dumpTable, models))
+    finally:
+        for session in sessions:
+            session.endSnapshot()
+
+
+def mergeStaging(engine, models, staged):
+    """
+    Replaces the local tables with their staged copies in one transaction
+    engine (sqlalchemy.Engine): engine of the local SQLite cache
+    staged (dict): {table name: (staging file path, row count)} as returned by dumpTables()
+    """
+    with engine.connect() as connection:
+        # SQLite can't ATTACH inside a transaction, so the staging files are attached on the raw connection first
+        dbapi_connection = connection.connection.driver_connection
+        aliases = {}
+        for i, model in enumerate(models):
+            aliases[model.name] = f'staging_{i}'
+            dbapi_connection.execute(f"ATTACH DATABASE ? AS {aliases[model.name]}", (str(staged[model.name][0]),))
+        try:
+            with connection.begin():
+                for model in models:
+                    model.drop(connection, checkfirst=True)
+                    model.create(connection)
+                    connection.exec_driver_sql(f'INSERT INTO "{model.name}" SELECT * FROM {aliases[model.name]}."{model.name}"')
+        finally:
+            for alias in aliases.values():
+                dbapi_connection.execute(f"DETACH DATABASE {alias}")
+
+
+def refreshTables(remote_session, session_factory, snapshot_id, engine, models, workers=4, batch_size=500):
+    """
+    Rewrites the local copies of the given tables and stores their new high-water marks, in parallel when a snapshot can be shared.  Returns {table name: row count}.
+    remote_session (database.DatabaseSession): the main session, which holds the snapshot open while the workers read
+    """
+    if snapshot_id and workers>1:
+        with tempfile.TemporaryDirectory(dir=Path(__file__).parent) as staging_dir:
+            staged = dumpTables(session_factory, snapshot_id, models, staging_dir, workers, batch_size)
+            mergeStaging(engine, models, staged)
+        row_counts = {name:row_count for name, (staging_path, row_count) in staged.items()}
+    else:
+        row_counts = {model.name:incremental_backup.refreshTable(remote_session, engine, model, batch_size) for model in models}
+
+    remote_states = remote_session.readTableChecksums(models)
+    for model in models:
+        incremental_backup.writeState(engine, model.name, remote_states[model.name])
+    return row_counts
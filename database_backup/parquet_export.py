@@ -0,0 +1,64 @@
+"""
+Exports the local cache as one zstd compressed <table name>.parquet file per table in local_guitar_data_parquet.  DB_WRITE.py runs this after the backup when given --parquet.
+
+The apps read these files with DatabaseSession(cache_format='parquet').
+"""
+# Core
+import os
+from pathlib import Path
+
+# Data Integration
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy.types import Integer, Date, Boolean
+
+row_group_size = 50000 # rows per Parquet row group.  Date range reads skip whole row groups, so smaller groups skip more but compress a little worse.
+
+
+def arrowSchema(model):
+    """
+    Builds the pyarrow schema of a table from its orm model, every field nullable
+    """
+    fields = []
+    for column in model.columns:
+        if isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, Date):
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def exportTable(session, model, out_dir, batch_size=500):
+    """
+    Writes one table to out_dir/<table name>.parquet, streamed in batches of batch_size rows and swapped in once complete.  Returns the number of rows written.
+    session (database.DatabaseSession): connected session to export from, normally the local SQLite cache
+    """
+    schema = arrowSchema(model)
+    out_path = Path(out_dir).joinpath(f'{model.name}.parquet')
+    tmp_path = out_path.with_suffix('.parquet.tmp')
+    row_count = 0
+    try:
+        with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+            for df_batch in session.readTableChunks(model, batch_size):
+                writer.write_table(pa.Table.from_pandas(df_batch, schema=schema, preserve_index=False), row_group_size=row_group_size)
+                row_count+=len(df_batch)
+            if row_count==0:
+                writer.write_table(schema.empty_table())
+        os.replace(tmp_path, out_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return row_count
+
+
+def exportTables(session, models, out_dir, batch_size=500):
+    """
+    Exports every table in models to out_dir, creating the directory if needed.  Returns {table name: row count}.
+    """
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    return {model.name:exportTable(session, model, out_dir, batch_size) for model in models}
@@ -101,7 +101,7 @@ def server(input, output, session):
 
     module_sessions_tab.sessions_server("sessions_tab")
     module_career_tab.career_server("career_tab")
-    module_goals_tab.goals_server("goals_tab", browser_res)
+    module_goals_tab.goals_server("goals_tab", browser_res, input.main_nav_bar)
     module_arsenal_tab.arsenal_server("arsenal_tab")
     module_about_tab.about_server("about_tab")
 
@@ -15,6 +15,31 @@ def arrangement_concatenator(composer, arranger, title):
         ret_val = f'{composer_last_name}/{arranger_last_name}: {title}'
     return ret_val
 
+def resolveSongData(song_model, artist_model, style_model):
+    """
+    Resolves the composer and style lookups on the song table.  Returns one row per song.
+    """
+    df_raw_song = song_model.df_raw
+    df_raw_artist = artist_model.df_raw
+    df_raw_style = style_model.df_raw
+
+    df_raw_song = df_raw_song.astype({'style_id':'Int64', 'composer_id':'Int64'}) # Allows us to join on null ints since these columns are nullable
+    df_resolved_song = df_raw_song.merge(df_raw_artist, how='left', left_on='composer_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id','name':'composer'},axis=1)
+    df_resolved_song = df_resolved_song.merge(df_raw_style, how='left', left_on='style_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
+    return df_resolved_song
+
+def resolveArrangementData(arrangement_model, df_resolved_song, artist_model):
+    """
+    Resolves the arranger and song lookups on the arrangement table.  Returns one row per arrangement.  This is shared by the sessions, grindage and song goals datasets.
+    """
+    df_raw_arrangement = arrangement_model.df_raw
+    df_raw_artist = artist_model.df_raw
+
+    df_raw_arrangement = df_raw_arrangement.astype({'arranger':'Int64'}) # Allows us to join on null ints since this column is nullable
+    df_resolved_arrangement = df_raw_arrangement.merge(df_raw_artist, how='left', left_on='arranger', right_on='id').drop(['arranger','id_y'],axis=1).rename({'id_x':'id','name':'Arranger'},axis=1)
+    df_resolved_arrangement = df_resolved_arrangement.merge(df_resolved_song, how='left',left_on='song_id',right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
+    return df_resolved_arrangement
+
 def processArsenalData(session_model, guitar_model, string_set_model):
     df_guitar_raw = guitar_model.df_raw
     df_string_raw = string_set_model.df_raw
@@ -29,7 +54,7 @@ def processArsenalData(session_model, guitar_model, string_set_model):
             #install_date = None
             hrs_on_strings= 0
             
-        days_on_strings=(datetime.date.today()-install_date).days
+        days_on_strings=(pd.Timestamp(datetime.date.today())-install_date).days
         string_health = 1-max((hrs_on_strings/60),(days_on_strings/112))
         decay_slope = (string_health-1)/(days_on_strings-0)
         expected_string_expiration_duration = int(-1/decay_slope)-days_on_strings
@@ -54,7 +79,7 @@ def processArsenalData(session_model, guitar_model, string_set_model):
     
     return df_guitar_string_raw
 
-def processData(session_data, arrangement_data, song_data, artist_data, style_data):
+def processData(session_data, df_resolved_arrangement):
 
     def get_week_number(date):
         # Set the first day of the week to Sunday
@@ -73,34 +98,23 @@ def processData(session_data, arrangement_data, song_data, artist_data, style_da
     today = datetime.datetime.now(pytz.timezone('US/Eastern')).date()
 
     df_raw_session = session_data.df_raw
-    df_raw_arrangement = arrangement_data.df_raw
-    df_raw_artist = artist_data.df_raw
-    df_raw_style = style_data.df_raw
-    df_raw_song = song_data.df_raw
-
-    df_raw_song['style_id'] = df_raw_song['style_id'].astype("Int64") # Allows us to join on null ints since this column is nullable
-    df_raw_song['composer_id'] = df_raw_song['composer_id'].astype("Int64") # Allows us to join on null ints since this column is nullable
-    df_raw_arrangement['arranger'] = df_raw_arrangement['arranger'].astype("Int64") # Allows us to join on null ints since this column is nullable
 
-    df_resolved_song = df_raw_song.merge(df_raw_artist, how='left', left_on='composer_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id','name':'composer'},axis=1)
-    df_resolved_song = df_resolved_song.merge(df_raw_style, how='left', left_on='style_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
-
-    df_raw_artist['last_name']=df_raw_artist['name'].str.split(' ').str[-1] # name is spelled "first last"
-        
-    df_resolved_arrangement = df_raw_arrangement.merge(df_raw_artist, how='left', left_on='arranger', right_on='id').drop(['arranger','id_y','last_name'],axis=1).rename({'id_x':'id','name':'Arranger'},axis=1)
-    df_resolved_arrangement = df_resolved_arrangement.merge(df_resolved_song, how='left',left_on='song_id',right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
-    #df_resolved_arrangement = df_resolved_arrangement.merge(df_raw_artist, how='left', left_on='composer', right_on='id').drop(['composer','id_y'],axis=1).rename({'id_x':'id','name':'Composer'},axis=1)
-    #df_resolved_arrangement = df_resolved_arrangement.merge(df_raw_style, how='left', left_on='style_id', right_on='id').drop(['style_id','id_y'], axis=1).rename({'id_x':'id', 'style':'Style'},axis=1)
-    df_resolved_arrangement['Start Date'] = pd.to_datetime(df_resolved_arrangement['start_date']).dt.strftime("%m/%d/%Y")
-    df_resolved_arrangement['Off Book Date'] = pd.to_datetime(df_resolved_arrangement['off_book_date']).dt.strftime("%m/%d/%Y")
-    df_resolved_arrangement['Play Ready Date'] = pd.to_datetime(df_resolved_arrangement['play_ready_date']).dt.strftime("%m/%d/%Y")
+    # df_resolved_arrangement is shared with the other stages, so new columns go on a new frame (assign) rather than into it
+    df_resolved_arrangement = df_resolved_arrangement.assign(**{
+        'Start Date':pd.to_datetime(df_resolved_arrangement['start_date']).dt.strftime("%m/%d/%Y"),
+        'Off Book Date':pd.to_datetime(df_resolved_arrangement['off_book_date']).dt.strftime("%m/%d/%Y"),
+        'Play Ready Date':pd.to_datetime(df_resolved_arrangement['play_ready_date']).dt.strftime("%m/%d/%Y")})
     df_resolved_arrangement = df_resolved_arrangement.rename({'title':'Title'},axis=1)
     df_resolved_sessions = df_raw_session.merge(df_resolved_arrangement,how='left', left_on='l_arrangement_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
     
     # Establish empty records for every day in the past 365 days to serve as a scaffold for the heatmap table - in the event that all data is filtered out, the structure will be retained
     df_zeros = pd.DataFrame({'session_date':pd.date_range(today-pd.DateOffset(days=365),today),'duration':np.zeros(len(pd.date_range(today-pd.DateOffset(days=365),today)))})
     df_resolved_sessions['session_date'] = pd.to_datetime(df_resolved_sessions['session_date'])
-    df_resolved_sessions = pd.concat([df_resolved_sessions,df_zeros]).reset_index()
+    if df_resolved_sessions.empty:
+        df_resolved_sessions = df_zeros.reindex(columns=df_resolved_sessions.columns) # no sessions in the window that was read, so the scaffold is all there is
+    else:
+        df_resolved_sessions = pd.concat([df_resolved_sessions,df_zeros])
+    df_resolved_sessions = df_resolved_sessions.reset_index()
     df_resolved_sessions['Session Date'] = pd.to_datetime(df_resolved_sessions['session_date']).dt.strftime("%m/%d/%Y")
     df_resolved_sessions = df_resolved_sessions.rename({'style':'Style','composer':'Composer','duration':'Duration','notes':'Notes','Title':'Song','stage':'Stage','video_url':'Video URL','song_type':'Song Type'},axis=1)
     
@@ -134,28 +148,12 @@ def processData(session_data, arrangement_data, song_data, artist_data, style_da
     df_summary=df_summary[df_summary['id'].notna()] #for the cumulative data since inception
     return df_summary, df_365
 
-def processArrangementGrindageData(session_model, arrangement_model, song_model, artist_model, style_model):
-    #df_arrangements = arrangement_model.df_raw
-    #df_sessions = df_sessions[df_sessions['Song Type']=='Song']
-
-    #df_sessions_expanded = df_sessions.merge(df_arrangements[['id','start_date','off_book_date','at_tempo_date','play_ready_date']], how='left', left_on='l_arrangement_id', right_on='id').drop('id_y',axis=1).rename({'id_x':'id'},axis=1)
+def processArrangementGrindageData(session_model, df_resolved_arrangement):
     df_raw_session = session_model.df_raw
-    df_raw_arrangement = arrangement_model.df_raw
-    df_raw_song = song_model.df_raw
-    df_raw_artist = artist_model.df_raw
-    df_raw_style = style_model.df_raw
-    df_raw_song['style_id'] = df_raw_song['style_id'].astype("Int64") # Allows us to join on null ints since this column is nullable
-    df_raw_song['composer_id'] = df_raw_song['composer_id'].astype("Int64") # Allows us to join on null ints since this column is nullable
-    
-    df_resolved_song = df_raw_song.merge(df_raw_artist, how='left', left_on='composer_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id','name':'composer'},axis=1)
-    df_resolved_song = df_resolved_song.merge(df_raw_style, how='left', left_on='style_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
-
-    df_resolved_arrangement = df_raw_arrangement.merge(df_raw_artist, how='left', left_on='arranger', right_on='id').drop(['arranger','id_y','last_name'],axis=1).rename({'id_x':'id','name':'Arranger'},axis=1)
-    df_resolved_arrangement = df_resolved_arrangement.merge(df_resolved_song, how='left',left_on='song_id',right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
     
-    df_grindage = df_raw_session.groupby(['l_arrangement_id','stage'])[['duration']].sum().reset_index()
+    df_grindage = df_raw_session.groupby(['l_arrangement_id','stage'], observed=True)[['duration']].sum().reset_index()
     df_grindage = df_grindage.merge(df_resolved_arrangement, how='left',left_on='l_arrangement_id',right_on='id')
-    today = datetime.datetime.now(pytz.timezone('US/Eastern')).date()
+    today = pd.Timestamp(datetime.datetime.now(pytz.timezone('US/Eastern')).date())
     df_grindage['today']= today
     def getStageStartDates(row):
         date_ref = {
@@ -184,30 +182,16 @@ def processArrangementGrindageData(session_model, arrangement_model, song_model,
     df_grindage = df_grindage[['Stage','Duration','id','Title','Composer','Arranger','Song Type','Start Date','End Date', 'Full Title']]
     return df_grindage
 
-def processSongGoalsData(arrangement_model, arrangement_goal_model, song_model, artist_model, style_model):
+def processSongGoalsData(arrangement_goal_model, df_resolved_arrangement):
     df_raw_arrangement_goals = arrangement_goal_model.df_raw
-    df_raw_arrangement = arrangement_model.df_raw    
-    df_raw_song = song_model.df_raw
-    df_raw_artist = artist_model.df_raw
-    df_raw_style = style_model.df_raw
-    
-    df_raw_song['style_id'] = df_raw_song['style_id'].astype("Int64") # Allows us to join on null ints since this column is nullable
-    df_raw_song['composer_id'] = df_raw_song['composer_id'].astype("Int64") # Allows us to join on null ints since this column is nullable
-    df_raw_arrangement['arranger'] = df_raw_arrangement['arranger'].astype("Int64") # Allows us to join on null ints since this column is nullable
-        
-    df_resolved_song = df_raw_song.merge(df_raw_artist, how='left', left_on='composer_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id','name':'composer'},axis=1)
-    df_resolved_song = df_resolved_song.merge(df_raw_style, how='left', left_on='style_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
-    
-    df_resolved_arrangement = df_raw_arrangement.merge(df_raw_artist, how='left', left_on='arranger', right_on='id').drop(['arranger','id_y','last_name'],axis=1).rename({'id_x':'id','name':'Arranger'},axis=1)
-    df_resolved_arrangement = df_resolved_arrangement.merge(df_resolved_song, how='left', left_on='song_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)
     
     df_resolved_arrangement_goals = df_raw_arrangement_goals.merge(df_resolved_arrangement, how='inner', left_on='arrangement_id', right_on='id').drop(['id_y'],axis=1).rename({'id_x':'id'},axis=1)    
-    df_resolved_arrangement_goals = df_resolved_arrangement_goals[df_resolved_arrangement_goals['song_type']=='Song'].copy()
+    df_resolved_arrangement_goals = df_resolved_arrangement_goals[df_resolved_arrangement_goals['song_type']=='Song']
     df_resolved_arrangement_goals = df_resolved_arrangement_goals.rename({'discovery_date':'Discovery Date','description':'Description','difficulty':'Difficulty','sheet_music_link':'Sheet Music Link', 'performance_link':'Performance Link','title':'Title','song_type':'Song Type','composer':'Composer','style':'Style'},axis=1)
     df_resolved_arrangement_goals = df_resolved_arrangement_goals[['id','song_id','Discovery Date','Description','Difficulty','Sheet Music Link','Performance Link','Arranger','Title','Song Type','Composer','Style']]
     df_resolved_arrangement_goals['id'] = df_resolved_arrangement_goals['id'].astype(str)
     df_resolved_arrangement_goals['song_id'] = df_resolved_arrangement_goals['song_id'].astype(str)
         
-    return df_resolved_arrangement_goals.copy()
+    return df_resolved_arrangement_goals
 
 
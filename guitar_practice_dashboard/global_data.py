@@ -1,25 +1,125 @@
 # Core
 from dotenv import load_dotenv
 import os
+import datetime
+import pytz
+import pandas as pd
 from pathlib import Path
 
 # App Specific Code
 import orm # database models
 from database import DatabaseSession, DatabaseModel
 import data_prep
+from shared_data import SharedDataStore
 
 cwd = Path(__file__).parent
 env_path = cwd.joinpath('variables.env')
 
+# Datasets served to the tab modules through the GlobalData get_df_* accessors (and published to shared_data_dir)
+published_datasets = ['df_sessions', 'df_sessions_recent', 'df_365', 'df_arrangement_grindage', 'df_arsenal', 'df_song_goals']
+
+hot_window_days = 366 # days of practice sessions read up front for the sessions tab (one more than the 365 day heatmap so the window edge never clips it)
+
+def hot_window_start():
+    return datetime.datetime.now(pytz.timezone('US/Eastern')).date()-datetime.timedelta(days=hot_window_days)
+
+class DataPipeline:
+    """
+    This class builds the dashboard datasets on demand.  Each stage declares the tables and datasets it needs, and results are memoized.
+    """
+    # Orm tables by the name stages use to refer to them
+    _tables = {
+        'artist':orm.tbl_artist,
+        'style':orm.tbl_style,
+        'song':orm.tbl_song,
+        'arrangement':orm.tbl_arrangement,
+        'practice_session':orm.tbl_practice_session,
+        'guitar':orm.tbl_guitar,
+        'arrangement_goals':orm.tbl_arrangement_goals,
+        'string_set':orm.tbl_string_set,
+    }
+
+    # Narrowed reads of a table that are pushed down to the database: (table name, function returning the DatabaseModel read arguments)
+    _table_views = {
+        'practice_session_recent':('practice_session', lambda: {
+            'columns':['id', 'session_date', 'duration', 'l_arrangement_id', 'notes', 'video_url', 'stage'],
+            'date_range':('session_date', hot_window_start(), None)}),
+        'practice_session_usage':('practice_session', lambda: {
+            'columns':['session_date', 'guitar_id', 'duration']}), # all of history, but without the notes text
+    }
+
+    # (datasets produced, function that produces them, tables/datasets passed to the function in order).  A None output is discarded.
+    _stages = [
+        (('df_resolved_song',), data_prep.resolveSongData, ('song', 'artist', 'style')),
+        (('df_resolved_arrangement',), data_prep.resolveArrangementData, ('arrangement', 'df_resolved_song', 'artist')),
+        (('df_sessions_recent', 'df_365'), data_prep.processData, ('practice_session_recent', 'df_resolved_arrangement')),
+        (('df_sessions', None), data_prep.processData, ('practice_session', 'df_resolved_arrangement')), # full history for the career tab.  Its df_365 matches the one built from the hot window.
+        (('df_arrangement_grindage',), data_prep.processArrangementGrindageData, ('practice_session', 'df_resolved_arrangement')),
+        (('df_song_goals',), data_prep.processSongGoalsData, ('arrangement_goals', 'df_resolved_arrangement')),
+        (('df_arsenal',), data_prep.processArsenalData, ('practice_session_usage', 'guitar', 'string_set')),
+    ]
+
+    def __init__(self):
+        # Establish database session minus credentials
+        self.__pg_session = DatabaseSession(
+            os.getenv("pg_host"),
+            os.getenv("pg_port"),
+            os.getenv("pg_dbname"),
+            compact_dtypes=True,
+            cache_format=os.getenv("local_cache_format", "sqlite") # 'parquet' reads the Parquet cache written by DB_WRITE.py --parquet
+            )
+        self.__models = {} # table name: connected DatabaseModel
+        self.__datasets = {} # dataset name: pd.DataFrame
+
+    def get_model(self, table_name:str):
+        """
+        Returns the DatabaseModel for table_name, reading the table the first time it is asked for
+        """
+        if table_name not in self.__models:
+            if table_name in self._table_views:
+                source_table, read_args = self._table_views[table_name]
+                model = DatabaseModel(self._tables[source_table], self.__pg_session, **read_args())
+            else:
+                model = DatabaseModel(self._tables[table_name], self.__pg_session)
+            model.connect(os.getenv('pg_user'), os.getenv('pg_pw'), True)
+            self.__models[table_name] = model
+        return self.__models[table_name]
+
+    def get(self, name:str):
+        """
+        Returns a table's DatabaseModel or a dataset, building it the first time it is asked for
+        """
+        if name in self._tables or name in self._table_views:
+            return self.get_model(name)
+        if name not in self.__datasets:
+            outputs, func, inputs = next(stage for stage in self._stages if name in stage[0])
+            result = func(*[self.get(input_name) for input_name in inputs])
+            if len(outputs)==1:
+                result = (result,)
+            self.__datasets.update((output, df) for output, df in zip(outputs, result) if output)
+        return self.__datasets[name]
+
+
+def build_frames():
+    """
+    Runs the whole data prep pipeline and returns {dataset name: pd.DataFrame} for every dataset that GlobalData serves
+    """
+    pipeline = DataPipeline()
+    return {name:pipeline.get(name) for name in published_datasets}
+
+
 class GlobalData:
     """
     This is a singleton class intended to keep track of global non-reactive data that will be used by all the modules.
+
+    Datasets are built the first time they are asked for.  If the shared_data_dir environment variable is set, they are published there once and memory mapped by every worker process (see shared_data.py).  Workers map the whole published set at once when GlobalData is created, before the app serves.
     """
     # used for singleton pattern
     _instance=None
-    _df_sessions=None # General sessions data to understand time spent playing arrangements
-    _df_365=None # Dataset used to build the waffle chart on the main page
-    _df_arrangement_grindage=None # Dataset that is used to build 
+    _pipeline=None # Builds datasets on first access when the shared data store is not in use
+    _store=None # SharedDataStore when running with shared_data_dir
+    _datasets={} # dataset name: pd.DataFrame served by the get_df_* accessors
+    _notes_session=None # DatabaseSession the notes search runs on (see search_session_notes())
 
     _legend_id=0 # Used add as suffix to CSS class names for custom chart legends that are disconnected entirely from their plotly figures
 
@@ -28,41 +128,15 @@ class GlobalData:
             cls._instance = super(GlobalData, cls).__new__(cls)
             load_dotenv(env_path)
 
-            # Establish database session minus credentials
-            pg_session = DatabaseSession(
-                os.getenv("pg_host"),
-                os.getenv("pg_port"),
-                os.getenv("pg_dbname")
-                )
-
             print(id(cls))
 
-            # Create object relational mappings for the three database tables
-            artist_model = DatabaseModel(orm.tbl_artist, pg_session)
-            style_model = DatabaseModel(orm.tbl_style, pg_session)
-            song_model = DatabaseModel(orm.tbl_song, pg_session)
-            arrangement_model = DatabaseModel(orm.tbl_arrangement, pg_session)
-            session_model = DatabaseModel(orm.tbl_practice_session, pg_session)
-            guitar_model = DatabaseModel(orm.tbl_guitar, pg_session)
-            arrangement_goal_model = DatabaseModel(orm.tbl_arrangement_goals, pg_session)
-            string_set_model = DatabaseModel(orm.tbl_string_set, pg_session)
-
-            user_name = os.getenv('pg_user')
-            pw = os.getenv('pg_pw')
-
-            artist_model.connect(user_name, pw, True)
-            style_model.connect(user_name, pw, True)
-            arrangement_model.connect(user_name, pw, True)
-            song_model.connect(user_name, pw, True)
-            session_model.connect(user_name, pw, True)
-            guitar_model.connect(user_name, pw, True)
-            arrangement_goal_model.connect(user_name, pw, True)
-            string_set_model.connect(user_name, pw, True)
-
-            cls._df_arsenal = data_prep.processArsenalData(session_model, guitar_model, string_set_model)
-            cls._df_sessions, cls._df_365 = data_prep.processData(session_model, arrangement_model, song_model, artist_model, style_model)
-            cls._df_arrangement_grindage = data_prep.processArrangementGrindageData(session_model, arrangement_model, song_model, artist_model,style_model)
-            cls._df_song_goals = data_prep.processSongGoalsData(arrangement_model, arrangement_goal_model, song_model, artist_model, style_model)
+            shared_data_dir = os.getenv('shared_data_dir')
+            if shared_data_dir:
+                # Multi-worker mode: one worker builds and publishes, the rest memory map
+                cls._store = SharedDataStore(shared_data_dir, int(os.getenv('shared_data_max_age', 3600)))
+                cls._datasets = cls._store.loadOrBuild(build_frames)
+            else:
+                cls._pipeline = DataPipeline()
 
         return cls._instance
 
@@ -71,20 +145,42 @@ class GlobalData:
         # pull database location and credential information from env variables
         print('Global Data Store Called')
 
+    def _get_dataset(self, name):
+        if name not in self._datasets:
+            self._datasets[name] = self._pipeline.get(name) # the shared store's frames were all mapped up front
+        return self._datasets[name]
+
     def get_df_sessions(self):
-        return self._df_sessions
+        return self._get_dataset('df_sessions')
+
+    def get_df_sessions_recent(self):
+        """
+        Sessions from the last hot_window_days days only
+        """
+        return self._get_dataset('df_sessions_recent')
     
     def get_df_365(self):
-        return self._df_365
+        return self._get_dataset('df_365')
     
     def get_df_arrangement_grindage(self):
-        return self._df_arrangement_grindage
+        return self._get_dataset('df_arrangement_grindage')
     
     def get_df_arsenal(self):
-        return self._df_arsenal
+        return self._get_dataset('df_arsenal')
     
     def get_df_song_goals(self):
-        return self._df_song_goals
+        return self._get_dataset('df_song_goals')
+
+    def search_session_notes(self, query:str, limit:int=100):
+        """
+        Returns the rows of df_sessions whose notes match query, best match first, searched on the database even when the datasets come from the Parquet cache
+        """
+        if self._notes_session is None:
+            notes_session = DatabaseSession(os.getenv("pg_host"), os.getenv("pg_port"), os.getenv("pg_dbname"))
+            notes_session.connect(os.getenv('pg_user'), os.getenv('pg_pw'))
+            GlobalData._notes_session = notes_session
+        session_ids = self._notes_session.searchNotes(query, limit)
+        return pd.DataFrame({'id':session_ids}).merge(self.get_df_sessions(), how='inner', on='id') # sessions newer than df_sessions are left out
 
     def increment_legend_id(self):
         """Call this before adding a new legend object"""
@@ -0,0 +1,37 @@
+"""
+Measures the memory used to build the dashboard datasets with pandas Copy-on-Write switched on and off, each in a fresh python process:
+
+    python memory_benchmark.py
+"""
+# Core
+import sys
+import subprocess
+import tracemalloc
+
+
+def measure(copy_on_write:bool):
+    """
+    Builds every dashboard dataset under tracemalloc and returns (size of the datasets, memory held after the build, peak memory) in bytes
+    """
+    import pandas as pd
+    import global_data # database.py switches Copy-on-Write on at import, so the mode is set after the app modules are imported
+    pd.set_option("mode.copy_on_write", copy_on_write)
+
+    tracemalloc.start()
+    frames = global_data.build_frames()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    data_size = sum(df.memory_usage(deep=True).sum() for df in frames.values())
+    return data_size, current, peak
+
+
+if __name__ == '__main__':
+    if len(sys.argv)>1:
+        # Child process: measure one mode and hand the numbers back on stdout
+        print(*measure(sys.argv[1]=='on'))
+    else:
+        print(f"{'Copy-on-Write':<15}{'Data (MB)':>12}{'Held (MB)':>12}{'Peak (MB)':>12}{'Peak/Data':>12}")
+        for mode in ['off', 'on']:
+            result = subprocess.run([sys.executable, __file__, mode], capture_output=True, text=True, check=True)
+            data_size, current, peak = [int(value) for value in result.stdout.split('\n')[-2].split()]
+            print(f"{mode:<15}{data_size/2**20:>12.2f}{current/2**20:>12.2f}{peak/2**20:>12.2f}{peak/data_size:>12.1f}")
@@ -13,7 +13,6 @@ import logger
 # App Specific Code
 import global_data
 globals = global_data.GlobalData()
-df_arsenal = globals._df_arsenal
 
 Logger = logger.FunctionLogger
 
@@ -78,7 +77,7 @@ def guitar_server(input, output, session,guitar_id):
     """
     Module to handle logic for each guitar card
     """
-    this_row = df_arsenal.loc[guitar_id]
+    this_row = globals.get_df_arsenal().loc[guitar_id]
 
     @render.image
     def guitar_image():
@@ -101,7 +100,7 @@ def guitar_server(input, output, session,guitar_id):
     @render.ui
     def tooltip_status():
         status=None
-        if this_row['date_retired']:
+        if pd.notna(this_row['date_retired']):
             status="Retired"
         else:
             status="Active"
@@ -110,7 +109,7 @@ def guitar_server(input, output, session,guitar_id):
     @render.ui
     def tooltip_dates_used():
         start_date=this_row['date_added'].strftime("%m-%d-%Y")
-        if this_row['date_retired']:
+        if pd.notna(this_row['date_retired']):
             end_date=this_row['date_retired'].strftime("%m-%d-%Y")
         else:
             end_date="Present"
@@ -163,11 +162,7 @@ def guitar_server(input, output, session,guitar_id):
 @module.ui
 def arsenal_ui():
     ret_val = ui.nav_panel("Acoustic Arsenal",
-        ui.div(
-            [guitar_ui(str(row))for row in df_arsenal.index],
-            #ui.card(ui.output_image(id="no_guitar_image").add_class('guitar-card-image')).add_class('guitar-card'),
-            id="arsenal_placeholder",
-        ).add_class('flex-horizontal').add_style('flex-wrap:wrap; justify-content:center;'),
+        ui.output_ui("guitar_cards"), # rendered by the server, so building the UI doesn't load the arsenal data
 
     ),
     return ret_val
@@ -177,8 +172,16 @@ def arsenal_ui():
 def arsenal_server(input, output, session):
     Logger(session.ns)
 
-    for row in df_arsenal.index:
-        guitar_server(str(row),row) # pass twice, first time is for namespace, second time is by value
+    @render.ui
+    def guitar_cards():
+        # only drawn once the tab is shown, so the arsenal is only built for sessions that open it
+        for row in globals.get_df_arsenal().index:
+            guitar_server(str(row),row) # pass twice, first time is for namespace, second time is by value
+        return ui.div(
+            [guitar_ui(str(row))for row in globals.get_df_arsenal().index],
+            #ui.card(ui.output_image(id="no_guitar_image").add_class('guitar-card-image')).add_class('guitar-card'),
+            id="arsenal_placeholder",
+        ).add_class('flex-horizontal').add_style('flex-wrap:wrap; justify-content:center;')
     
     @render.image
     def yamaha_cg1():
@@ -19,11 +19,6 @@ globals = global_data.GlobalData()
 Logger = logger.FunctionLogger
 
 
-df_sessions = globals.get_df_sessions()
-df_grindage = globals.get_df_arrangement_grindage()
-df_arrangement_grindage = df_grindage[df_grindage['Song Type']=='Song']
-df_exercise_grindage = df_sessions[df_sessions['Song Type']=='Exercise']
-
 
 def timestamp_to_date(this_timestamp: pd._libs.tslibs.timestamps._Timestamp):
     return date(this_timestamp.year, this_timestamp.month, this_timestamp.day)
@@ -87,28 +82,41 @@ def career_ui():
 @module.server
 def career_server(input, output, session):
     Logger(session.ns)
+    # The whole practice history is only read when one of this tab's outputs is first drawn
+    @reactive.calc
+    def df_sessions():
+        return globals.get_df_sessions()
+
+    @reactive.calc
+    def df_arrangement_grindage():
+        df_grindage = globals.get_df_arrangement_grindage()
+        return df_grindage[df_grindage['Song Type']=='Song']
+
+    @reactive.calc
+    def df_exercise_grindage():
+        return df_sessions()[df_sessions()['Song Type']=='Exercise']
 
     @render.text
     def longest_session():
-        flt_max = (df_sessions.groupby('Session Date')['Duration'].sum()).max()
+        flt_max = (df_sessions().groupby('Session Date')['Duration'].sum()).max()
         minutes = math.floor(flt_max)
         return f"{minutes} Mins"
 
     @render.text
     def avg_practice_time():
-        flt_avg = (df_sessions.groupby('Session Date')['Duration'].sum()).mean()
+        flt_avg = (df_sessions().groupby('Session Date')['Duration'].sum()).mean()
         minutes=math.floor(flt_avg)
         return f"{minutes} Mins"
     
     @render.text
     def total_practice_time():
-        total_minutes = (df_sessions.groupby('Session Date')['Duration'].sum()).sum()
+        total_minutes = (df_sessions().groupby('Session Date')['Duration'].sum()).sum()
         total_hrs = math.floor(total_minutes/60) 
         return f"{total_hrs} Hrs"
     
     @render.text
     def longest_consecutive_streak():
-        ser_dates = df_sessions['session_date'].unique()
+        ser_dates = df_sessions()['session_date'].unique()
         df=pd.DataFrame({'Date':ser_dates})
         df = df.sort_values('Date')
         df['date_diff'] = df['Date'].diff().dt.days
@@ -123,8 +131,8 @@ def career_server(input, output, session):
 
     @render.text
     def career_length_yrs():
-        start_date = df_sessions['session_date'].min()
-        end_date = df_sessions['session_date'].max()
+        start_date = df_sessions()['session_date'].min()
+        end_date = df_sessions()['session_date'].max()
         career_length = end_date - start_date
         career_length_days = career_length.days
         return f"{math.floor((career_length_days/365.25)*10)/10} Yrs"
@@ -200,8 +208,8 @@ def career_server(input, output, session):
 
 
         stage_order = ['Learning Notes','Achieving Tempo','Phrasing','Maintenance']
-        title_order = list(df_arrangement_grindage.groupby('Full Title')['Duration'].sum().sort_values(ascending=True).index)
-        trace_dict = make_stacked_bar_traces(df_arrangement_grindage['Full Title'], df_arrangement_grindage['Stage'],round((df_arrangement_grindage['Duration']/60)*10)/10, dimension_a_unique_sort_order=title_order, dimension_b_unique_sort_order=stage_order)
+        title_order = list(df_arrangement_grindage().groupby('Full Title')['Duration'].sum().sort_values(ascending=True).index)
+        trace_dict = make_stacked_bar_traces(df_arrangement_grindage()['Full Title'], df_arrangement_grindage()['Stage'],round((df_arrangement_grindage()['Duration']/60)*10)/10, dimension_a_unique_sort_order=title_order, dimension_b_unique_sort_order=stage_order)
 
         category_colors={'Learning Notes':['#801100',4],
                          'Achieving Tempo':['#d73502',3],
@@ -320,10 +328,10 @@ def career_server(input, output, session):
     @render_widget
     def exercise_grindage_chart():
 
-        ser_ex_bar_prep = df_exercise_grindage.groupby('Song')['Duration'].sum().sort_values()
+        ser_ex_bar_prep = df_exercise_grindage().groupby('Song')['Duration'].sum().sort_values()
         titles=list(ser_ex_bar_prep.index)
         durations = list(round((ser_ex_bar_prep/60)*10)/10)
-        round((df_arrangement_grindage['Duration']/60)*10)/10
+        round((df_arrangement_grindage()['Duration']/60)*10)/10
 
         fig = go.Figure(go.Bar(
             x=durations, 
@@ -1,5 +1,5 @@
 # Core
-from shiny import ui, module, reactive, render
+from shiny import ui, module, reactive, render, req
 from datetime import date
 import pandas as pd
 
@@ -9,8 +9,10 @@ import logger
 # App Specific Code
 import global_data
 globals = global_data.GlobalData()
-df_goal_arrangements = globals.get_df_song_goals()
-df_goal_songs = df_goal_arrangements.drop_duplicates('song_id', keep='first')[['song_id','Title','Composer','Style']]
+
+def get_goal_songs(df_goal_arrangements):
+    return df_goal_arrangements.drop_duplicates('song_id', keep='first')[['song_id','Title','Composer','Style']]
+
 Logger = logger.FunctionLogger
 
 style_dict = {
@@ -103,6 +105,7 @@ def arrangement_details_card_server(input, output, session, arr_id):
 
     @reactive.calc
     def get_arr_record_from_id():
+        df_goal_arrangements = globals.get_df_song_goals()
         return df_goal_arrangements[df_goal_arrangements['id']==arr_id].iloc[0]
 
     @render.text
@@ -186,6 +189,7 @@ def goal_song_details_server(input, output, session, song_id):
     
     @reactive.calc
     def get_song_record_from_id():
+        df_goal_songs = get_goal_songs(globals.get_df_song_goals())
         return df_goal_songs[df_goal_songs['song_id']==song_id].iloc[0]
 
     @render.text
@@ -226,20 +230,35 @@ def goals_ui():
 
 
 @module.server
-def goals_server(input, output, session, browser_res):
+def goals_server(input, output, session, browser_res, selected_tab):
     Logger(session.ns)
-    
+
     # state info about what is currently selected
     selected_song=reactive.value(None)
+    goals_tab_opened=reactive.value(False)
+
+    @reactive.effect
+    def open_goals_tab():
+        if selected_tab()=='goal-main-tab-panel':
+            goals_tab_opened.set(True)
+
+    @reactive.calc
+    def goal_data():
+        '''
+        Builds the goal datasets and the servers of their cards the first time the tab is opened.  Returns (df_goal_arrangements, df_goal_songs).
+        '''
+        df_goal_arrangements = globals.get_df_song_goals()
+        df_goal_songs = get_goal_songs(df_goal_arrangements)
 
-    #set up server modules for wide-view server cards
-    [goal_song_summary_card_server(id='wide_'+str(song_id), song_id=str(song_id), selected_song_id=selected_song) for song_id in df_goal_arrangements['song_id'].unique()]
+        #set up server modules for wide-view server cards
+        [goal_song_summary_card_server(id='wide_'+str(song_id), song_id=str(song_id), selected_song_id=selected_song) for song_id in df_goal_arrangements['song_id'].unique()]
 
-    #set up server modules for song detail cards
-    [goal_song_details_server(id=song_id, song_id=song_id) for song_id in df_goal_arrangements['song_id'].unique()]
+        #set up server modules for song detail cards
+        [goal_song_details_server(id=song_id, song_id=song_id) for song_id in df_goal_arrangements['song_id'].unique()]
 
-    #set up server modules for arrangement cards for each song (some songs have multiple arrangements)
-    [arrangement_details_card_server(f"song{song_id}_arr{arr_id}_", arr_id) for song_id, arr_id in zip(df_goal_arrangements['song_id'], df_goal_arrangements['id'])]
+        #set up server modules for arrangement cards for each song (some songs have multiple arrangements)
+        [arrangement_details_card_server(f"song{song_id}_arr{arr_id}_", arr_id) for song_id, arr_id in zip(df_goal_arrangements['song_id'], df_goal_arrangements['id'])]
+        return df_goal_arrangements, df_goal_songs
 
 
     @render.text
@@ -251,6 +270,7 @@ def goals_server(input, output, session, browser_res):
         return ret_val
     
     def main_text_side_panel(non_reactive_selected_song):
+        df_goal_arrangements, df_goal_songs = goal_data()
         ret_val = None
         if non_reactive_selected_song:
             style=df_goal_arrangements[df_goal_arrangements['song_id']==non_reactive_selected_song].iloc[0]['Style']
@@ -270,6 +290,7 @@ def goals_server(input, output, session, browser_res):
         return ret_val     
 
     def make_accordion_panels():
+        df_goal_arrangements, df_goal_songs = goal_data()
         ret_val = []
         for song_id in df_goal_songs['song_id']:
             row = df_goal_songs[df_goal_songs['song_id']==song_id].iloc[0]  ##  Needs lots of fixing
@@ -295,8 +316,10 @@ def goals_server(input, output, session, browser_res):
         return ret_val
 
     @reactive.effect
-    @reactive.event(browser_res, selected_song)
+    @reactive.event(browser_res, selected_song, goals_tab_opened)
     def render_body():
+        req(goals_tab_opened())
+        df_goal_arrangements, df_goal_songs = goal_data()
         #print(browser_res())
         if browser_res()[0]>=677:
             ui.remove_ui("#goals_tab-wide-ui-placeholder")
@@ -7,6 +7,7 @@ import pandas as pd
 import math
 import numpy as np
 import datetime
+import asyncio
 import pytz
 
 
@@ -27,9 +28,8 @@ globals = global_data.GlobalData()
 Logger = logger.FunctionLogger
 
 
-df_sessions = globals.get_df_sessions()
-df_365 = globals.get_df_365()
-arrangements = df_365[df_365['Song'].notna()]['Song'].sort_values().unique()
+def get_arrangement_titles(df_365):
+    return df_365[df_365['Song'].notna()]['Song'].sort_values().unique()
 
 def table_calc_has_url(df_in):
     df_grouped_by_date = df_in.groupby('session_date') # grouped by date in order to capture an '*' if ANY recording weas posted that day
@@ -37,35 +37,36 @@ def table_calc_has_url(df_in):
     return pd.Series(ser_has_url, name='has_url')
 
 
-@module.ui
-def sessions_ui():
-
-    def sessions_filter_shelf(df_365):
-        
-        ret_val = ui.div(
-            ui.h3("Filters:"),
-            ui.input_checkbox_group(
-                "arrangement_title",
-                ui.div(
-                    ui.h5("Song Title"),
-                    ui.input_checkbox_group(
-                        "select_all_arrangements",
-                        label=None,
-                        choices={'All':'Select All'},
-                        selected=['All']
-                    ),
+def sessions_filter_shelf(df_365):
+    arrangements = get_arrangement_titles(df_365)
+    ret_val = ui.div(
+        ui.h3("Filters:"),
+        ui.input_checkbox_group(
+            "arrangement_title",
+            ui.div(
+                ui.h5("Song Title"),
+                ui.input_checkbox_group(
+                    "select_all_arrangements",
+                    label=None,
+                    choices={'All':'Select All'},
+                    selected=['All']
                 ),
-                choices={key:value for key,value in zip(arrangements, arrangements)},
-                selected=[key for key in arrangements],
-            ).add_style('margin-bottom: 0;'),
+            ),
+            choices={key:value for key,value in zip(arrangements, arrangements)},
+            selected=[key for key in arrangements],
+        ).add_style('margin-bottom: 0;'),
 
-        )
-        return ret_val
+    )
+    return ret_val
+
+
+@module.ui
+def sessions_ui():
 
     ret_val = ui.nav_panel("Practice Sessions", 
         ui.page_sidebar(
             ui.sidebar(
-                sessions_filter_shelf(df_365),
+                ui.output_ui("filter_shelf"), # rendered by the server, so building the UI doesn't load the sessions data
                 open="closed",
             ),
             ui.card(
@@ -105,6 +106,16 @@ def sessions_ui():
 
                 ).add_class("flex-vertical").add_style("padding-left:6px;"),
             ).add_style("margin-top: 10px;"),    
+
+            ui.card(
+                ui.h3("Search Practice Session Notes"),
+                ui.row(
+                    ui.column(9, ui.input_text("notes_search", None, placeholder="e.g. rest strokes", width="100%")),
+                    ui.column(3, ui.input_action_button("btn_notes_search", "Search", width="100%")),
+                ),
+                ui.div(ui.output_data_frame(id="notesSearchTable").add_class('dashboard-table')).add_style('max-height:300px; overflow-y: auto; display: flex;'),
+                class_="dashboard-card",
+            ).add_style("margin-top: 10px;"),
                 
                         
         ),
@@ -115,9 +126,17 @@ def sessions_ui():
 @module.server
 def sessions_server(input, output, session):
     Logger(session.ns)
+    df_sessions = globals.get_df_sessions_recent() # the notes and heatmap views never reach back more than a year
+    df_365 = globals.get_df_365()
+    arrangements = get_arrangement_titles(df_365)
     df_session_data = reactive.value(df_sessions)
     #select_all = reactive.value('all')
 
+    @output(suspend_when_hidden=False) # the sidebar starts closed, and the charts wait on its filters
+    @render.ui
+    def filter_shelf():
+        return sessions_filter_shelf(df_365)
+
     @reactive.effect
     @reactive.event(input.select_all_arrangements)
     def select_all_checked():
@@ -208,7 +227,7 @@ def sessions_server(input, output, session):
         df_session_notes = df_session_notes.sort_values(['index','session_date'])
         
         df_out = df_session_notes[['id','Song','Session Date','Notes','Duration', 'Video URL']].reset_index()
-        return df_out.copy()
+        return df_out
 
     def add_URL_icon_to_session_table(df_in, namespace_slug=''):
         """
@@ -233,12 +252,11 @@ def sessions_server(input, output, session):
             #print("exiting vid_link_module()")
             return ret_html # return the HTML content for the video link cell
             
-        df_out = df_in
-        if df_out.shape[0]>0:
-            df_out['Video Link'] = df_out.apply(lambda row: vid_link_module(row), axis=1)
+        if df_in.shape[0]>0:
+            df_out = df_in.assign(**{'Video Link':df_in.apply(lambda row: vid_link_module(row), axis=1)})
         else:
-            df_out['Video Link']=None # No practice session data found for the past week
-        return df_out.copy()
+            df_out = df_in.assign(**{'Video Link':None}) # No practice session data found for the past week
+        return df_out
 
     @render.data_frame
     def sessionNotesTable():
@@ -250,6 +268,19 @@ def sessions_server(input, output, session):
 
 
 
+    @render.data_frame
+    @reactive.event(input.btn_notes_search)
+    async def notesSearchTable():
+        """
+        Every practice session whose notes match the search box, across the whole history
+        """
+        Logger(session.ns)
+        req(input.notes_search().strip())
+        globals.get_df_sessions() # built here on the event loop like the other datasets, so the worker thread only runs the query
+        df_out = await asyncio.to_thread(globals.search_session_notes, input.notes_search())
+        df_out = df_out[['Song','Session Date','Notes','Duration']]
+        return render.DataTable(df_out, width="100%", styles=[{'class':'dashboard-table'}])
+
     @reactive.calc
     def heatMapDataTranform():
         Logger(session.ns)
@@ -259,7 +290,7 @@ def sessions_server(input, output, session):
         df_365_filtered = df_365_stage_1()
 
         # This is a table calculation to establish the 'has_url' columns that contains a * if any of the sessions on that date included a youtube recording
-        has_url = table_calc_has_url(df_365_filtered.copy())
+        has_url = table_calc_has_url(df_365_filtered)
         df_365_filtered = pd.concat([df_365_filtered, has_url],axis=1) # adds the has_url column
         
         df_grouped = df_365_filtered[['Weekday_abbr','session_date','month_abbr', 'has_url','week_start_day_num','month_week_start','Year','month_year', 'Duration']].groupby(['Weekday_abbr','Year','month_abbr','month_year','session_date','has_url','week_start_day_num','month_week_start'], as_index=False).sum()
@@ -576,8 +607,8 @@ def sessions_server(input, output, session):
                 df_day_session = sessionNotesTransform(from_date=query_date, num_days=0)
                 #df_day_session = add_URL_icon_to_session_table(df_day_session,"heatmap_on_click")
                 df_day_session = df_day_session[['Song','Session Date','Notes','Duration','Video URL']]
-                df_day.set(df_day_session.copy())
-                video_urls = df_day_session['Video URL'].replace('',None).copy()
+                df_day.set(df_day_session)
+                video_urls = df_day_session['Video URL'].replace('',None)
                 video_urls = video_urls[video_urls.notna()]
   
                 def format_as_iframe(url):
@@ -0,0 +1,26 @@
+"""
+Builds the dashboard datasets once and publishes them to shared_data_dir for the worker processes to memory map.  Run it before starting the workers, and again to refresh the data:
+
+    python publish_data.py
+    uvicorn app:app --workers 4
+"""
+# Core
+from dotenv import load_dotenv
+import os
+from pathlib import Path
+
+# App Specific Code
+import global_data
+from shared_data import SharedDataStore
+
+cwd = Path(__file__).parent
+env_path = cwd.joinpath('variables.env')
+
+load_dotenv(env_path)
+shared_data_dir = os.getenv('shared_data_dir')
+if not shared_data_dir:
+    raise SystemExit("shared_data_dir is not set.  Add it to variables.env or the environment before publishing.")
+
+store = SharedDataStore(shared_data_dir)
+store.publish(global_data.build_frames())
+print(f"Published dashboard datasets to {shared_data_dir}")
@@ -0,0 +1,155 @@
+# Core
+import os
+import json
+import time
+from pathlib import Path
+
+# Data Integration
+import pandas as pd
+import pyarrow as pa
+
+manifest_name = 'manifest.json'
+lock_name = '.publish.lock'
+
+
+def string_dtype(arrow_type):
+    """
+    to_pandas() types_mapper: string columns become pd.ArrowDtype columns backed by the mapped buffers instead of being copied into python str objects.  Other types convert as usual.
+    """
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+class SharedDataStore:
+    """
+    This class publishes the processed GlobalData frames as Arrow IPC files in a shared directory, so several dashboard worker processes can memory map one copy of the data.  One process calls publish() and the others call load().
+    """
+    __store_dir=None
+    __max_age=None
+
+    def __init__(self, store_dir:str, max_age:int=3600):
+        """
+        store_dir (str): directory that holds the published .arrow files and their manifest, created if it doesn't exist
+        max_age (int): seconds a published set of frames is served before it is rebuilt
+        """
+        self.__store_dir = Path(store_dir)
+        self.__max_age = max_age
+        self.__store_dir.mkdir(parents=True, exist_ok=True)
+
+    def __manifest_path(self):
+        return self.__store_dir.joinpath(manifest_name)
+
+    def __read_manifest(self):
+        try:
+            with open(self.__manifest_path(), 'r') as manifest_file:
+                return json.load(manifest_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def isFresh(self):
+        """
+        Returns True if a complete set of frames has been published within max_age seconds
+        """
+        manifest = self.__read_manifest()
+        if not manifest:
+            return False
+        return (time.time()-manifest['published_at'])<self.__max_age
+
+    def publish(self, frames:dict):
+        """
+        Writes each frame to <name>.arrow and then swaps in a new manifest, keeping the previous generation for workers still reading it
+        frames (dict): {dataset name: pd.DataFrame}
+        """
+        version = str(time.time_ns())
+        file_names = {}
+        for name, df in frames.items():
+            table = pa.Table.from_pandas(df, preserve_index=True)
+            file_name = f'{name}.{version}.arrow'
+            tmp_path = self.__store_dir.joinpath(file_name+'.tmp')
+            with pa.OSFile(str(tmp_path), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, self.__store_dir.joinpath(file_name))
+            file_names[name] = file_name
+
+        previous_manifest = self.__read_manifest()
+        tmp_manifest = self.__store_dir.joinpath(manifest_name+'.tmp')
+        with open(tmp_manifest, 'w') as manifest_file:
+            json.dump({'published_at':time.time(), 'files':file_names}, manifest_file)
+        os.replace(tmp_manifest, self.__manifest_path())
+
+        keep = set(file_names.values()) | set(previous_manifest['files'].values() if previous_manifest else [])
+        for path in self.__store_dir.glob('*.arrow'):
+            if path.name in keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                pass # still mapped by a worker (Windows won't remove a mapped file).  The next publish tries again.
+
+    def load(self, names:list=None):
+        """
+        Memory maps the published frames and returns {dataset name: pd.DataFrame}, or None if nothing has been published yet
+        names (list): dataset names to map, every published frame if omitted
+        """
+        for _ in range(3):
+            manifest = self.__read_manifest()
+            if not manifest:
+                return None
+            frames = {}
+            try:
+                for name, file_name in manifest['files'].items():
+                    if names and name not in names:
+                        continue
+                    source = pa.memory_map(str(self.__store_dir.joinpath(file_name)), 'r')
+                    table = pa.ipc.open_file(source).read_all()
+                    frames[name] = table.to_pandas(split_blocks=True, types_mapper=string_dtype)
+            except FileNotFoundError:
+                continue # removed by publishes since the manifest was read, so read the new one
+            return frames
+        raise FileNotFoundError(f"The frames published to {self.__store_dir} kept being replaced while they were loaded")
+
+    def loadOrBuild(self, build_func, names:list=None, timeout:int=600):
+        """
+        Returns the published frames, building and publishing them first if they are missing or stale.  Only the process holding the lock file builds them.
+        build_func (callable): returns {dataset name: pd.DataFrame}
+        names (list): dataset names to return, every published frame if omitted
+        timeout (int): seconds to wait on another process's build before building locally
+        """
+        if self.isFresh():
+            return self.load(names)
+
+        lock_path = self.__store_dir.joinpath(lock_name)
+        try:
+            lock_fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                lock_age = time.time()-lock_path.stat().st_mtime
+            except FileNotFoundError:
+                return self.loadOrBuild(build_func, names, timeout) # the builder just finished
+            if lock_age>timeout:
+                # Left behind by a builder that was killed.  Clear it and try again.
+                lock_path.unlink(missing_ok=True)
+                return self.loadOrBuild(build_func, names, timeout)
+
+            # Another worker is building the frames.  Wait for it to publish.
+            waited = 0
+            while waited<timeout:
+                time.sleep(0.5)
+                waited+=0.5
+                if self.isFresh():
+                    return self.load(names)
+                if not lock_path.exists():
+                    break # the builder died without publishing
+            print("Shared data was not published in time...  Building data in this worker")
+            frames = build_func()
+            return {name:frames[name] for name in (names or frames)}
+
+        try:
+            frames = build_func()
+            self.publish(frames)
+        finally:
+            os.close(lock_fd)
+            lock_path.unlink(missing_ok=True)
+        return self.load(names)